@@ -1,91 +1,94 @@
-
 import logging
 from collections import deque
 import concurrent.futures
 
-import pymongo
-
 from widukind_common.debug import timeit
 
-from dlstats import constants
 from dlstats.utils import last_error
 
 logger = logging.getLogger(__name__)
 
-from dlstats.fetchers._commons import Series, update_series_list_unit
-
-@timeit("async.concurrent_futures.Series.update_series_list.execute", stats_only=True)
-def bulk_execute(bulk_requests):
-    try:
-        bulk_requests.execute()
-    except pymongo.errors.BulkWriteError as err:
-        logger.critical(str(err.details))
-        raise
+from dlstats.fetchers._commons import (Series,
+                                       series_prepare,
+                                       series_verify,
+                                       update_series_list_unit,
+                                       SERIES_LOOKUP_PROJECTION)
 
 class AsyncSeries(Series):
-    
+    """Thread pool version of :class:`Series`
+
+    The preparation (slug, cleaning, hash) and the diff of each series
+    (update_series_list_unit) run in a ThreadPoolExecutor of
+    fetcher.pool_size workers. Results are collected in submission order
+    so that the documents and archives written are the same as in
+    sequential mode.
+    """
+
+    def _map(self, executor, func, items):
+        """Run func(*item) for each item and return results in order
+
+        The first error is logged, counted and raised before any write.
+        """
+        tasks = [executor.submit(func, *item) for item in items]
+        results = []
+        error = None
+        for future in tasks:
+            try:
+                results.append(future.result())
+            except Exception as err:
+                self.count_errors += 1
+                logger.critical(last_error())
+                if not error:
+                    error = err
+        if error:
+            raise error
+        return results
+
     @timeit("async.concurrent_futures.Series.update_series_list", stats_only=True)
     def update_series_list(self):
-        
-        keys = [s['key'] for s in self.series_list]
-    
-        query = {
-            'provider_name': self.provider_name,
-            'dataset_code': self.dataset_code,
-            'key': {'$in': keys}
-        }
-        projection = {"tags": False}
-    
-        db = self.get_db()
-        cursor = db[constants.COL_SERIES].find(query, projection)
-    
-        old_series = {s['key']:s for s in cursor}
-    
-        bulk_insert = []
-        bulk_update = []
-        
+
+        series_list = list(self.series_list)
+        keys = [s['key'] for s in series_list]
+
+        old_series = self.get_old_series(keys,
+                                         projection=SERIES_LOOKUP_PROJECTION)
+
+        bulk_requests = []
+        bulk_requests_archives = []
+
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.fetcher.pool_size) as executor:
-                
-            tasks = []    
-            for data in self.series_list:
-                tasks.append(executor.submit(update_series_list_unit, 
-                                             data, 
-                                             old_series=old_series, 
-                                             last_update=self.last_update, 
-                                             provider_name=self.provider_name, 
-                                             dataset_code=self.dataset_code))
-            
-            for future in concurrent.futures.as_completed(tasks):
-                try:
-                    result = future.result()
-                    if not result:
-                        continue
-                    
-                    _insert, _update = result
-                    if _insert:
-                        bulk_insert.append(_insert)
-                        self.count_inserts += 1
-                    elif _update:
-                        bulk_update.append(_update)
-                        self.count_updates += 1
-                except Exception as err:
-                    self.count_errors += 1
-                    logger.critical(last_error())
-    
-        result = None        
-        if len(bulk_insert) + len(bulk_update) > 0:
-    
-            bulk_requests = db[constants.COL_SERIES].initialize_unordered_bulk_op()
-            
-            for bulk in bulk_insert:
-                bulk_requests.insert(bulk)
-            
-            for bulk in bulk_update:
-                bulk_requests.find(bulk[0]).update_one(bulk[1])
-                
-            bulk_execute(bulk_requests) 
-            
+
+            last_update_list = self._map(executor, series_prepare,
+                                         [(bson, self.provider_name,
+                                           self.dataset_code,
+                                           self.dataset.last_update) for bson in series_list])
+
+            ids = []
+            for bson in series_list:
+                old = old_series.get(bson["key"])
+                if old and old.get("hash") != bson["hash"]:
+                    ids.append(old["_id"])
+
+            old_docs = self.get_old_documents(ids) if ids else {}
+
+            units = []
+            for bson, last_update_ds in zip(series_list, last_update_list):
+                old = old_series.get(bson["key"])
+                if old and old.get("hash") == bson["hash"]:
+                    series_verify(bson)
+                    continue
+                old_bson = old_docs[old["_id"]] if old else None
+                units.append((bson, old_bson, last_update_ds,
+                              self.dataset.codelists))
+
+            for operation, archive in self._map(executor, update_series_list_unit, units):
+                if operation:
+                    bulk_requests.append(operation)
+                    self.count_operation(operation)
+                if archive:
+                    bulk_requests_archives.append(archive)
+
+        self.bulk_write(bulk_requests, bulk_requests_archives, ordered=False)
+
         self.series_list = deque()
-        return result
-    
-    
+
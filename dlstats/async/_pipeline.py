@@ -0,0 +1,144 @@
+import time
+import logging
+import queue
+import threading
+from collections import deque
+
+from widukind_common.debug import timeit
+
+from dlstats.utils import last_error
+from dlstats.fetchers._commons import Series
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+class PipelineSeries(Series):
+    """Producer/consumer version of :class:`Series`
+
+    The parser stage (data_iterator) runs in the calling thread and fills a
+    bounded queue with batches of bulk_size series. A writer thread drains
+    the queue and runs update_series_list() (old series lookup, diff and
+    bulk write) so that MongoDB round-trips overlap with parsing.
+
+    Stall times:
+
+    - parser_stall: time the parser waits because the queue is full
+    - writer_stall: time the writer waits because the queue is empty
+
+    When the memory ceiling is reached, the current batch is queued and the
+    parser waits until the writer has drained the queue: a flush only frees
+    memory once the queued batches are written.
+    """
+
+    max_queue_size = 4
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parser_stall = 0
+        self.writer_stall = 0
+        self.writer_error = None
+        self._queue = None
+        self._writer = None
+
+    def _writer_run(self):
+        while True:
+            start = time.time()
+            item = self._queue.get()
+            self.writer_stall += time.time() - start
+            try:
+                if item is _END:
+                    return
+                if self.writer_error:
+                    continue
+                batch, partitions = item
+                if len(batch) > 0:
+                    self.series_list = batch
+                    self.update_series_list()
+                self.checkpoint_commit(partitions)
+            except Exception as err:
+                logger.critical(last_error())
+                self.writer_error = err
+            finally:
+                self._queue.task_done()
+
+    def _put_batch(self, batch):
+        item = (batch, self.checkpoint_pending())
+        start = time.time()
+        while True:
+            if self.writer_error:
+                raise self.writer_error
+            try:
+                self._queue.put(item, timeout=1)
+                break
+            except queue.Full:
+                continue
+        self.parser_stall += time.time() - start
+
+    def _drain_queue(self):
+        """Wait for the writer to process all queued batches"""
+        start = time.time()
+        self._queue.join()
+        self.parser_stall += time.time() - start
+        if self.writer_error:
+            raise self.writer_error
+
+    @timeit("async.pipeline.Series.process_series_data")
+    def process_series_data(self):
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._writer = threading.Thread(target=self._writer_run,
+                                        name="writer-%s" % self.dataset_code)
+        self._writer.daemon = True
+        self._writer.start()
+
+        batch = deque()
+
+        try:
+            while True:
+
+                self.fatal_error = False
+                try:
+                    data = next(self.data_iterator)
+
+                    if not self.check_series_data(data):
+                        continue
+
+                    batch.append(data)
+
+                    if self.memory_check(len(batch)):
+                        self._put_batch(batch)
+                        batch = deque()
+                        self._drain_queue()
+                    elif len(batch) >= self.bulk_size:
+                        self._put_batch(batch)
+                        batch = deque()
+
+                except StopIteration:
+                    break
+        finally:
+            try:
+                if not self.fatal_error and not self.writer_error:
+                    self._put_batch(batch)
+            finally:
+                self._queue.put(_END)
+                self._writer.join()
+                self.series_list = deque()
+
+                msg = "pipeline stalls provider[%s] - dataset[%s] - parser[%.3f seconds] - writer[%.3f seconds]"
+                logger.info(msg % (self.provider_name, self.dataset_code,
+                                   self.parser_stall, self.writer_stall))
+
+                self.update_dataset_lists_finalize()
+
+        if self.writer_error:
+            raise self.writer_error
+
+    def get_run_stats(self):
+        return {
+            "pipeline": {
+                "max_queue_size": self.max_queue_size,
+                "parser_stall": round(self.parser_stall, 3),
+                "writer_stall": round(self.writer_stall, 3),
+            }
+        }
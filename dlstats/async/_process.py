@@ -0,0 +1,166 @@
+import os
+import logging
+from collections import deque
+import concurrent.futures
+
+from widukind_common.debug import timeit
+
+from dlstats.utils import last_error, stages, slugify_cache
+
+logger = logging.getLogger(__name__)
+
+from dlstats.fetchers._commons import (Series,
+                                       series_prepare,
+                                       series_verify,
+                                       update_series_list_unit,
+                                       SERIES_LOOKUP_PROJECTION)
+
+def prepare_batch(series_list, old_series, provider_name, dataset_code,
+                  last_update=None, codelists=None):
+    """Prepare a batch of series in a worker process
+
+    :param list series_list: Raw series dicts
+    :param dict old_series: {key: {_id, version, hash}} of stored series
+
+    Return list of (operation, bson, last_update_ds):
+
+    - new series: (InsertOne, None, None)
+    - same hash: (None, None, None)
+    - different hash: (None, bson, last_update_ds) - the full stored
+      document is needed for the diff (see diff_batch)
+    """
+    results = []
+    for bson in series_list:
+        last_update_ds = series_prepare(bson, provider_name, dataset_code,
+                                        last_update=last_update)
+        old = old_series.get(bson["key"])
+        if not old:
+            operation, _ = update_series_list_unit(bson,
+                                                   last_update_ds=last_update_ds,
+                                                   codelists=codelists)
+            results.append((operation, None, None))
+        elif old.get("hash") == bson["hash"]:
+            series_verify(bson)
+            results.append((None, None, None))
+        else:
+            results.append((None, bson, last_update_ds))
+    return results
+
+def diff_batch(units, codelists=None):
+    """Return list of (operation, archive_operation) in a worker process
+
+    :param list units: List of (bson, old_bson, last_update_ds)
+    """
+    return [update_series_list_unit(bson,
+                                    old_bson=old_bson,
+                                    last_update_ds=last_update_ds,
+                                    codelists=codelists)
+            for bson, old_bson, last_update_ds in units]
+
+def run_batch(func, batch, *args):
+    """Return (func results, stages timers, slugify cache counters of the batch) 
+    in a worker process"""
+    stages.reset()
+    slugify_cache.reset_stats()
+    return func(batch, *args), stages.snapshot(), slugify_cache.stats()
+
+def split_batches(items, count):
+    size = max(1, -(-len(items) // count))
+    return [items[i:i+size] for i in range(0, len(items), size)]
+
+class ProcessSeries(Series):
+    """Process pool version of :class:`Series`
+
+    Preparation and diff of series are pure Python and hold the GIL. Each
+    bulk of series is split in batches sent to a ProcessPoolExecutor which
+    returns ready-to-write operations. The lookup of old series and the
+    bulk writes stay in the calling process.
+
+    The pool is created for one process_series_data() call with
+    min(fetcher.pool_size, cpu count) workers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_workers = min(self.fetcher.pool_size, os.cpu_count() or 1)
+        self._executor = None
+
+    def process_series_data(self):
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        try:
+            super().process_series_data()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _map(self, func, batches, *args):
+        tasks = [self._executor.submit(run_batch, func, batch, *args) for batch in batches]
+        results = []
+        for future in tasks:
+            try:
+                batch_results, batch_stages, batch_slugify = future.result()
+                results.extend(batch_results)
+                stages.merge(batch_stages)
+                slugify_cache.merge(batch_slugify)
+            except Exception:
+                self.count_errors += 1
+                logger.critical(last_error())
+                raise
+        return results
+
+    @timeit("async.process.Series.update_series_list", stats_only=True)
+    def update_series_list(self):
+
+        series_list = list(self.series_list)
+        keys = [s['key'] for s in series_list]
+
+        old_series = self.get_old_series(keys,
+                                         projection=SERIES_LOOKUP_PROJECTION)
+
+        bulk_requests = []
+        bulk_requests_archives = []
+
+        codelists = self.dataset.codelists
+
+        prepared = self._map(prepare_batch,
+                             split_batches(series_list, self.max_workers),
+                             {k: old_series[k] for k in keys if k in old_series},
+                             self.provider_name,
+                             self.dataset_code,
+                             self.dataset.last_update,
+                             codelists)
+
+        changed_series = []
+        for operation, bson, last_update_ds in prepared:
+            if operation:
+                bulk_requests.append(operation)
+                self.count_operation(operation)
+            elif bson:
+                changed_series.append((bson, last_update_ds))
+
+        if changed_series:
+            ids = [old_series[bson["key"]]["_id"] for bson, _ in changed_series]
+            old_docs = self.get_old_documents(ids)
+            units = [(bson, old_docs[old_series[bson["key"]]["_id"]], last_update_ds)
+                     for bson, last_update_ds in changed_series]
+
+            for operation, archive in self._map(diff_batch,
+                                                split_batches(units, self.max_workers),
+                                                codelists):
+                if operation:
+                    bulk_requests.append(operation)
+                    self.count_operation(operation)
+                if archive:
+                    bulk_requests_archives.append(archive)
+
+        self.bulk_write(bulk_requests, bulk_requests_archives, ordered=False)
+
+        self.series_list = deque()
+
+    def get_run_stats(self):
+        return {
+            "process": {
+                "max_workers": self.max_workers,
+            }
+        }
+
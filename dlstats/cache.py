@@ -1,14 +1,419 @@
 # -*- coding: utf-8 -*-
 
+import os
 import logging
+import pickle
+import sqlite3
+import threading
+import time
 from collections import OrderedDict
+from contextlib import contextmanager
 
 from widukind_common.debug import timeit
 
+from dlstats import constants
+from dlstats.utils import LRUCache
+
 logger = logging.getLogger(__name__)
 
 cache = None
 
+class TwoTierCache(object):
+    """In-process LRU in front of Redis
+
+    - get: from the LRU, then from Redis (the value is kept in the LRU)
+    - set: write-through to the LRU and Redis
+    - get_many: one MGET for the keys not found in the LRU
+    - set_many: one pipeline for all the keys
+    
+    Values are serialized as in werkzeug RedisCache (integers as digits, 
+    other values pickled with a "!" prefix): the keys written by the 
+    previous cache are read, and the values that cannot be decoded are 
+    misses. The entries of the LRU expire with the timeout of Redis and 
+    the LRU is bounded by the count of entries (threshold) and the size 
+    of the serialized values (maxbytes).
+    """
+
+    def __init__(self, client, 
+                 key_prefix='', 
+                 default_timeout=300, 
+                 threshold=20000, 
+                 maxbytes=32 * 1024 * 1024):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.default_timeout = default_timeout
+        self.local = LRUCache(maxsize=threshold, maxbytes=maxbytes)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.remote_hits = 0
+            self.remote_misses = 0
+            self.round_trips = 0
+            self.remote_time = 0.0
+        self.local.reset_stats()
+
+    def stats(self):
+        local = self.local.stats()
+        with self._lock:
+            hits = local["hits"] + self.remote_hits
+            total = local["hits"] + self.remote_hits + self.remote_misses
+            return {
+                "hits": hits,
+                "misses": self.remote_misses,
+                "hit_ratio": round(hits / total, 4) if total else None,
+                "local_hits": local["hits"],
+                "local_hit_ratio": round(local["hits"] / total, 4) if total else None,
+                "remote_hits": self.remote_hits,
+                "evictions": local["evictions"],
+                "local_size": local["size"],
+                "local_bytes": local["bytes"],
+                "round_trips": self.round_trips,
+                "remote_time": round(self.remote_time, 3),
+                "remote_latency_ms": round(self.remote_time * 1000 / self.round_trips, 3) if self.round_trips else None,
+            }
+
+    @contextmanager
+    def _round_trip(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.round_trips += 1
+                self.remote_time += duration
+
+    def _key(self, key):
+        return self.key_prefix + key
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return self.default_timeout
+        return timeout
+
+    def _local_get(self, key):
+        item = self.local.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires and expires < time.time():
+            self.local.delete(key)
+            return None
+        return value
+
+    def _local_set(self, key, value, timeout, size):
+        expires = time.time() + timeout if timeout else None
+        self.local.set(key, (expires, value), size=size)
+
+    def _remote_set(self, client, key, data, timeout):
+        if timeout:
+            client.setex(name=self._key(key), value=data, time=timeout)
+        else:
+            client.set(name=self._key(key), value=data)
+
+    def dump_object(self, value):
+        if type(value) is int:
+            return str(value).encode('ascii')
+        return b'!' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def load_object(self, data):
+        """Return the value or None if data is not decodable"""
+        if data is None:
+            return None
+        try:
+            if data.startswith(b'!'):
+                return pickle.loads(data[1:])
+            return int(data)
+        except Exception:
+            logger.warning("value of redis cache is not decodable")
+            return None
+
+    def _load(self, key, data):
+        value = self.load_object(data)
+        with self._lock:
+            if value is None:
+                self.remote_misses += 1
+            else:
+                self.remote_hits += 1
+        if value is None:
+            return None
+        self._local_set(key, value, self.default_timeout, len(data))
+        return value
+
+    def get(self, key):
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        with self._round_trip():
+            data = self.client.get(self._key(key))
+        return self._load(key, data)
+
+    def get_many(self, *keys):
+        values = [self._local_get(key) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            with self._round_trip():
+                datas = self.client.mget([self._key(keys[i]) for i in missing])
+            for i, data in zip(missing, datas):
+                values[i] = self._load(keys[i], data)
+        return values
+
+    def set(self, key, value, timeout=None):
+        timeout = self._timeout(timeout)
+        data = self.dump_object(value)
+        self._local_set(key, value, timeout, len(data))
+        with self._round_trip():
+            self._remote_set(self.client, key, data, timeout)
+        return True
+
+    def set_many(self, mapping, timeout=None):
+        timeout = self._timeout(timeout)
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            data = self.dump_object(value)
+            self._local_set(key, value, timeout, len(data))
+            self._remote_set(pipe, key, data, timeout)
+        with self._round_trip():
+            pipe.execute()
+        return True
+
+    def add(self, key, value, timeout=None):
+        timeout = self._timeout(timeout)
+        data = self.dump_object(value)
+        pipe = self.client.pipeline()
+        pipe.setnx(name=self._key(key), value=data)
+        if timeout:
+            pipe.expire(name=self._key(key), time=timeout)
+        with self._round_trip():
+            added = pipe.execute()[0]
+        if added:
+            self._local_set(key, value, timeout, len(data))
+        return bool(added)
+
+    def delete(self, key):
+        self.local.delete(key)
+        with self._round_trip():
+            return self.client.delete(self._key(key))
+
+    def delete_many(self, *keys):
+        if not keys:
+            return
+        for key in keys:
+            self.local.delete(key)
+        with self._round_trip():
+            return self.client.delete(*[self._key(key) for key in keys])
+
+    def clear(self):
+        self.local.clear()
+        with self._round_trip():
+            if self.key_prefix:
+                keys = self.client.keys(self.key_prefix + '*')
+                if keys:
+                    self.client.delete(*keys)
+            else:
+                self.client.flushdb()
+        return True
+
+class FileCache(object):
+    """Persistent cache in a sqlite3 database (WAL mode)
+
+    Shared by the processes of a host: each process (and thread) opens its 
+    own connection and the writers wait for the lock (busy timeout).
+    
+    - entries expire with timeout (0: never)
+    - when the sum of the sizes of the pickled values is over maxbytes, 
+      the oldest written entries are removed down to 90% of maxbytes
+    - compact() removes the expired entries and runs VACUUM, it is called 
+      at open if the last compaction is older than compact_interval seconds
+    """
+
+    CHECK_SIZE_INTERVAL = 1000
+
+    def __init__(self, filepath, 
+                 default_timeout=7 * 86400, 
+                 maxbytes=512 * 1024 * 1024,
+                 compact_interval=86400):
+        self.filepath = filepath
+        self.default_timeout = default_timeout
+        self.maxbytes = maxbytes
+        self.compact_interval = compact_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._count_writes = 0
+        self.reset_stats()
+
+        dirpath = os.path.dirname(filepath)
+        if dirpath:
+            os.makedirs(dirpath, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, "
+                     "value BLOB, expires REAL, size INTEGER, created REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL)")
+        
+        row = conn.execute("SELECT value FROM meta WHERE key='compacted'").fetchone()
+        if not row or row[0] < time.time() - self.compact_interval:
+            self.compact()
+
+    def _conn(self):
+        '''One connection by process and thread (not shared after fork)'''
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.filepath, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expired = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_ratio": round(self.hits / total, 4) if total else None,
+                    "evictions": self.evictions,
+                    "expired": self.expired}
+
+    def _count(self, hits=0, misses=0, evictions=0, expired=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+            self.expired += expired
+
+    def _timeout(self, timeout):
+        if timeout is None:
+            return self.default_timeout
+        return timeout
+
+    def _row(self, key, value, timeout, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = now + timeout if timeout else None
+        return (key, sqlite3.Binary(data), expires, len(data), now)
+
+    def _write(self, statements):
+        """Execute [(sql, rows)] in one transaction
+        
+        Return the rowcount of the last statement
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                cursor = conn.executemany(sql, rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+        with self._lock:
+            self._count_writes += len(statements[-1][1])
+            check = self._count_writes >= self.CHECK_SIZE_INTERVAL
+            if check:
+                self._count_writes = 0
+        if check:
+            self.check_size()
+        return cursor.rowcount
+
+    def get(self, key):
+        return self.get_many(key)[0]
+
+    def get_many(self, *keys):
+        if not keys:
+            return []
+        conn = self._conn()
+        now = time.time()
+        found = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            sql = "SELECT key, value, expires FROM cache WHERE key IN (%s)" % ",".join("?" * len(chunk))
+            for key, data, expires in conn.execute(sql, chunk):
+                if expires and expires < now:
+                    self._count(expired=1)
+                    continue
+                found[key] = pickle.loads(data)
+        hits = len([key for key in keys if key in found])
+        self._count(hits=hits, misses=len(keys) - hits)
+        return [found.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        return self.set_many({key: value}, timeout=timeout)
+
+    def set_many(self, mapping, timeout=None):
+        timeout = self._timeout(timeout)
+        now = time.time()
+        rows = [self._row(key, value, timeout, now) for key, value in mapping.items()]
+        self._write([("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)])
+        return True
+
+    def add(self, key, value, timeout=None):
+        '''Set the value only if the key is absent or expired'''
+        timeout = self._timeout(timeout)
+        now = time.time()
+        return self._write([
+            ("DELETE FROM cache WHERE key=? AND expires < ?", [(key, now)]),
+            ("INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)", [self._row(key, value, timeout, now)])
+        ]) == 1
+
+    def delete(self, key):
+        return self.delete_many(key)
+
+    def delete_many(self, *keys):
+        if keys:
+            self._write([("DELETE FROM cache WHERE key=?", [(key,) for key in keys])])
+        return True
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+        return True
+
+    def check_size(self):
+        """Remove the oldest written entries if the size is over maxbytes"""
+        if not self.maxbytes:
+            return 0
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            keys = []
+            if total > self.maxbytes:
+                target = total - int(self.maxbytes * 0.9)
+                for key, size in conn.execute("SELECT key, size FROM cache ORDER BY created"):
+                    keys.append((key,))
+                    target -= size
+                    if target <= 0:
+                        break
+                conn.executemany("DELETE FROM cache WHERE key=?", keys)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if keys:
+            self._count(evictions=len(keys))
+            logger.info("file cache [%s] - size[%s] - removed[%s]" % (self.filepath, total, len(keys)))
+        return len(keys)
+
+    def compact(self):
+        """Remove the expired entries, check the size and VACUUM the database"""
+        conn = self._conn()
+        cursor = conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        self._count(expired=max(cursor.rowcount, 0))
+        self.check_size()
+        conn.execute("VACUUM")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('compacted', ?)", (time.time(),))
+        logger.info("file cache [%s] compacted" % self.filepath)
+
 class Cache(object):
 
     DEFAULT_KEY_PREFIX = 'dlstats'
@@ -17,7 +422,8 @@ class Cache(object):
                  cache_url='simple', 
                  cache_timeout=7200, #2H
                  cache_threshold=20000,
-                 cache_prefix=None):
+                 cache_prefix=None,
+                 cache_maxbytes=32 * 1024 * 1024):
         
         self.cache_timeout = cache_timeout
 
@@ -27,10 +433,17 @@ class Cache(object):
         
         self.cache_threshold = cache_threshold 
         
+        self.cache_maxbytes = cache_maxbytes
+        
+        '''True if the cache is shared between processes (Redis or file)'''
+        self.is_shared = False
+        
         if cache_url == 'simple':
             self._configure_cache_simple()
         elif cache_url.startswith('redis'):
             self._configure_cache_redis(cache_url)
+        elif cache_url.startswith('file://'):
+            self._configure_cache_file(cache_url)
         else:
             self._configure_null_cache()        
             
@@ -51,16 +464,30 @@ class Cache(object):
         self.cache.clear = self.cache._cache.clear
         
     def _configure_cache_redis(self, url):
-        from werkzeug.contrib.cache import RedisCache
         from redis import from_url
 
-        msg = "enable redis cache url[%s] prefix[%s] cache_timeout[%s]"
-        logger.info(msg % (url, self.cache_prefix, self.cache_timeout))
+        msg = "enable redis cache url[%s] prefix[%s] cache_timeout[%s] local threshold[%s]"
+        logger.info(msg % (url, self.cache_prefix, self.cache_timeout, self.cache_threshold))
 
         client = from_url(url)
-        self.cache = RedisCache(host=client, 
-                                default_timeout=self.cache_timeout, 
-                                key_prefix=self.cache_prefix)
+        self.is_shared = True
+        self.cache = TwoTierCache(client, 
+                                  key_prefix=self.cache_prefix, 
+                                  default_timeout=self.cache_timeout, 
+                                  threshold=self.cache_threshold,
+                                  maxbytes=self.cache_maxbytes)
+    
+    def _configure_cache_file(self, url):
+        """file:///var/cache/dlstats: sqlite3 database PREFIX.sqlite in this directory"""
+        filepath = os.path.join(url[len('file://'):], "%s.sqlite" % self.cache_prefix)
+
+        msg = "enable file cache path[%s] cache_timeout[%s] maxbytes[%s]"
+        logger.info(msg % (filepath, constants.CACHE_FILE_TIMEOUT, constants.CACHE_FILE_MAXBYTES))
+
+        self.is_shared = True
+        self.cache = FileCache(filepath, 
+                               default_timeout=constants.CACHE_FILE_TIMEOUT,
+                               maxbytes=constants.CACHE_FILE_MAXBYTES)
     
     @timeit("cache.get", stats_only=True)
     def get(self, key, **kwargs):
@@ -103,6 +530,15 @@ class Cache(object):
         "Proxy function for internal cache object."
         self.cache.set_many(*args, **kwargs)
 
+    def stats(self):
+        "Metrics of the cache (None if not a two-tier cache)"
+        if hasattr(self.cache, "stats"):
+            return self.cache.stats()
+
+    def reset_stats(self):
+        if hasattr(self.cache, "reset_stats"):
+            self.cache.reset_stats()
+
 def configure_cache(**kwargs):
     global cache
     cache = Cache(**kwargs)
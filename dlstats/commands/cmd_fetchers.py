@@ -11,10 +11,13 @@ from widukind_common import errors
 from dlstats import constants
 from dlstats.fetchers import FETCHERS
 from dlstats import client
+from dlstats.mongo_monitor import register as register_mongo_monitor
 from dlstats.utils import last_error
 
 async_frameworks = ["future"]#, "gevent", "mp", "tornado"]
 
+series_async_modes = ["future", "pipeline", "process"]
+
 opt_fetcher = click.option('--fetcher', '-f', 
               required=True, type=click.Choice(FETCHERS.keys()), 
               help='Fetcher choice')
@@ -35,6 +38,10 @@ opt_async_mode = click.option('--async-mode',
               type=click.Choice(async_frameworks), 
               help='Async mode choice')
 
+opt_series_async_mode = click.option('--async-mode', 
+              type=click.Choice(series_async_modes), 
+              help='Async mode choice for series processing')
+
 def _consolidate(ctx, db, fetcher, dataset=None, max_bulk=20):
 
     start = time.time()
@@ -176,6 +183,8 @@ def cmd_datatree(fetcher=None, force=False,
                               not_remove_files=not_remove)
         
         f.upsert_data_tree(force_update=force)
+        if f.data_tree_stats:
+            ctx.log_ok("categories: %(inserted)s inserted - %(updated)s updated - %(deleted)s deleted - %(unchanged)s unchanged" % f.data_tree_stats)
         #TODO: lock commun avec tasks ?
 
 @cli.command('calendar', context_settings=client.DLSTATS_SETTINGS)
@@ -292,16 +301,55 @@ def cmd_calendar(fetcher=None, update=False, **kwargs):
 @client.opt_trace
 @click.option('--bulk-size', '-B', default=200, type=int, 
               show_default=True, help='Bulk size for batch mode.')
+@click.option('--bulk-adaptive', is_flag=True, 
+              help='Adjust bulk size from documents size and write time.')
+@click.option('--bulk-max-bytes', default=8*1024*1024, type=int, 
+              show_default=True, help='Bytes budget of one adaptive bulk.')
+@click.option('--bulk-max-latency', default=2.0, type=float, 
+              show_default=True, help='Seconds budget of one adaptive bulk.')
 @click.option('--force-update', is_flag=True, help="Force update")
+@click.option('--first-load', is_flag=True, 
+              help='Insert series without lookup for datasets without series')
+@click.option('--defer-indexes', is_flag=True, 
+              help='Build secondary indexes of series after the load (empty collection only)')
+@click.option('--profile', 'profile_dir', type=click.Path(file_okay=False), 
+              help='Write cProfile files by dataset in this directory')
+@click.option('--profile-memory', is_flag=True, 
+              help='With --profile, write top allocation sites by dataset')
+@click.option('--memory-limit', type=int, 
+              help='Soft memory ceiling (RSS) in MB: flush series and drop cached codelists')
+@click.option('--workers', '-w', default=1, type=int, 
+              show_default=True, help='Number of processes for datasets upsert.')
+@click.option('--resume', is_flag=True, 
+              help='Skip partitions committed by an interrupted run')
+@click.option('--no-http-conditional', is_flag=True, 
+              help='Always download files (no If-None-Match/If-Modified-Since)')
+@click.option('--http-pool-size', default=10, type=int, 
+              show_default=True, help='HTTP connections kept by host.')
+@click.option('--prefetch', 'prefetch_partitions', type=int, 
+              help='Partitions downloaded in background (default: limit of the provider)')
+@click.option('--http-max-retries', type=int, 
+              help='Retries of the HTTP requests (default: policy of the provider)')
+@click.option('--http-rate', type=float, 
+              help='Max HTTP requests by second by host (default: policy of the provider)')
+@click.option('--mongo-monitor', is_flag=True, 
+              help='Count MongoDB commands by collection in stats_run')
+@click.option('--mongo-monitor-bytes', is_flag=True, 
+              help='With --mongo-monitor, count the size of commands and replies')
 @opt_fetcher
-@opt_async_mode
+@opt_series_async_mode
 @opt_dataset_multiple
 def cmd_run(fetcher=None, dataset=None, 
             max_errors=0, bulk_size=200, datatree=False,             
-            async_mode=None, 
+            bulk_adaptive=False, bulk_max_bytes=None, bulk_max_latency=None,
+            async_mode=None, workers=1, resume=False, 
             use_files=False, not_remove=False, run_full=False,
             dataset_only=False, refresh_meta=False,
-            force_update=False, 
+            force_update=False, first_load=False, defer_indexes=False,
+            profile_dir=None, profile_memory=False, memory_limit=None,
+            no_http_conditional=False, http_pool_size=10, 
+            prefetch_partitions=None, http_max_retries=None, http_rate=None, 
+            mongo_monitor=False, mongo_monitor_bytes=False,
             **kwargs):
     """Run Fetcher - All datasets or selected dataset"""
 
@@ -309,6 +357,10 @@ def cmd_run(fetcher=None, dataset=None,
     
     ctx.log_ok("Run %s fetcher:" % fetcher)
     
+    if mongo_monitor:
+        '''Before the creation of the MongoDB client'''
+        register_mongo_monitor(count_bytes=mongo_monitor_bytes)
+    
     if ctx.silent or click.confirm('Do you want to continue?', abort=True):
         
         lock_key = "run-%s" % fetcher
@@ -323,12 +375,30 @@ def cmd_run(fetcher=None, dataset=None,
                 f = FETCHERS[fetcher](db=db,
                                       max_errors=max_errors,
                                       bulk_size=bulk_size,
+                                      bulk_adaptive=bulk_adaptive,
+                                      bulk_max_bytes=bulk_max_bytes,
+                                      bulk_max_latency=bulk_max_latency,
                                       use_existing_file=use_files,
                                       not_remove_files=not_remove,
                                       dataset_only=dataset_only,
                                       refresh_meta=refresh_meta,
                                       async_mode=async_mode,
-                                      force_update=force_update)
+                                      force_update=force_update,
+                                      first_load=first_load,
+                                      defer_indexes=defer_indexes,
+                                      profile_dir=profile_dir,
+                                      profile_memory=profile_memory,
+                                      memory_limit=memory_limit,
+                                      workers=workers,
+                                      resume=resume,
+                                      http_conditional=not no_http_conditional,
+                                      http_pool_size=http_pool_size,
+                                      prefetch_partitions=prefetch_partitions,
+                                      http_max_retries=http_max_retries,
+                                      http_rate=http_rate,
+                                      mongo_monitor=mongo_monitor,
+                                      mongo_monitor_bytes=mongo_monitor_bytes,
+                                      mongo_url=ctx.mongo_url.strip('"'))
                 
                 if not dataset and not hasattr(f, "upsert_all_datasets"):
                     ctx.log_error("upsert_all_datasets method is not implemented for this fetcher.")
@@ -339,17 +409,25 @@ def cmd_run(fetcher=None, dataset=None,
                 if datatree:
                     f.upsert_data_tree(force_update=True)
                 
-                if dataset:
+                try:
+                    if dataset and workers > 1:
+                        f.upsert_datasets(list(dataset))
+                    elif dataset:
+                        for ds in dataset:
+                            f.wrap_upsert_dataset(ds)
+                    else:
+                        f.upsert_all_datasets()
+                finally:
+                    f.indexes_restore()
+                    f.profile_merge()
+
+                if run_full and dataset:
                     for ds in dataset:
-                        f.wrap_upsert_dataset(ds)
-                        if run_full:
-                            _consolidate(ctx, db, fetcher, dataset=ds)
-                            _update_tags(ctx, db, fetcher, dataset=ds, update_only=True)
-                else:
-                    f.upsert_all_datasets()
-                    if run_full:
-                        _consolidate(ctx, db, fetcher)
-                        _update_tags(ctx, db, fetcher, update_only=True)
+                        _consolidate(ctx, db, fetcher, dataset=ds)
+                        _update_tags(ctx, db, fetcher, dataset=ds, update_only=True)
+                elif run_full:
+                    _consolidate(ctx, db, fetcher)
+                    _update_tags(ctx, db, fetcher, update_only=True)
                 
         except errors.Locked as err:
             ctx.log_error("run command is locked for key[%s]" % lock_key)
@@ -686,7 +764,9 @@ def cmd_purge(fetcher=None, dataset=None, purge_all=False, **kwargs):
               type=int, 
               show_default=True,
               help='Result limit (zero for unlimited)')
-def cmd_stats_run(fetcher=None, limit=20, **kwargs):
+@click.option('--stages', is_flag=True, 
+              help='Display time by stage in percent of duration')
+def cmd_stats_run(fetcher=None, limit=20, stages=False, **kwargs):
     """Display run stats sorted by descending created field"""
     
     #TODO: csv export ?
@@ -694,6 +774,10 @@ def cmd_stats_run(fetcher=None, limit=20, **kwargs):
 
     ctx = client.Context(**kwargs)
     db = ctx.mongo_database()
+    
+    if stages:
+        return _stats_run_stages(db, fetcher=fetcher, limit=limit)
+    
     #fmt = "{:15} | {:10} | {:20} | {:>5} | {:>5} | {:>5} | {:>5} | {:>5}"
     fmt = "{:16} | {:10} | {:20.20} | {:>6} | {:>6} | {:>6} | {:>6} | {:>5} | {:>5} | {:>6} | {:>6} | {:>6} | {:5} | {:>5}"
     sep = "---------------------------------------------------------------------------------------------------------------------------------------------------"
@@ -729,6 +813,48 @@ def cmd_stats_run(fetcher=None, limit=20, **kwargs):
         
     print(sep)
 
+def _stats_run_stages(db, fetcher=None, limit=20):
+    """Display stages field of run stats
+    
+    Times are the own times of the stages (nested stages are subtracted). 
+    % does not count the time of the background threads (prefetch 
+    downloads), which overlaps the other stages.
+    """
+    
+    fmt = "{:16} | {:10} | {:20.20} | {:16} | {:>8} | {:>10} | {:>6} | {:>12}"
+    sep = "---------------------------------------------------------------------------------------------------------------"
+    print(sep)
+    print(fmt.format("Date", "Provider", "Dataset", "Stage", "Count", "Time", "%", "Bytes/Ops"))
+    print(sep)
+    query = {"stages": {"$exists": True}}
+    if fetcher:
+        query["provider_name"] = fetcher
+
+    cursor = db[constants.COL_STATS_RUN].find(query)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    for stat in cursor.sort("created", -1):
+        duration = stat.get("duration") or 0.0
+        _stages = sorted(stat["stages"].items(), 
+                         key=lambda item: item[1]["time"], 
+                         reverse=True)
+        for name, stage in _stages:
+            percent = 0.0
+            if duration:
+                percent = (stage["time"] - stage.get("background", 0.0)) * 100 / duration
+            print(fmt.format(
+                stat['created'].strftime("%Y-%m-%d-%H:%M"),
+                stat["provider_name"], 
+                stat.get("dataset_code"),
+                name,
+                stage["count"],
+                "%.3f" % stage["time"],
+                "%.1f" % percent,
+                stage.get("bytes", stage.get("operations", ""))
+            ))
+        print(sep)
+
 @cli.command('providers', context_settings=client.DLSTATS_SETTINGS)
 @client.opt_verbose
 @client.opt_silent
@@ -11,12 +11,15 @@ from widukind_common import tests_tools as utils
 from dlstats import constants
 from dlstats import client
 from dlstats.fetchers import schemas
+from dlstats.fetchers._commons import (create_series_hash_index,
+                                       create_series_archives_index,
+                                       series_archives_migrate)
 
 #TODO: move to schemas module
 CURRENT_SCHEMAS = {
     constants.COL_PROVIDERS: schemas.provider_schema,
     constants.COL_DATASETS: schemas.dataset_schema,
-    constants.COL_SERIES: schemas.series_schema,
+    constants.COL_SERIES: schemas.series_validator,
     constants.COL_CATEGORIES: schemas.category_schema,
 }
 
@@ -55,6 +58,8 @@ def cmd_reindex(drop_before=False, **kwargs):
 
         ctx.log("Create or update all indexes !")
         create_or_update_indexes(db)
+        create_series_hash_index(db)
+        create_series_archives_index(db)
         
         if not drop_before:
             with click.progressbar(constants.COL_ALL,
@@ -213,6 +218,44 @@ def cmd_check_schemas(max_errors=None, **kwargs):
         time elapsed : 210.042 seconds        
         """
     
+@cli.command('archives-delta', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_debug
+@client.opt_mongo_url
+@click.option('--provider', '-p', help='Convert archives of this provider only')
+@click.option('--dataset', '-d', multiple=True, 
+              help='Convert archives of this dataset(s) only')
+@click.option('--dry-mode', is_flag=True, help="Count archives without write")
+def cmd_archives_delta(provider=None, dataset=None, dry_mode=False, **kwargs):
+    """Convert full series archives to delta archives"""
+
+    """
+    dlstats mongo archives-delta
+    dlstats mongo archives-delta -p INSEE -d IPCH-2015-FR-COICOP
+    """
+
+    ctx = client.Context(**kwargs)
+    
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        start = time.time()
+        
+        db = ctx.mongo_database()
+        create_series_archives_index(db)
+        
+        query = {}
+        if provider:
+            query["provider_name"] = provider
+        if dataset:
+            query["dataset_code"] = {"$in": dataset}
+            
+        count = series_archives_migrate(db, query, dry_mode=dry_mode)
+
+        end = time.time() - start
+        
+        ctx.log_ok("Archives converted: %s - time[%.3f]" % (count, end))
+
 @cli.command('clean', context_settings=client.DLSTATS_SETTINGS)
 @client.opt_verbose
 @client.opt_silent
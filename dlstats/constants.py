@@ -1,8 +1,43 @@
 # -*- coding: utf-8 -*-
 
 import os
+import tempfile
 from widukind_common.constants import *
 
-CACHE_URL = os.environ.get('WIDUKIND_CACHE_URL', 'simple') #redis://localhost:6379/0
+CACHE_URL = os.environ.get('WIDUKIND_CACHE_URL', 'simple') #redis://localhost:6379/0 or file:///var/cache/dlstats
 
-SCHEMAS_VALIDATION_DISABLE = os.environ.get('WIDUKIND_SCHEMAS_VALIDATION_DISABLE', 'false')
\ No newline at end of file
+# Timeout (seconds) and max size (bytes) of the file:// cache
+CACHE_FILE_TIMEOUT = int(os.environ.get('WIDUKIND_CACHE_FILE_TIMEOUT', str(7 * 86400)))
+
+CACHE_FILE_MAXBYTES = int(os.environ.get('WIDUKIND_CACHE_FILE_MAXBYTES', str(512 * 1024 * 1024)))
+
+SCHEMAS_VALIDATION_DISABLE = os.environ.get('WIDUKIND_SCHEMAS_VALIDATION_DISABLE', 'false')
+
+# Series of these providers (comma separated) are validated with a sample rate
+SCHEMAS_TRUSTED_PROVIDERS = os.environ.get('WIDUKIND_SCHEMAS_TRUSTED_PROVIDERS', '')
+
+SCHEMAS_SAMPLE_RATE = os.environ.get('WIDUKIND_SCHEMAS_SAMPLE_RATE', '0.1')
+
+# Directory of the ETag/Last-Modified of the conditional downloads
+HTTP_VALIDATORS_PATH = os.environ.get('WIDUKIND_HTTP_VALIDATORS_PATH', 
+                                      os.path.join(tempfile.gettempdir(), 'dlstats-http-validators'))
+
+# Read buffer (bytes) of the downloads
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('WIDUKIND_DOWNLOAD_CHUNK_SIZE', str(1024 * 1024)))
+
+# Default retry policy of the HTTP requests (see dlstats.http_policy)
+HTTP_MAX_RETRIES = int(os.environ.get('WIDUKIND_HTTP_MAX_RETRIES', '3'))
+
+HTTP_BACKOFF_FACTOR = float(os.environ.get('WIDUKIND_HTTP_BACKOFF_FACTOR', '1.0'))
+
+HTTP_BACKOFF_MAX = float(os.environ.get('WIDUKIND_HTTP_BACKOFF_MAX', '60'))
+
+HTTP_RETRY_AFTER_MAX = float(os.environ.get('WIDUKIND_HTTP_RETRY_AFTER_MAX', '600'))
+
+# Seconds before the lease of a dataset taken by a worker expires (see Fetcher.dataset_lease_acquire)
+DATASET_LEASE_TIMEOUT = int(os.environ.get('WIDUKIND_DATASET_LEASE_TIMEOUT', str(12 * 3600)))
+
+# Max entries of the in-process cache of utils.slugify
+SLUGIFY_CACHE_SIZE = int(os.environ.get('WIDUKIND_SLUGIFY_CACHE_SIZE', '50000'))
+
+COL_CHECKPOINTS = "checkpoints"
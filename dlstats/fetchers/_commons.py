@@ -2,6 +2,8 @@
 
 import time
 import os
+import socket
+import uuid
 import tempfile
 from operator import itemgetter
 from datetime import datetime, timedelta
@@ -11,19 +13,28 @@ from collections import OrderedDict, deque
 from itertools import groupby
 import hashlib
 import json
+import concurrent.futures
+import tracemalloc
 
 import pymongo
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, InsertOne, ReplaceOne, UpdateOne, DeleteOne, WriteConcern
+from bson import BSON, ObjectId
 from bson.json_util import dumps as json_dumps
-import pandas
 
-from widukind_common.utils import get_mongo_db, load_klass, series_archives_store
+from widukind_common.utils import (get_mongo_db, get_mongo_client, load_klass, 
+                                   series_archives_load)
 from widukind_common import errors
 from widukind_common.tags import generate_tags_series
 from widukind_common.debug import timeit, TRACE_ENABLE
 
 from dlstats import constants
 from dlstats.fetchers import schemas
+from dlstats.profiler import profile_dataset, merge_profiles
+from dlstats import periods
+from dlstats.http_policy import HTTPPolicy
+from dlstats.mongo_monitor import command_monitor, register as register_mongo_monitor
+from dlstats.observations import (Observations, obs_periods, obs_values, 
+                                  obs_attributes, values_to_bson)
 from dlstats.utils import (last_error, 
                            clean_datetime, 
                            remove_file_and_dir, 
@@ -31,15 +42,51 @@ from dlstats.utils import (last_error,
                            get_url_hash,
                            json_dump_convert,
                            get_datetime_from_period,
-                           slugify)
+                           slugify,
+                           slugify_cache,
+                           stages,
+                           stage_timer,
+                           download_stats,
+                           get_rss,
+                           get_max_rss,
+                           http_validators,
+                           http_session,
+                           http_session_stats,
+                           prefetch)
 
 logger = logging.getLogger(__name__)
 
 IS_SCHEMAS_VALIDATION_DISABLE = constants.SCHEMAS_VALIDATION_DISABLE == "true"
 
+SCHEMAS_TRUSTED_PROVIDERS = [p.strip() for p in constants.SCHEMAS_TRUSTED_PROVIDERS.split(",") if p.strip()]
+
+series_sample_validator = schemas.compile_schema(schemas.series_schema,
+                                                 sample_rate=float(constants.SCHEMAS_SAMPLE_RATE))
+
+@stage_timer("validation")
+def series_validate(bson):
+    """Validate a series with the compiled series schema
+    
+    Only a sample of the series of trusted providers 
+    (WIDUKIND_SCHEMAS_TRUSTED_PROVIDERS) are validated 
+    (WIDUKIND_SCHEMAS_SAMPLE_RATE).
+    """
+    if IS_SCHEMAS_VALIDATION_DISABLE:
+        return
+    if bson.get("provider_name") in SCHEMAS_TRUSTED_PROVIDERS:
+        series_sample_validator.sample(bson)
+    else:
+        schemas.series_validator(bson)
+
 class Fetcher(object):
     """Abstract base class for all fetchers"""
     
+    '''Partitions downloaded in background by SeriesIterator.prefetch()'''
+    PREFETCH_PARTITIONS = 1
+    
+    '''Options of the HTTPPolicy of the provider (max_retries, rate, burst...)'''
+    HTTP_POLICY = {}
+    
     def __init__(self, 
                  provider_name=None, 
                  db=None, 
@@ -55,11 +102,63 @@ class Fetcher(object):
                  async_mode=None,
                  bulk_size=500,
                  pool_size=20,
+                 workers=1,
+                 mongo_url=None,
+                 resume=False,
+                 bulk_adaptive=False,
+                 bulk_max_bytes=8*1024*1024,
+                 bulk_max_latency=2.0,
+                 first_load=False,
+                 defer_indexes=False,
+                 profile_dir=None,
+                 profile_memory=False,
+                 memory_limit=None,
+                 http_conditional=True,
+                 http_pool_size=10,
+                 http_pool_block=False,
+                 http_keep_alive=True,
+                 prefetch_partitions=None,
+                 http_max_retries=None,
+                 http_rate=None,
+                 mongo_monitor=False,
+                 mongo_monitor_bytes=False,
                  **kwargs):
         """
         :param str provider_name: Provider Name
         :param pymongo.database.Database db: MongoDB Database instance        
         :param bool is_indexes: Bypass create_or_update_indexes() if False 
+        :param int workers: Number of processes for upsert of datasets
+        :param str mongo_url: MongoDB URL used by worker processes
+        :param bool resume: Skip partitions committed by an interrupted run
+        :param bool bulk_adaptive: Adjust bulk_size after each bulk write
+        :param int bulk_max_bytes: Bytes budget of one adaptive bulk
+        :param float bulk_max_latency: Seconds budget of one adaptive bulk
+        :param bool first_load: Insert series without lookup of old series 
+                                for datasets without stored series
+        :param bool defer_indexes: Build secondary indexes of series after 
+                                   the load if the collection is empty
+        :param str profile_dir: Write a cProfile file by dataset in this directory
+        :param bool profile_memory: Write top allocation sites by dataset (tracemalloc)
+        :param int memory_limit: Soft memory ceiling (RSS) in MB
+        :param bool http_conditional: Skip the stored datasets if their files 
+                                      are not modified (HTTP 304)
+        :param int http_pool_size: Connections kept by host in the pool 
+                                   of the HTTP session
+        :param bool http_pool_block: Wait for a free connection of the pool
+        :param bool http_keep_alive: Reuse the connections between requests
+        :param int prefetch_partitions: Partitions downloaded in background 
+                                        while a partition is parsed 
+                                        (default: PREFETCH_PARTITIONS of 
+                                        the provider)
+        :param int http_max_retries: Retries of the HTTP requests 
+                                     (default: HTTP_POLICY of the provider)
+        :param float http_rate: Max HTTP requests by second by host 
+                                (default: HTTP_POLICY of the provider)
+        :param bool mongo_monitor: Count the MongoDB commands by collection 
+                                   in stats_run (clients created after 
+                                   mongo_monitor.register() only)
+        :param bool mongo_monitor_bytes: With mongo_monitor, also count the 
+                                         size of commands and replies
 
         :raises ValueError: if provider_name is None
         """        
@@ -67,6 +166,10 @@ class Fetcher(object):
             raise ValueError("provider_name is required")
 
         self.provider_name = provider_name
+        self.mongo_monitor = mongo_monitor
+        self.mongo_monitor_bytes = mongo_monitor_bytes
+        if mongo_monitor:
+            register_mongo_monitor(count_bytes=mongo_monitor_bytes)
         self.db = db or get_mongo_db()
         self.version = version
         self.max_errors = max_errors
@@ -76,10 +179,45 @@ class Fetcher(object):
         self.refresh_meta = refresh_meta
         self.refresh_dsd = refresh_dsd
         self.force_update = force_update
+        self.is_indexes = is_indexes
         
         self.async_mode = async_mode
         self.bulk_size = bulk_size
         self.pool_size = pool_size
+        self.workers = workers
+        self.mongo_url = mongo_url
+        self.resume = resume
+        self.bulk_adaptive = bulk_adaptive
+        self.bulk_max_bytes = bulk_max_bytes
+        self.bulk_max_latency = bulk_max_latency
+        self.first_load = first_load
+        self.defer_indexes = defer_indexes
+        self.deferred_indexes = []
+        self.profile_dir = profile_dir
+        self.profile_memory = profile_memory
+        '''Profiles older than this fetcher are from another run'''
+        self.profile_since = time.time() - 1
+        self.memory_limit = memory_limit
+        self.http_conditional = http_conditional
+        self.http_pool_size = http_pool_size
+        self.http_pool_block = http_pool_block
+        self.http_keep_alive = http_keep_alive
+        self.prefetch_partitions = prefetch_partitions or self.PREFETCH_PARTITIONS
+        self.http_max_retries = http_max_retries
+        self.http_rate = http_rate
+        
+        policy = dict(self.HTTP_POLICY)
+        if http_max_retries is not None:
+            policy["max_retries"] = http_max_retries
+        if http_rate is not None:
+            policy["rate"] = http_rate
+        self.http_policy = HTTPPolicy(**policy)
+        
+        '''HTTP session shared by all downloads of this fetcher'''
+        self.requests_client = http_session(pool_maxsize=http_pool_size,
+                                            pool_block=http_pool_block,
+                                            keep_alive=http_keep_alive,
+                                            policy=self.http_policy)
         
         if self.async_mode:
             logger.info("ASYNC MODE [%s]" % self.async_mode)
@@ -89,17 +227,24 @@ class Fetcher(object):
         self.provider = None
         
         self.errors = 0
+        
+        '''Errors of the series of the datasets (Series.count_errors)'''
+        self.series_errors = 0
 
         self.categories_filter = [] #[category_code]
         self.datasets_filter = []   #[dataset_code]
         
         self.selected_datasets = {}
         
+        '''Counters of the last upsert_data_tree'''
+        self.data_tree_stats = None
+        
         self.store_path = os.path.abspath(os.path.join(tempfile.gettempdir(), 
                                                        self.provider_name))
         self.for_delete = []
         
         self.provider_verified = False
+        self.indexes_verified = False
         
         if IS_SCHEMAS_VALIDATION_DISABLE:
             logger.warning("schemas validation is disable")
@@ -120,7 +265,13 @@ class Fetcher(object):
             logger.critical('upsert_calendar failed for %s error[%s]' % (self.provider_name, last_error()))
     
     def upsert_data_tree(self, data_tree=None, force_update=False):
-        #TODO: bulk
+        """Synchronize the categories of the provider with data_tree
+
+        Only the changed nodes are written, in one unordered bulk. The
+        counters of the last call are in self.data_tree_stats.
+
+        Return the list of _id of the categories in data_tree order
+        """
 
         if data_tree and not isinstance(data_tree, list):
             raise TypeError("data_tree is not instance of list")
@@ -130,12 +281,19 @@ class Fetcher(object):
 
         results = []
         if data_tree:
-            Categories.remove_all(self.provider_name, db=self.db)
-                        
+            docs = []
             for data in data_tree:
                 cat = Categories(fetcher=self, **data)
-                results.append(cat.update_database())
-            
+                bson = cat.bson
+                schemas.category_schema(bson)
+                docs.append(bson)
+
+            results, stats = Categories.bulk_sync(self.provider_name, 
+                                                  docs, db=self.db)
+            self.data_tree_stats = stats
+            logger.info("data tree provider[%s] - inserted[%s] - updated[%s] - deleted[%s] - unchanged[%s]" % (self.provider_name,
+                        stats["inserted"], stats["updated"], stats["deleted"], stats["unchanged"]))
+
         return results
 
     def get_selected_datasets(self, force=False):
@@ -194,6 +352,36 @@ class Fetcher(object):
             self.provider.update_database()
 
         self.provider_verified = True
+
+    def indexes_verify(self):
+        """Create indexes required by dlstats and not by widukind_common"""
+
+        if self.indexes_verified or not self.is_indexes:
+            return
+
+        if self.defer_indexes and not self.db[constants.COL_SERIES].find_one({}, {"_id": True}):
+            self.deferred_indexes = series_indexes_defer(self.db)
+            msg = "indexes deferred for provider[%s] - indexes[%s]"
+            logger.info(msg % (self.provider_name, ",".join([i[0] for i in self.deferred_indexes])))
+        else:
+            create_series_hash_index(self.db)
+            create_series_archives_index(self.db)
+
+        self.indexes_verified = True
+
+    def indexes_restore(self):
+        """Build the secondary indexes of series deferred by indexes_verify"""
+        if not self.deferred_indexes:
+            return
+        
+        start = time.time()
+        series_indexes_restore(self.db, self.deferred_indexes)
+        create_series_hash_index(self.db)
+        create_series_archives_index(self.db)
+        self.deferred_indexes = []
+
+        msg = "indexes restored for provider[%s] - time[%.3f seconds]"
+        logger.info(msg % (self.provider_name, time.time() - start))
             
     def load_provider_from_db(self):
         """Load and set provider fields from DB
@@ -212,6 +400,7 @@ class Fetcher(object):
         
         self.provider_verify()
         
+        first_load = self.first_load
         try:
             query = {"provider_name": self.provider_name}
             
@@ -219,6 +408,8 @@ class Fetcher(object):
                 msg_op = "load"
                 msg = "fetcher load START: provider[%s] - bulk-size[%s]"
                 logger.info(msg % (self.provider_name, self.bulk_size))
+                '''No dataset for this provider: the series are inserted without lookup'''
+                self.first_load = True
                 return self.load_datasets_first()
             else:
                 msg = "fetcher update START: provider[%s] - bulk-size[%s]"
@@ -230,30 +421,48 @@ class Fetcher(object):
             logger.critical(msg % (msg_op, self.provider_name, last_error()))
 
         finally:
+            self.first_load = first_load
             end = time.time() - start
             msg = "fetcher %s END: provider[%s] - time[%.3f seconds]"
             logger.info(msg % (msg_op, self.provider_name, end))
         
-    def wrap_upsert_dataset(self, dataset_code):
+    def wrap_upsert_dataset(self, dataset_code, is_leased=False):
 
         start = time.time()
         msg = " dataset upsert START: provider[%s] - dataset[%s] - bulk-size[%s] - dataset-only[%s]"
         logger.info(msg % (self.provider_name, dataset_code, self.bulk_size, self.dataset_only))
 
         self.provider_verify()
+        self.indexes_verify()
 
         try:
             query = {"provider_name": self.provider_name,
                      "dataset_code": dataset_code}
-            projection = {"lock": True}
+            projection = {"lock": True, "lock_until": True}
             dataset_doc = self.db[constants.COL_DATASETS].find_one(query, 
                                                                    projection)
-            if dataset_doc and dataset_doc["lock"] is True:
+            if not is_leased and dataset_doc and is_locked(dataset_doc):
                 raise errors.LockedDataset("dataset is locked",
                                            provider_name=self.provider_name,
                                            dataset_code=dataset_code)
 
-            return self.upsert_dataset(dataset_code)
+            '''Conditional downloads only for a stored dataset'''
+            http_validators.begin(enabled=self.http_conditional and not self.force_update \
+                                  and dataset_doc is not None)
+            errors_before = (self.errors, self.series_errors)
+            try:
+                with profile_dataset(self.profile_dir, self.provider_name, dataset_code,
+                                     memory=self.profile_memory):
+                    result = self.upsert_dataset(dataset_code)
+            except Exception:
+                http_validators.discard()
+                raise
+            '''Errors of update_database are counted, not raised'''
+            if (self.errors, self.series_errors) == errors_before:
+                http_validators.commit()
+            else:
+                http_validators.discard()
+            return result
 
         except errors.RejectUpdatedDataset as err:
             msg = "Reject dataset updated for provider[%s] - dataset[%s]"
@@ -265,6 +474,25 @@ class Fetcher(object):
             msg = "dataset upsert END: provider[%s] - dataset[%s] - time[%.3f seconds]"
             logger.info(msg % (self.provider_name, dataset_code, end))
         
+    def profile_merge(self):
+        """Merge the profiles of datasets written by this run in 
+        PROVIDER.pstats and PROVIDER.collapsed.txt (flame graph) of 
+        profile_dir"""
+        if not self.profile_dir:
+            return
+        if merge_profiles(self.profile_dir, self.provider_name, 
+                          since=self.profile_since):
+            msg = "profile merged for provider[%s] - directory[%s]"
+            logger.info(msg % (self.provider_name, self.profile_dir))
+
+    def drop_cached_codelists(self):
+        """Release codelists cached between datasets
+        
+        Called when the soft memory ceiling (memory_limit) is reached. 
+        Fetchers with a cache of codelists must implement it.
+        """
+        pass
+
     def _hook_remove_temp_files(self, dataset):
         if dataset and dataset.for_delete and not self.not_remove_files:
             for filepath in dataset.for_delete:
@@ -287,19 +515,153 @@ class Fetcher(object):
         self._hook_remove_temp_files(dataset)
 
     def load_datasets_first(self):
+        dataset_codes = [d["dataset_code"] for d in self.datasets_list()]
+        return self.upsert_datasets(dataset_codes)
 
-        for dataset in self.datasets_list():
-            dataset_code = dataset["dataset_code"]
+    def upsert_datasets(self, dataset_codes):
+        """Upsert datasets one by one or in parallel if workers > 1
+
+        :param list dataset_codes: List of dataset_code
+        """
+        if self.workers > 1 and len(dataset_codes) > 1:
+            return self.upsert_datasets_parallel(dataset_codes)
+
+        for dataset_code in dataset_codes:
             try:
                 self.wrap_upsert_dataset(dataset_code)
             except Exception as err:
                 if isinstance(err, errors.MaxErrors):
                     raise
+                if isinstance(err, errors.LockedDataset):
+                    self.errors += 1
                 msg = "error for provider[%s] - dataset[%s]: %s"
                 logger.critical(msg % (self.provider_name, 
                                        dataset_code, 
                                        str(err)))
 
+    def worker_options(self):
+        """Return options for the fetcher instance of each worker process"""
+        return {
+            "max_errors": 0,
+            "use_existing_file": self.use_existing_file,
+            "not_remove_files": self.not_remove_files,
+            "force_update": self.force_update,
+            "dataset_only": self.dataset_only,
+            "refresh_meta": self.refresh_meta,
+            "refresh_dsd": self.refresh_dsd,
+            "async_mode": self.async_mode,
+            "bulk_size": self.bulk_size,
+            "pool_size": self.pool_size,
+            "mongo_url": self.mongo_url,
+            "resume": self.resume,
+            "bulk_adaptive": self.bulk_adaptive,
+            "bulk_max_bytes": self.bulk_max_bytes,
+            "bulk_max_latency": self.bulk_max_latency,
+            "first_load": self.first_load,
+            "profile_dir": self.profile_dir,
+            "profile_memory": self.profile_memory,
+            "memory_limit": self.memory_limit,
+            "http_conditional": self.http_conditional,
+            "http_pool_size": self.http_pool_size,
+            "http_pool_block": self.http_pool_block,
+            "http_keep_alive": self.http_keep_alive,
+            "prefetch_partitions": self.prefetch_partitions,
+            "http_max_retries": self.http_max_retries,
+            "http_rate": self.http_rate,
+            "mongo_monitor": self.mongo_monitor,
+            "mongo_monitor_bytes": self.mongo_monitor_bytes,
+        }
+
+    def upsert_datasets_parallel(self, dataset_codes):
+        """Upsert datasets with a pool of self.workers processes
+
+        - provider and indexes are verified once, before starting workers
+        - each worker takes the dataset lock field as a lease 
+          (see dataset_lease_acquire)
+        - errors of all workers are added to self.errors and checked 
+          against max_errors: pending datasets are cancelled when the
+          budget is exceeded
+        """
+        self.provider_verify()
+        self.indexes_verify()
+
+        klass = "%s.%s" % (self.__class__.__module__, self.__class__.__name__)
+        options = self.worker_options()
+        dataset_codes = list(OrderedDict.fromkeys(dataset_codes))
+
+        msg = "parallel upsert START: provider[%s] - datasets[%s] - workers[%s]"
+        logger.info(msg % (self.provider_name, len(dataset_codes), self.workers))
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            tasks = {executor.submit(upsert_dataset_worker, klass, options, dataset_code): dataset_code 
+                     for dataset_code in dataset_codes}
+            try:
+                for future in concurrent.futures.as_completed(tasks):
+                    dataset_code = tasks[future]
+                    try:
+                        count_errors, error = future.result()
+                    except Exception:
+                        count_errors, error = 1, last_error()
+
+                    self.errors += count_errors
+
+                    if error:
+                        msg = "error for provider[%s] - dataset[%s]: %s"
+                        logger.critical(msg % (self.provider_name, 
+                                               dataset_code, 
+                                               error))
+
+                    if self.max_errors and self.errors >= self.max_errors:
+                        msg = "The maximum number of errors is exceeded for provider[%s]. MAX[%s]"
+                        raise errors.MaxErrors(msg % (self.provider_name,
+                                                      self.max_errors))
+            except errors.MaxErrors:
+                for future in tasks:
+                    future.cancel()
+                raise
+
+    @property
+    def lease_owner(self):
+        """Owner of the leases taken by this process"""
+        if not getattr(self, "_lease_owner", None) or self._lease_owner[1] != os.getpid():
+            owner = "%s-%s-%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+            self._lease_owner = (owner, os.getpid())
+        return self._lease_owner[0]
+
+    def dataset_lease_acquire(self, dataset_code, timeout=None):
+        """Set the lock field of a stored dataset as a lease of lease_owner
+
+        The lease expires after timeout seconds (lock_until), so the 
+        lock of a killed worker does not block the next runs. 
+
+        Return False if the dataset is locked by a lease not expired or 
+        by a lock without expiry. A dataset not yet stored can not be 
+        locked and is always accepted.
+        """
+        timeout = timeout or constants.DATASET_LEASE_TIMEOUT
+        now = clean_datetime()
+        query = {"provider_name": self.provider_name,
+                 "dataset_code": dataset_code}
+        lease_query = dict(query, **{"$or": [{"lock": {"$ne": True}}, 
+                                             {"lock_until": {"$lt": now}}]})
+        result = self.db[constants.COL_DATASETS].update_one(lease_query,
+                                                            {"$set": {"lock": True,
+                                                                      "lock_owner": self.lease_owner,
+                                                                      "lock_until": now + timedelta(seconds=timeout)}})
+        if result.matched_count == 1:
+            return True
+        return self.db[constants.COL_DATASETS].count(query) == 0
+
+    def dataset_lease_release(self, dataset_code):
+        """Release the lease of lease_owner (a lease taken by another owner 
+        after expiry is kept)"""
+        query = {"provider_name": self.provider_name,
+                 "dataset_code": dataset_code,
+                 "lock_owner": self.lease_owner}
+        self.db[constants.COL_DATASETS].update_one(query, {"$set": {"lock": False},
+                                                           "$unset": {"lock_owner": "", 
+                                                                      "lock_until": ""}})
+
     def load_datasets_update(self):
         #TODO: log and/or warning
         return self.load_datasets_first()
@@ -337,6 +699,51 @@ class Fetcher(object):
         raise NotImplementedError("This method from the Fetcher class must"
                                   "be implemented.")
         
+_worker_fetchers = {}
+
+def upsert_dataset_worker(klass, options, dataset_code):
+    """Upsert one dataset in a worker process of Fetcher.upsert_datasets_parallel
+
+    The fetcher instance is created once per process. Provider and indexes
+    are verified by the parent process.
+
+    Return tuple (errors count, error message or None)
+    """
+    fetcher = _worker_fetchers.get(klass)
+    if not fetcher:
+        db = None
+        if options.get("mongo_monitor"):
+            register_mongo_monitor(count_bytes=options.get("mongo_monitor_bytes"))
+        if options.get("mongo_url"):
+            db = get_mongo_client(options["mongo_url"]).get_default_database()
+        fetcher = load_klass(klass)(db=db, is_indexes=False, **options)
+        provider = fetcher.load_provider_from_db()
+        if provider:
+            fetcher.provider = provider
+        fetcher.provider_verified = True
+        _worker_fetchers[klass] = fetcher
+
+    if not fetcher.dataset_lease_acquire(dataset_code):
+        return 1, "dataset is locked"
+
+    errors_before = fetcher.errors
+    error = None
+    try:
+        fetcher.wrap_upsert_dataset(dataset_code, is_leased=True)
+    except Exception:
+        error = last_error()
+    finally:
+        fetcher.dataset_lease_release(dataset_code)
+
+    return fetcher.errors - errors_before, error
+
+def is_locked(dataset_doc, now=None):
+    """True if the lock of a dataset document is set and not expired"""
+    if dataset_doc.get("lock") is not True:
+        return False
+    lock_until = dataset_doc.get("lock_until")
+    return lock_until is None or lock_until > (now or clean_datetime())
+
 class DlstatsCollection(object):
     """Abstract base class for objects that are stored and indexed by dlstats
     """
@@ -531,6 +938,57 @@ class Categories(DlstatsCollection):
         logger.info("remove all categories for [%s]" % provider_name)
         return db[constants.COL_CATEGORIES].remove(query)
     
+    @classmethod
+    def bulk_sync(cls, provider_name, docs, db=None):
+        """Insert, replace or delete the categories of a provider so that
+        the collection match docs, without removing the unchanged nodes
+
+        The existing categories are loaded by slug and the changes applied
+        in one unordered bulk_write. If a slug is repeated in docs, the
+        last document win.
+
+        Return (list of _id in docs order, counters dict)
+        """
+        db = db or get_mongo_db()
+        col = db[constants.COL_CATEGORIES]
+
+        existing = dict([(doc["slug"], doc) for doc in col.find({"provider_name": provider_name})])
+
+        news = OrderedDict()
+        for doc in docs:
+            news[doc["slug"]] = doc
+
+        stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        requests = []
+        ids = {}
+
+        for slug, doc in news.items():
+            old = existing.pop(slug, None)
+            if old is None:
+                doc = dict(doc, _id=ObjectId())
+                requests.append(InsertOne(doc))
+                stats["inserted"] += 1
+            else:
+                _id = old.pop("_id")
+                doc = dict(doc)
+                doc.pop("_id", None)
+                if old != doc:
+                    requests.append(ReplaceOne({"_id": _id}, doc))
+                    stats["updated"] += 1
+                else:
+                    stats["unchanged"] += 1
+                doc["_id"] = _id
+            ids[slug] = doc["_id"]
+
+        for old in existing.values():
+            requests.append(DeleteOne({"_id": old["_id"]}))
+            stats["deleted"] += 1
+
+        if requests:
+            col.bulk_write(requests, ordered=False)
+
+        return [ids[doc["slug"]] for doc in docs], stats
+
     @classmethod
     def search_category_for_dataset(cls, provider_name, dataset_code, db=None):
         db = db or get_mongo_db()
@@ -606,6 +1064,16 @@ class Datasets(DlstatsCollection):
         :param bool is_load_previous_version: Bypass load previous version if False        
         """        
         super().__init__(fetcher=fetcher)
+        '''Stages timers, downloads, commands and cache counters of the process are for this dataset'''
+        stages.reset()
+        download_stats.reset()
+        command_monitor.reset()
+        slugify_cache.reset_stats()
+        from dlstats.cache import cache
+        if cache:
+            cache.reset_stats()
+        self._http_start = http_session_stats(getattr(fetcher, "requests_client", None))
+        
         self.provider_name = provider_name
         self.dataset_code = dataset_code
         self.name = name
@@ -623,6 +1091,8 @@ class Datasets(DlstatsCollection):
 
         self.enable = False        
         self.lock = False
+        self.lock_owner = None
+        self.lock_until = None
         
         self.tags = []
 
@@ -637,6 +1107,8 @@ class Datasets(DlstatsCollection):
             
         self.notes = None
         
+        self.checkpoint = None
+        
         self.series = None
         
         self.set_series_class()
@@ -645,6 +1117,10 @@ class Datasets(DlstatsCollection):
         if self.fetcher.async_mode:
             if self.fetcher.async_mode == "future":
                 self.series_klass = "dlstats.async._concurrent_futures.AsyncSeries"
+            elif self.fetcher.async_mode == "pipeline":
+                self.series_klass = "dlstats.async._pipeline.PipelineSeries"
+            elif self.fetcher.async_mode == "process":
+                self.series_klass = "dlstats.async._process.ProcessSeries"
         
         series_klass = load_klass(self.series_klass)
         self.series = series_klass(dataset=self,
@@ -663,7 +1139,7 @@ class Datasets(DlstatsCollection):
         
     @property
     def bson(self):
-        return {'provider_name': self.provider_name,
+        bson = {'provider_name': self.provider_name,
                 'name': self.name,
                 'dataset_code': self.dataset_code,
                 'slug': self.slug(),
@@ -680,6 +1156,11 @@ class Datasets(DlstatsCollection):
                 "enable": self.enable,
                 "lock": self.lock,
                 "tags": self.tags}
+        '''The lease of a worker is kept by the replace of the document'''
+        if self.lock_owner:
+            bson["lock_owner"] = self.lock_owner
+            bson["lock_until"] = self.lock_until
+        return bson
 
     def load_previous_version(self, provider_name, dataset_code):
         dataset = self.fetcher.db[constants.COL_DATASETS].find_one(
@@ -699,6 +1180,8 @@ class Datasets(DlstatsCollection):
             self.notes = dataset.get('notes')
             self.enable = dataset.get('enable')
             self.lock = dataset.get('lock')
+            self.lock_owner = dataset.get('lock_owner')
+            self.lock_until = dataset.get('lock_until')
             self.tags = dataset.get('tags')
             
             dimension_list = {}
@@ -780,6 +1263,21 @@ class Datasets(DlstatsCollection):
             if msg:
                 self.metadata["disable_reason"] = msg
             
+    def http_stats(self):
+        """Requests, new connections, retries and wait of the HTTP session 
+        of the fetcher since the creation of this dataset"""
+        end = http_session_stats(getattr(self.fetcher, "requests_client", None))
+        requests_count = end["requests"] - self._http_start["requests"]
+        connections = end["connections"] - self._http_start["connections"]
+        reuse_rate = None
+        if requests_count > 0:
+            reuse_rate = round(1 - min(connections, requests_count) / requests_count, 4)
+        return {"requests": requests_count,
+                "connections": connections,
+                "reuse_rate": reuse_rate,
+                "retries": end["retries"] - self._http_start["retries"],
+                "wait": round(end["wait"] - self._http_start["wait"], 3)}
+
     @timeit("commons.Datasets.update_database")
     def update_database(self, save_only=False):
 
@@ -790,6 +1288,8 @@ class Datasets(DlstatsCollection):
         try:
             if not save_only and not self.fetcher.dataset_only:
                 self.series.process_series_data()
+                if self.checkpoint:
+                    self.checkpoint.clear()
         except Exception:
             self.fetcher.errors += 1
             logger.critical(last_error())
@@ -800,6 +1300,7 @@ class Datasets(DlstatsCollection):
                                               self.fetcher.max_errors))
         finally:
             now = self.series.now
+            self.fetcher.series_errors += self.series.count_errors
     
             if not self.download_first:
                 self.download_first = now
@@ -851,6 +1352,20 @@ class Datasets(DlstatsCollection):
                  "async_mode": self.fetcher.async_mode,
                  "schema_validation_disable": IS_SCHEMAS_VALIDATION_DISABLE
             }
+            _stats.update(self.series.get_run_stats())
+            _stats["first_load"] = self.series.first_load is True
+            _stats["stages"] = stages.snapshot()
+            _stats["downloads"] = download_stats.snapshot()
+            _stats["memory"] = self.series.memory.stats()
+            if self.fetcher.mongo_monitor:
+                _stats["mongo"] = command_monitor.snapshot()
+            _stats["slugify"] = slugify_cache.stats()
+            from dlstats.cache import cache
+            if cache:
+                _stats["cache"] = cache.stats()
+            if self.series.bulk_controller:
+                _stats["bulk_adaptive"] = self.series.bulk_controller.stats()
+            _stats["http"] = self.http_stats()
             
             try:
                 self.fetcher.db[constants.COL_STATS_RUN].insert_one(_stats)
@@ -920,8 +1435,17 @@ class SeriesIterator:
         return make_store_path(base_path=self.fetcher.store_path,
                                dataset_code=self.dataset_code)
 
+    def prefetch(self, partitions, func):
+        """Yield (partition, func(partition)) in the order of partitions
+        
+        func (the download of a partition) runs in background for the 
+        next fetcher.prefetch_partitions partitions.
+        """
+        return prefetch(partitions, func, workers=self.fetcher.prefetch_partitions)
+
     def __next__(self):
-        bson, err = next(self.rows)
+        with stages.timer("parse"):
+            bson, err = next(self.rows)
         if err:
             return err
         
@@ -929,7 +1453,10 @@ class SeriesIterator:
             raise StopIteration()
 
         try:
-            return self.clean_field(self.build_series(bson))
+            with stages.timer("build_series"):
+                bson = self.build_series(bson)
+            with stages.timer("clean_field"):
+                return self.clean_field(bson)
         except Exception as err:
             return err
 
@@ -956,6 +1483,77 @@ class SeriesIterator:
     def build_series(self, bson):
         raise NotImplementedError()
 
+    def get_checkpoint(self):
+        if not self.dataset.checkpoint:
+            self.dataset.checkpoint = Checkpoint(self.dataset,
+                                                 resume=self.fetcher.resume)
+        return self.dataset.checkpoint
+
+    def is_partition_committed(self, key):
+        """Return True if the partition is already written by an interrupted run"""
+        if self.get_checkpoint().is_committed(key):
+            msg = "resume bypass partition[%s] - provider[%s] - dataset[%s]"
+            logger.info(msg % (key, self.provider_name, self.dataset_code))
+            return True
+        return False
+
+    def partition_done(self, key):
+        """Mark partition as completed after its last row"""
+        self.get_checkpoint().done(key)
+
+class Checkpoint:
+    """Progress of a dataset loaded by partitions (one url by dimension value)
+
+    Partitions are marked done by the SeriesIterator after their last row. 
+    They are stored in COL_CHECKPOINTS only when all their series are written
+    (see Series.checkpoint_commit). The document is removed at the end of a
+    complete run.
+    """
+
+    def __init__(self, dataset, resume=False):
+        self.dataset = dataset
+        self.db = dataset.fetcher.db
+        self.query = {"provider_name": dataset.provider_name,
+                      "dataset_code": dataset.dataset_code}
+        self.pending = []
+        self.committed = set()
+
+        doc = self.db[constants.COL_CHECKPOINTS].find_one(self.query)
+        if doc and resume:
+            self.committed = set(doc.get("partitions", []))
+            msg = "resume from checkpoint provider[%s] - dataset[%s] - partitions[%s] - last-partition[%s]"
+            logger.info(msg % (dataset.provider_name, dataset.dataset_code,
+                               len(self.committed), doc.get("last_partition")))
+        elif doc:
+            self.clear()
+
+    def is_committed(self, key):
+        return key in self.committed
+
+    def done(self, key):
+        self.pending.append(key)
+
+    def pop_pending(self):
+        pending, self.pending = self.pending, []
+        return pending
+
+    def commit(self, partitions, **counts):
+        if not partitions:
+            return
+        self.committed.update(partitions)
+        values = {"last_partition": partitions[-1],
+                  "updated": clean_datetime()}
+        values.update(counts)
+        query_update = {"$addToSet": {"partitions": {"$each": partitions}},
+                        "$set": values,
+                        "$setOnInsert": {"created": clean_datetime()}}
+        self.db[constants.COL_CHECKPOINTS].update_one(self.query,
+                                                      query_update,
+                                                      upsert=True)
+
+    def clear(self):
+        self.db[constants.COL_CHECKPOINTS].delete_one(self.query)
+
 @timeit("commons.series_clean_field", stats_only=True)
 def series_clean_field(bson):
     
@@ -963,13 +1561,13 @@ def series_clean_field(bson):
         if bson["frequency"] in ["A", "M", "D", "Q", "S"]:
             bson["start_ts"] = get_datetime_from_period(bson["values"][0]["period"], freq=bson["frequency"])
         else:
-            bson["start_ts"] = clean_datetime(pandas.Period(ordinal=bson["start_date"], freq=bson["frequency"]).start_time.to_datetime())
+            bson["start_ts"] = clean_datetime(periods.ordinal_to_datetime(bson["start_date"], bson["frequency"]))
 
     if not "end_ts" in bson or not bson.get("end_ts"):
         if bson["frequency"] in ["A", "M", "D", "Q", "S"]:
             bson["end_ts"] = get_datetime_from_period(bson["values"][-1]["period"], freq=bson["frequency"])
         else:
-            bson["end_ts"] = clean_datetime(pandas.Period(ordinal=bson["end_date"], freq=bson["frequency"]).end_time.to_datetime())
+            bson["end_ts"] = clean_datetime(periods.ordinal_to_datetime(bson["end_date"], bson["frequency"], how="end"))
     
     dimensions = bson.pop("dimensions")
     attributes = bson.pop("attributes", {})
@@ -990,6 +1588,16 @@ def series_clean_field(bson):
     else:
         bson["attributes"] = None
         
+    def _slugify_attributes(attributes):
+        attributes_obs = {}
+        for k, v in attributes.items():
+            attributes_obs[slugify(k, save_order=True)] = slugify(v, save_order=True)
+        return attributes_obs
+
+    if isinstance(bson["values"], Observations):
+        bson["values"].map_attributes(_slugify_attributes)
+        return bson
+
     for value in bson["values"]:
         
         #TODO: datetime
@@ -998,10 +1606,7 @@ def series_clean_field(bson):
         
         if not value.get("attributes"):
             continue
-        attributes_obs = {}
-        for k, v in value.get("attributes").items():
-            attributes_obs[slugify(k, save_order=True)] = slugify(v, save_order=True)
-        value["attributes"] = attributes_obs
+        value["attributes"] = _slugify_attributes(value.get("attributes"))
     
     return bson
 
@@ -1025,14 +1630,14 @@ def series_is_changed(new_bson, old_bson):
             return True
     
         '''Value(s) change'''    
-        old_values = [v['value'] for v in old_bson['values']]
-        new_values = [v['value'] for v in new_bson['values']]
+        old_values = obs_values(old_bson['values'])
+        new_values = obs_values(new_bson['values'])
         if old_values != new_values:
             return True
 
     '''values.$.attributes change(s)'''
-    old_obs_attrs = [v['attributes'] for v in old_bson['values']]
-    new_obs_attrs = [v['attributes'] for v in new_bson['values']]
+    old_obs_attrs = obs_attributes(old_bson['values'])
+    new_obs_attrs = obs_attributes(new_bson['values'])
     for i, v in enumerate(old_obs_attrs):
         if v != new_obs_attrs[i]:
             return True
@@ -1133,9 +1738,9 @@ def series_set_codelists(bson, codelists):
             if not v in search_codelists[k]:
                 search_codelists[k].append(v)
 
-    for value in bson["values"]:
-        if value.get("attributes"):
-            for k, v in value.get("attributes").items():
+    for attributes in obs_attributes(bson["values"]):
+        if attributes:
+            for k, v in attributes.items():
                 if not k in search_codelists:
                     search_codelists[k] = []
                 if not v in search_codelists[k]:
@@ -1150,12 +1755,467 @@ def series_set_codelists(bson, codelists):
                         bson["codelists"][k] = {}
                     bson["codelists"][k][i] = value
     
+@timeit("commons.series_hash", stats_only=True)
+def series_hash(bson):
+    """Return canonical digest of the fields compared by series_is_changed"""
+    values = [list(v) for v in zip(obs_periods(bson["values"]),
+                                   obs_values(bson["values"]),
+                                   obs_attributes(bson["values"]))]
+    fields = [
+        bson.get("name"),
+        bson.get("notes"),
+        bson["start_date"],
+        bson["end_date"],
+        bson.get("dimensions"),
+        bson.get("attributes"),
+        values
+    ]
+    txt = json.dumps(fields, sort_keys=True, separators=(",", ":"),
+                     default=json_dump_convert)
+    return hashlib.sha1(txt.encode("utf-8")).hexdigest()
+
+ARCHIVE_FORMAT_DELTA = "delta"
+
+ARCHIVE_EXCLUDE_FIELDS = ["_id", "values", "version"]
+
+def series_archives_delta(old_bson, new_bson):
+    """Return archive document of old_bson as a delta against new_bson
+    
+    The delta contains what is needed to rebuild old_bson from new_bson:
+    
+    - fields: old value of changed top-level fields
+    - unset: fields not present in old_bson
+    - added: periods not present in old_bson
+    - removed: [position, observation] of observations not present in new_bson
+    - changed: old observations of periods with other value or attributes
+    
+    If the order of the common periods is not the same, the full old 
+    values are stored in the values field of the delta.
+    """
+    fields = {}
+    unset = []
+    for k, v in old_bson.items():
+        if k in ARCHIVE_EXCLUDE_FIELDS:
+            continue
+        if not k in new_bson or new_bson[k] != v:
+            fields[k] = v
+    for k in new_bson.keys():
+        if not k in ARCHIVE_EXCLUDE_FIELDS and not k in old_bson:
+            unset.append(k)
+
+    delta = {"fields": fields, "unset": unset}
+    
+    old_values = values_to_bson(old_bson["values"])
+    new_values = values_to_bson(new_bson["values"])
+    
+    new_periods = {v["period"]: v for v in new_values}
+    old_periods = set([v["period"] for v in old_values])
+    
+    common_old = [v["period"] for v in old_values if v["period"] in new_periods]
+    common_new = [v["period"] for v in new_values if v["period"] in old_periods]
+    
+    if common_old != common_new:
+        delta["values"] = old_values
+    else:
+        delta["added"] = [v["period"] for v in new_values if not v["period"] in old_periods]
+        delta["removed"] = [[i, v] for i, v in enumerate(old_values) if not v["period"] in new_periods]
+        delta["changed"] = [v for v in old_values 
+                            if v["period"] in new_periods and v != new_periods[v["period"]]]
+    
+    return {
+        "provider_name": old_bson["provider_name"],
+        "dataset_code": old_bson["dataset_code"],
+        "key": old_bson["key"],
+        "slug": old_bson["slug"],
+        "version": old_bson["version"],
+        "format": ARCHIVE_FORMAT_DELTA,
+        "delta": delta,
+    }
+
+def series_delta_apply(bson, archive):
+    """Return the version of archive rebuild from bson (next version)"""
+    delta = archive["delta"]
+    
+    old_bson = {k: v for k, v in bson.items() 
+                if not k in ARCHIVE_EXCLUDE_FIELDS and not k in delta["unset"]}
+    old_bson.update(delta["fields"])
+    old_bson["version"] = archive["version"]
+    
+    if "values" in delta:
+        old_bson["values"] = delta["values"]
+        return old_bson
+    
+    added = set(delta["added"])
+    changed = {v["period"]: v for v in delta["changed"]}
+    values = [changed.get(v["period"], v) for v in bson["values"] 
+              if not v["period"] in added]
+    for position, value in delta["removed"]:
+        values.insert(position, value)
+    old_bson["values"] = values
+    
+    return old_bson
+
+def series_archives_rebuild(db, provider_name, dataset_code, key, version):
+    """Rebuild one version of a series from current series and archives
+    
+    Archives are applied from the current version down to version. Full 
+    archives (before delta format) are loaded with series_archives_load.
+    
+    Return None if the series or one version is not found.
+    """
+    query = {"provider_name": provider_name, 
+             "dataset_code": dataset_code,
+             "key": key}
+    
+    doc = db[constants.COL_SERIES].find_one(query)
+    if not doc:
+        return None
+    doc.pop("_id")
+    
+    current_version = doc.get("version", 0)
+    if version >= current_version:
+        return doc if version == current_version else None
+    
+    query["version"] = {"$gte": version, "$lt": current_version}
+    cursor = db[constants.COL_SERIES_ARCHIVES].find(query).sort("version", pymongo.DESCENDING)
+    
+    for archive in cursor:
+        if archive["version"] != doc["version"] - 1:
+            return None
+        if archive.get("format") == ARCHIVE_FORMAT_DELTA:
+            doc = series_delta_apply(doc, archive)
+        else:
+            doc = series_archives_load(archive)
+            doc.pop("_id", None)
+    
+    if doc["version"] != version:
+        return None
+    
+    return doc
+
+def series_archives_migrate(db, query=None, dry_mode=False):
+    """Convert full archives to delta archives
+    
+    :param dict query: Filter on provider_name/dataset_code
+    
+    Return count of converted archives
+    """
+    query = dict(query or {})
+    query["format"] = {"$ne": ARCHIVE_FORMAT_DELTA}
+    
+    pipeline = [
+        {"$match": query},
+        {"$group": {"_id": {"provider_name": "$provider_name",
+                            "dataset_code": "$dataset_code",
+                            "key": "$key"}}}
+    ]
+    
+    count = 0
+    for group in db[constants.COL_SERIES_ARCHIVES].aggregate(pipeline, allowDiskUse=True):
+        provider_name = group["_id"]["provider_name"]
+        dataset_code = group["_id"]["dataset_code"]
+        key = group["_id"]["key"]
+        
+        _query = {"provider_name": provider_name, 
+                  "dataset_code": dataset_code,
+                  "key": key}
+        archives = list(db[constants.COL_SERIES_ARCHIVES].find(_query).sort("version", pymongo.ASCENDING))
+        if not archives:
+            continue
+        
+        '''Rebuild all versions before replacing archives'''
+        versions = {}
+        for archive in archives:
+            versions[archive["version"]] = series_archives_rebuild(db, provider_name, 
+                                                                   dataset_code, key, 
+                                                                   archive["version"])
+        current = db[constants.COL_SERIES].find_one(_query)
+        if not current:
+            logger.warning("series not found for archives of provider[%s] - dataset[%s] - key[%s]" % (provider_name, dataset_code, key))
+            continue
+        current.pop("_id")
+        versions[current["version"]] = current
+        
+        bulk_requests = []
+        for archive in archives:
+            if archive.get("format") == ARCHIVE_FORMAT_DELTA:
+                continue
+            old_bson = versions.get(archive["version"])
+            new_bson = versions.get(archive["version"] + 1)
+            if not old_bson or not new_bson:
+                msg = "missing version for provider[%s] - dataset[%s] - key[%s] - version[%s]"
+                logger.warning(msg % (provider_name, dataset_code, key, archive["version"]))
+                continue
+            bulk_requests.append(ReplaceOne({"_id": archive["_id"]},
+                                            series_archives_delta(old_bson, new_bson)))
+        
+        if bulk_requests and not dry_mode:
+            db[constants.COL_SERIES_ARCHIVES].bulk_write(bulk_requests, ordered=False)
+        count += len(bulk_requests)
+    
+    return count
+
+def create_series_archives_index(db):
+    """Index used by series_archives_rebuild"""
+    return db[constants.COL_SERIES_ARCHIVES].create_index([("provider_name", pymongo.ASCENDING),
+                                                           ("dataset_code", pymongo.ASCENDING),
+                                                           ("key", pymongo.ASCENDING),
+                                                           ("version", pymongo.ASCENDING)],
+                                                          name="provider_dataset_key_version_idx")
+
+def series_indexes_defer(db):
+    """Drop the not unique secondary indexes of series
+    
+    Return list of (name, index information) for series_indexes_restore
+    """
+    indexes = []
+    for name, info in db[constants.COL_SERIES].index_information().items():
+        if name == "_id_" or info.get("unique"):
+            continue
+        db[constants.COL_SERIES].drop_index(name)
+        indexes.append((name, info))
+    return indexes
+
+def series_indexes_restore(db, indexes):
+    for name, info in indexes:
+        options = {k: v for k, v in info.items() if not k in ["key", "v", "ns"]}
+        db[constants.COL_SERIES].create_index(info["key"], name=name, **options)
+
+def create_series_hash_index(db):
+    """Index used by Series.update_series_list for lookup of old series"""
+    return db[constants.COL_SERIES].create_index([("provider_name", pymongo.ASCENDING),
+                                                  ("dataset_code", pymongo.ASCENDING),
+                                                  ("key", pymongo.ASCENDING),
+                                                  ("hash", pymongo.ASCENDING)],
+                                                 name="provider_dataset_key_hash_idx")
+    
+SERIES_LOOKUP_PROJECTION = {"key": True, "version": True, "hash": True}
+
+@timeit("commons.series_prepare", stats_only=True)
+@stage_timer("prepare")
+def series_prepare(bson, provider_name, dataset_code, last_update=None):
+    """Set default fields, clean values and compute hash of one series
+    
+    Return the last_update_ds value of the series
+    """
+    if not "version" in bson:
+        bson["version"] = 0
+
+    if not bson.get("slug", None):
+        txt = "-".join([provider_name, dataset_code, bson['key']])
+        bson['slug'] = slugify(txt, word_boundary=False, save_order=True)
+    
+    last_update_ds = series_get_last_update_dataset(bson, 
+                                                    last_update=last_update)
+    
+    clean_values(bson)
+    
+    bson["hash"] = series_hash(bson)
+    
+    return last_update_ds
+
+@timeit("commons.update_series_list_unit", stats_only=True)
+@stage_timer("diff")
+def update_series_list_unit(bson, old_bson=None, last_update_ds=None, 
+                            codelists=None):
+    """Build the write operations for one series prepared by series_prepare
+    
+    :param dict bson: New series
+    :param dict old_bson: Full stored document or None for a new series
+    :param datetime.datetime last_update_ds: Value returned by series_prepare
+    :param dict codelists: Dataset codelists
+    
+    Return tuple (operation, archive_operation) - operation is None if 
+    nothing must be written
+    """
+    codelists = codelists or {}
+    
+    if not old_bson:
+        series_verify(bson)
+        bson["last_update_ds"] = last_update_ds 
+        bson["last_update_widu"] = clean_datetime()
+        series_set_codelists(bson, codelists)
+        series_validate(bson)
+        bson["values"] = values_to_bson(bson["values"])
+        return InsertOne(bson), None
+
+    series_verify(bson, old_bson=old_bson)
+    clean_values(old_bson)
+    
+    _id = old_bson.pop('_id')
+    tags = old_bson.pop('tags', None)
+
+    if series_is_changed(bson, old_bson): 
+        old_bson["tags"] = tags
+        if not "version" in old_bson:
+            old_bson["version"] = 0
+        old_version = old_bson["version"]
+        bson["tags"] = tags
+        bson["last_update_ds"] = last_update_ds 
+        bson["last_update_widu"] = clean_datetime()
+        bson["version"] = old_version + 1
+        
+        series_set_codelists(bson, codelists)
+        
+        series_validate(bson)
+        
+        bson["values"] = values_to_bson(bson["values"])
+        archive = InsertOne(series_archives_delta(old_bson, bson))
+        bson["_id"] = _id
+        return ReplaceOne({"_id": _id}, bson), archive
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("series[%s] not changed" % old_bson["slug"])
+
+    if old_bson.get("hash") != bson["hash"]:
+        '''Document stored without hash: set it for next runs'''
+        return UpdateOne({"_id": _id}, {"$set": {"hash": bson["hash"]}}), None
+
+    return None, None
+
 def clean_values(bson):
+    if isinstance(bson["values"], Observations):
+        return
     for value in bson["values"]:
         value.pop('ordinal', None)
         value.pop('release_date', None)
         value.pop('revisions', None)
     
+def operation_size(operation):
+    """Return BSON size of the document of a bulk operation"""
+    doc = getattr(operation, "_doc", None)
+    if not doc:
+        return 0
+    return len(BSON.encode(doc))
+
+class BulkSizeController(object):
+    """Adaptive flush threshold of :class:`Series`
+    
+    After each bulk write, the size of the next bulks is computed from the
+    average BSON size of the written documents and the write time so that
+    one bulk stays under max_bytes and max_latency:
+    
+    - the size grows at most by factor 2 for each write
+    - the size shrinks at once when a budget is exceeded
+    - the size stays between min_size and max_size (maxWriteBatchSize)
+    """
+    
+    sample_size = 20
+    
+    def __init__(self, bulk_size, max_bytes=8*1024*1024, max_latency=2.0,
+                 min_size=10, max_size=1000):
+        self.initial_size = bulk_size
+        self.bulk_size = bulk_size
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency
+        self.min_size = min(min_size, bulk_size)
+        self.max_size = max(max_size, bulk_size)
+        
+        self.count_writes = 0
+        self.count_docs = 0
+        self.total_bytes = 0
+        self.total_time = 0.0
+        self.min_chosen = bulk_size
+        self.max_chosen = bulk_size
+        self.changes = []
+    
+    def measure(self, operations):
+        """Return estimated BSON size of operations from a sample"""
+        if not operations:
+            return 0
+        step = max(1, len(operations) // self.sample_size)
+        sample = operations[::step]
+        sample_bytes = sum([operation_size(op) for op in sample])
+        return int(sample_bytes * len(operations) / len(sample))
+    
+    def update(self, count, nbytes, duration):
+        """Record one bulk write and return the next bulk_size"""
+        if not count:
+            return self.bulk_size
+
+        self.count_writes += 1
+        self.count_docs += count
+        self.total_bytes += nbytes
+        self.total_time += duration
+        
+        target = self.max_size
+        if nbytes:
+            target = min(target, int(self.max_bytes * count / nbytes))
+        if duration > 0:
+            target = min(target, int(self.max_latency * count / duration))
+        target = max(self.min_size, min(target, self.bulk_size * 2))
+        
+        if target != self.bulk_size:
+            self.changes.append([self.count_writes, target])
+            self.bulk_size = target
+            self.min_chosen = min(self.min_chosen, target)
+            self.max_chosen = max(self.max_chosen, target)
+
+        return self.bulk_size
+
+    def stats(self):
+        avg_doc_bytes = 0
+        avg_latency = 0
+        if self.count_docs:
+            avg_doc_bytes = self.total_bytes / self.count_docs
+        if self.count_writes:
+            avg_latency = self.total_time / self.count_writes
+        return {
+            "initial_size": self.initial_size,
+            "last_size": self.bulk_size,
+            "min_size": self.min_chosen,
+            "max_size": self.max_chosen,
+            "max_bytes": self.max_bytes,
+            "max_latency": self.max_latency,
+            "count_writes": self.count_writes,
+            "avg_doc_bytes": round(avg_doc_bytes, 2),
+            "avg_latency": round(avg_latency, 3),
+            "changes": self.changes,
+        }
+
+class MemoryMonitor(object):
+    """Peak memory of a dataset run and soft memory ceiling
+    
+    The RSS is sampled by check() (each check_interval series and at each 
+    flush of Series). The tracemalloc peak is recorded only if tracemalloc
+    is tracing (--profile-memory or PYTHONTRACEMALLOC).
+    
+    :param int limit: Soft memory ceiling in MB
+    """
+
+    check_interval = 100
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.limit_bytes = limit * 1024 * 1024 if limit else None
+        self.rss_start = get_rss()
+        self.rss_peak = self.rss_start
+        self.rss_last = self.rss_start
+        self.count_flushes = 0
+        if tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def check(self):
+        """Sample the RSS and return True if the limit is reached"""
+        rss = self.rss_last = get_rss()
+        if rss > self.rss_peak:
+            self.rss_peak = rss
+        return bool(self.limit_bytes and rss >= self.limit_bytes)
+
+    def stats(self):
+        self.check()
+        tracemalloc_peak = None
+        if tracemalloc.is_tracing():
+            tracemalloc_peak = tracemalloc.get_traced_memory()[1]
+        return {
+            "rss_start": self.rss_start,
+            "rss_peak": self.rss_peak,
+            "max_rss": get_max_rss(),
+            "tracemalloc_peak": tracemalloc_peak,
+            "limit": self.limit,
+            "count_flushes": self.count_flushes,
+        }
+
 class Series:
     """Time Series class
     """
@@ -1193,6 +2253,16 @@ class Series:
         self.dataset = dataset
 
         self.bulk_size = bulk_size
+        
+        self.first_load = None
+        
+        self.memory = MemoryMonitor(limit=self.fetcher.memory_limit)
+        
+        self.bulk_controller = None
+        if self.fetcher.bulk_adaptive:
+            self.bulk_controller = BulkSizeController(bulk_size,
+                                                      max_bytes=self.fetcher.bulk_max_bytes,
+                                                      max_latency=self.fetcher.bulk_max_latency)
 
         # temporary storage necessary to get old_bson in bulks
         self.series_list = deque()
@@ -1220,6 +2290,53 @@ class Series:
                                ('dataset_code', self.dataset_code),
                                ('last_update', self.dataset.last_update)])
 
+    def check_series_data(self, data):
+        """Classify one item returned by the data iterator
+        
+        Return True if data is a series to record, False if it is rejected.
+        
+        :raises errors.InterruptProcessSeriesData: for not captured exception
+        """
+        if isinstance(data, dict):
+            if not "values" in data or len(data["values"]) == 0:
+                self.count_rejects += 1
+                msg = "Reject empty series for provider[%s] - dataset[%s]"
+                logger.warning(msg % (self.provider_name, 
+                                      self.dataset_code))
+                return False
+            self.count_accepts += 1
+            return True
+
+        elif isinstance(data, errors.RejectFrequency):
+            self.count_rejects += 1
+            msg = "Reject frequency for provider[%s] - dataset[%s] - frequency[%s]"
+            logger.warning(msg % (self.provider_name, 
+                                  self.dataset_code, 
+                                  data.frequency))
+            return False
+        
+        elif isinstance(data, errors.RejectUpdatedSeries):
+            self.count_rejects += 1
+            if logger.isEnabledFor(logging.DEBUG):
+                msg = "Reject series updated for provider[%s] - dataset[%s] - key[%s]"
+                logger.debug(msg % (self.provider_name, 
+                                    self.dataset_code, 
+                                    data.key))
+            return False
+
+        elif isinstance(data, errors.RejectEmptySeries):
+            self.count_rejects += 1
+            msg = "Reject empty series for provider[%s] - dataset[%s]"
+            logger.warning(msg % (self.provider_name, 
+                                  self.dataset_code))
+            return False
+            
+        elif isinstance(data, Exception):
+            self.fatal_error = True
+            raise errors.InterruptProcessSeriesData(str(data))
+        
+        return False
+
     @timeit("commons.Series.process_series_data")
     def process_series_data(self):
         
@@ -1230,55 +2347,21 @@ class Series:
                 try:
                     data = next(self.data_iterator)
                     
-                    if isinstance(data, dict):
-                        if not "values" in data or len(data["values"]) == 0:
-                            self.count_rejects += 1
-                            msg = "Reject empty series for provider[%s] - dataset[%s]"
-                            logger.warning(msg % (self.provider_name, 
-                                                  self.dataset_code))
-                            continue
-                        else:
-                            self.count_accepts += 1
-                            self.series_list.append(data)
-    
-                    elif isinstance(data, errors.RejectFrequency):
-                        self.count_rejects += 1
-                        msg = "Reject frequency for provider[%s] - dataset[%s] - frequency[%s]"
-                        logger.warning(msg % (self.provider_name, 
-                                              self.dataset_code, 
-                                              data.frequency))
+                    if not self.check_series_data(data):
                         continue
-                    
-                    elif isinstance(data, errors.RejectUpdatedSeries):
-                        self.count_rejects += 1
-                        if logger.isEnabledFor(logging.DEBUG):
-                            msg = "Reject series updated for provider[%s] - dataset[%s] - key[%s]"
-                            logger.debug(msg % (self.provider_name, 
-                                                self.dataset_code, 
-                                                data.key))
-                        continue
-    
-                    elif isinstance(data, errors.RejectEmptySeries):
-                        self.count_rejects += 1
-                        msg = "Reject empty series for provider[%s] - dataset[%s]"
-                        logger.warning(msg % (self.provider_name, 
-                                              self.dataset_code))
-                        continue
-                        
-                    elif isinstance(data, Exception):
-                        self.fatal_error = True
-                        raise errors.InterruptProcessSeriesData(str(data))
 
-                    if len(self.series_list) >= self.bulk_size:
-                        self.update_series_list()
+                    self.series_list.append(data)
+
+                    if len(self.series_list) >= self.bulk_size or self.memory_check():
+                        self.flush_series_list()
                     
                 except StopIteration:
                     break
                 except Exception:
                     raise
         finally:
-            if not self.fatal_error and len(self.series_list) > 0:
-                self.update_series_list()
+            if not self.fatal_error:
+                self.flush_series_list()
             self.update_dataset_lists_finalize()
             """
             consolidate.consolidate_dataset(db=self.fetcher.db, {"provider_name": self.provider_name,
@@ -1291,6 +2374,57 @@ class Series:
                                       )
             """
 
+    def memory_check(self, count=None):
+        """Return True if series_list must be flushed before bulk_size
+        
+        Each MemoryMonitor.check_interval series, the RSS is compared to 
+        the soft memory ceiling. When it is reached, the cached codelists 
+        of the fetcher are dropped.
+        
+        :param int count: Number of pending series (default: len(series_list))
+        """
+        if self.count_accepts % self.memory.check_interval != 0:
+            return False
+        if not self.memory.check():
+            return False
+        self.memory.count_flushes += 1
+
+        msg = "memory limit reached for provider[%s] - dataset[%s] - rss[%s MB] - limit[%s MB] - flush[%s series]"
+        msg = msg % (self.provider_name, self.dataset_code, 
+                     self.memory.rss_last // (1024 * 1024), 
+                     self.memory.limit, 
+                     len(self.series_list) if count is None else count)
+        if self.memory.count_flushes == 1:
+            logger.warning(msg)
+            self.fetcher.drop_cached_codelists()
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(msg)
+        return True
+
+    def flush_series_list(self):
+        """Write series_list and commit the partitions completed before"""
+        self.memory.check()
+        partitions = self.checkpoint_pending()
+        if len(self.series_list) > 0:
+            self.update_series_list()
+        self.checkpoint_commit(partitions)
+
+    def checkpoint_pending(self):
+        if self.dataset.checkpoint:
+            return self.dataset.checkpoint.pop_pending()
+        return []
+
+    def checkpoint_commit(self, partitions):
+        if partitions and self.dataset.checkpoint:
+            self.dataset.checkpoint.commit(partitions,
+                                           count_accepts=self.count_accepts,
+                                           count_inserts=self.count_inserts,
+                                           count_updates=self.count_updates)
+
+    def get_run_stats(self):
+        """Return extra fields recorded in stats_run for this series class"""
+        return {}
+
     @timeit("commons.Series.update_dataset_lists_finalize")
     def update_dataset_lists_finalize(self):
         
@@ -1328,116 +2462,148 @@ class Series:
         #TODO: settings for new connection
         #return get_mongo_db()
 
-    @timeit("commons.Series.update_series_list", stats_only=True)
-    def update_series_list(self):
-
-        #if not self.dataset_finalized:
-        #    self.update_dataset_lists_finalize()
+    def is_first_load(self):
+        """Return True for the first load of a dataset
         
-        keys = [s['key'] for s in self.series_list]
-
+        The first load is enabled by fetcher.first_load and verified once, 
+        before the first write: the dataset must not have stored series.
+        """
+        if self.first_load is None:
+            self.first_load = False
+            if self.fetcher.first_load:
+                query = {'provider_name': self.provider_name,
+                         'dataset_code': self.dataset_code}
+                doc = self.get_db()[constants.COL_SERIES].find_one(query, {"_id": True})
+                self.first_load = doc is None
+                if self.first_load:
+                    msg = "first load for provider[%s] - dataset[%s]"
+                    logger.info(msg % (self.provider_name, self.dataset_code))
+        return self.first_load
+
+    def get_old_series(self, keys, projection=None):
+        if self.is_first_load():
+            return {}
         query = {
             'provider_name': self.provider_name,
             'dataset_code': self.dataset_code,
             'key': {'$in': keys}
         }
+        with stages.timer("lookup"):
+            cursor = self.get_db()[constants.COL_SERIES].find(query, projection)
+            return {s['key']:s for s in cursor}
 
-        db = self.get_db()
-        cursor = db[constants.COL_SERIES].find(query)
+    def get_old_documents(self, ids):
+        with stages.timer("lookup"):
+            cursor = self.get_db()[constants.COL_SERIES].find({"_id": {"$in": ids}})
+            return {s['_id']: s for s in cursor}
 
-        old_series = {s['key']:s for s in cursor}
+    def count_operation(self, operation):
+        if isinstance(operation, InsertOne):
+            self.count_inserts += 1
+        elif isinstance(operation, ReplaceOne):
+            self.count_updates += 1
 
-        bulk_requests = db[constants.COL_SERIES].initialize_ordered_bulk_op()
-        bulk_requests_archives = db[constants.COL_SERIES_ARCHIVES].initialize_ordered_bulk_op()
-        is_operation = False
-        is_operation_archives = False
+    def bulk_write(self, bulk_requests, bulk_requests_archives, ordered=True):
         
-        for bson in self.series_list:
-            
-            key = bson['key']
-
-            if not "version" in bson:
-                bson["version"] = 0
-
-            if not bson.get("slug", None):
-                txt = "-".join([self.provider_name, self.dataset_code, key])
-                bson['slug'] = slugify(txt, word_boundary=False, save_order=True)
-            
-            last_update_ds = series_get_last_update_dataset(bson, 
-                                                            last_update=self.dataset.last_update)
-            
-            clean_values(bson)
-            
-            if not key in old_series:
-                series_verify(bson)
-                bson["last_update_ds"] = last_update_ds 
-                bson["last_update_widu"] = clean_datetime()
-                series_set_codelists(bson, self.dataset.codelists)
-                if not IS_SCHEMAS_VALIDATION_DISABLE:
-                    schemas.series_schema(bson)
-                bulk_requests.insert(bson)
-                is_operation = True
-                self.count_inserts += 1
-            else:
-                old_bson = old_series[key]
-                series_verify(bson, old_bson=old_bson)
-                clean_values(old_bson)
-                
-                _id = old_bson.pop('_id')
-                tags = old_bson.pop('tags', None)
-
-                if series_is_changed(bson, old_bson): 
-                    old_bson["tags"] = tags
-                    if not "version" in old_bson:
-                        old_bson["version"] = 0
-                    old_version = old_bson["version"]
-                    bulk_requests_archives.insert(series_archives_store(old_bson))
-                    is_operation = True
-                    is_operation_archives = True
-                    self.count_updates += 1
-                    bson["tags"] = tags
-                    bson["last_update_ds"] = last_update_ds 
-                    bson["last_update_widu"] = clean_datetime()
-                    bson["version"] = old_version + 1
-                    
-                    series_set_codelists(bson, self.dataset.codelists)
-                    
-                    if not IS_SCHEMAS_VALIDATION_DISABLE:
-                        schemas.series_schema(bson)
-                    
-                    bson["_id"] = _id
-                    bulk_requests.find({"_id": _id}).replace_one(bson)
-                else:
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug("series[%s] not changed" % old_bson["slug"])                    
-
-        result = None        
-        if is_operation is True:
+        if bulk_requests:
             try:
+                collection = self.get_db()[constants.COL_SERIES]
+                if self.first_load:
+                    '''Inserts only: unordered and not journaled'''
+                    collection = collection.with_options(write_concern=WriteConcern(w=1, j=False))
+                    ordered = False
+                
                 @timeit("commons.Series.update_series_list.execute")
                 def _execute():
-                    bulk_requests.execute()
+                    collection.bulk_write(bulk_requests, ordered=ordered)
+                start = time.time()
                 _execute()
+                duration = time.time() - start
+                stages.add("bulk_execute", duration, operations=len(bulk_requests))
+                if self.bulk_controller:
+                    self.bulk_size = self.bulk_controller.update(len(bulk_requests),
+                                                                 self.bulk_controller.measure(bulk_requests),
+                                                                 duration)
             except pymongo.errors.BulkWriteError as err:
                 self.dataset.enable = False
                 self.dataset.metadata["disable_reason"] = "critical bulk error"
                 logger.critical(str(err.details))
                 raise
 
-        if is_operation_archives is True:
+        if bulk_requests_archives:
             try:
                 @timeit("commons.Series.update_series_list.execute_archives")
                 def _execute_archives():
-                    bulk_requests_archives.execute()
+                    self.get_db()[constants.COL_SERIES_ARCHIVES].bulk_write(bulk_requests_archives,
+                                                                            ordered=ordered)
+                start = time.time()
                 _execute_archives()
+                stages.add("archives_execute", time.time() - start, 
+                           operations=len(bulk_requests_archives))
             except pymongo.errors.BulkWriteError as err:
                 #self.dataset.enable = False
                 #self.dataset.metadata["disable_reason"] = "critical bulk error"
                 logger.critical(str(err.details))
                 raise
+
+    @timeit("commons.Series.update_series_list", stats_only=True)
+    def update_series_list(self):
+
+        #if not self.dataset_finalized:
+        #    self.update_dataset_lists_finalize()
+        
+        keys = [s['key'] for s in self.series_list]
+
+        old_series = self.get_old_series(keys, 
+                                         projection=SERIES_LOOKUP_PROJECTION)
+
+        bulk_requests = []
+        bulk_requests_archives = []
+        
+        changed_series = []
+        
+        for bson in self.series_list:
+            
+            last_update_ds = series_prepare(bson, 
+                                            self.provider_name, 
+                                            self.dataset_code,
+                                            last_update=self.dataset.last_update)
+            
+            old = old_series.get(bson['key'])
+            
+            if old and old.get("hash") == bson["hash"]:
+                series_verify(bson)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("series[%s] not changed" % bson["slug"])
+            elif old:
+                changed_series.append((bson, last_update_ds))
+            else:
+                operation, _ = update_series_list_unit(bson,
+                                                       last_update_ds=last_update_ds,
+                                                       codelists=self.dataset.codelists)
+                bulk_requests.append(operation)
+                self.count_operation(operation)
+        
+        if changed_series:
+            '''Load full documents only for series with a different hash'''
+            ids = [old_series[bson["key"]]["_id"] for bson, _ in changed_series]
+            old_docs = self.get_old_documents(ids)
+        
+            for bson, last_update_ds in changed_series:
+                old_bson = old_docs[old_series[bson["key"]]["_id"]]
+                operation, archive = update_series_list_unit(bson,
+                                                             old_bson=old_bson,
+                                                             last_update_ds=last_update_ds,
+                                                             codelists=self.dataset.codelists)
+                if operation:
+                    bulk_requests.append(operation)
+                    self.count_operation(operation)
+                if archive:
+                    bulk_requests_archives.append(archive)
+
+        self.bulk_write(bulk_requests, bulk_requests_archives)
                  
         self.series_list = deque()
-        return result
 
 
 class CodeDict():
@@ -18,6 +18,7 @@ from widukind_common import errors
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats.utils import Downloader, clean_datetime
+from dlstats.observations import Observations
 from dlstats import constants
 
 VERSION = 2
@@ -274,7 +275,8 @@ class BEA(Fetcher):
             download = Downloader(url=url,
                                   filename=filename,
                                   store_filepath=self.store_path,
-                                  use_existing_file=self.use_existing_file)
+                                  use_existing_file=self.use_existing_file,
+                                  client=self.requests_client)
             
             filepath = download.get_filepath()
             #self.for_delete.append(filepath)
@@ -357,7 +359,8 @@ class BEA(Fetcher):
             download = Downloader(url=url,
                                   filename=filename,
                                   store_filepath=self.store_path,
-                                  use_existing_file=self.use_existing_file)
+                                  use_existing_file=self.use_existing_file,
+                                  client=self.requests_client)
             filepath = download.get_filepath()
             #self.for_delete.append(filepath)        
 
@@ -551,7 +554,7 @@ class BeaData(SeriesIterator):
         dimensions = {}
         
         series = {}
-        series_values = [] 
+        series_values = Observations()
 
         series_key = "%s-%s" % (row[2], self.frequency)
         series_name = "%s - %s" % (self.name, constants.FREQUENCIES_DICT[self.frequency])
@@ -580,12 +583,7 @@ class BeaData(SeriesIterator):
         series['attributes'] = {}
         
         for v in row[3:]:
-            value = {
-                'attributes': None,
-                'period': str(start_date),
-                'value': str(v)
-            }
-            series_values.append(value)
+            series_values.append(str(start_date), str(v))
             start_date += 1
 
         series['values'] = series_values
@@ -16,6 +16,7 @@ from widukind_common import errors
 
 from dlstats import constants
 from dlstats.utils import Downloader, get_ordinal_from_period
+from dlstats.observations import Observations
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 
 VERSION = 4
@@ -269,7 +270,8 @@ class BIS(Fetcher):
     def _get_agenda(self):
         download = Downloader(url=AGENDA['url'],
                               filename=AGENDA['filename'],
-                              store_filepath=self.store_path)
+                              store_filepath=self.store_path,
+                              client=self.requests_client)
         filepath = download.get_filepath()        
 
         with open(filepath, 'rb') as fp:
@@ -427,7 +429,10 @@ class BIS_Data(SeriesIterator):
             download = Downloader(url=self.url,
                                   store_filepath=self.store_path, 
                                   filename=self.filename,
-                                  use_existing_file=self.fetcher.use_existing_file)
+                                  use_existing_file=self.fetcher.use_existing_file,
+                                  conditional=True,
+                                  preallocate=True,
+                                  client=self.fetcher.requests_client)
             
             zip_filepath = download.get_filepath()
             self.fetcher.for_delete.append(zip_filepath)
@@ -497,15 +502,10 @@ class BIS_Data(SeriesIterator):
 
         series_name = " - ".join([row[d].split(":")[1] for d in self.dimension_keys])
 
-        values = []
+        values = Observations()
         
         for period in self.periods:
-            value = {
-                'attributes': None,
-                'period': period,
-                'value': row[period]
-            }
-            values.append(value)
+            values.append(period, row[period])
         
         bson = {'provider_name': self.dataset.provider_name,
                 'dataset_code': self.dataset.dataset_code,
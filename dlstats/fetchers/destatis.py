@@ -158,7 +158,8 @@ class DESTATIS_Data(SeriesIterator):
 
         url = "https://www.destatis.de/sddsplus/%s.xml" % self.dataset_code
         download = Downloader(url=url, 
-                              filename="data-%s.xml" % self.dataset_code)
+                              filename="data-%s.xml" % self.dataset_code,
+                              client=self.fetcher.requests_client)
 
         self.xml_data = XMLData(provider_name=self.provider_name,
                                 dataset_code=self.dataset_code,
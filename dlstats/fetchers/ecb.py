@@ -68,6 +68,10 @@ frequencies_rejected = [
 
 class ECB(Fetcher):
     
+    PREFETCH_PARTITIONS = 4
+    
+    HTTP_POLICY = {"rate": 5.0, "burst": 4}
+    
     def __init__(self, **kwargs):        
         super().__init__(provider_name='ECB', version=VERSION, **kwargs)
 
@@ -86,8 +90,6 @@ class ECB(Fetcher):
         self._categoryschemes = None
         self._categorisations = None
         self._concepts = None
-        
-        #self.requests_client = requests.Session()
 
     def _load_structure(self, force=False):
         """Load structure and build data_tree
@@ -103,7 +105,8 @@ class ECB(Fetcher):
                                     url=url, 
                                     filename="dataflow.xml",
                                     headers=SDMX_METADATA_HEADERS,
-                                    use_existing_file=self.use_existing_file)
+                                    use_existing_file=self.use_existing_file,
+                                    client=self.requests_client)
         filepath = download.get_filepath()
         self.for_delete.append(filepath)
         self.xml_dsd.process(filepath)
@@ -114,7 +117,8 @@ class ECB(Fetcher):
                                     url=url, 
                                     filename="categoryscheme.xml",
                                     headers=SDMX_METADATA_HEADERS,
-                                    use_existing_file=self.use_existing_file)
+                                    use_existing_file=self.use_existing_file,
+                                    client=self.requests_client)
         filepath = download.get_filepath()
         self.for_delete.append(filepath)
         self.xml_dsd.process(filepath)
@@ -125,7 +129,8 @@ class ECB(Fetcher):
                                     url=url, 
                                     filename="categorisation.xml",
                                     headers=SDMX_METADATA_HEADERS,
-                                    use_existing_file=self.use_existing_file)
+                                    use_existing_file=self.use_existing_file,
+                                    client=self.requests_client)
         filepath = download.get_filepath()
         self.for_delete.append(filepath)
         self.xml_dsd.process(filepath)
@@ -136,7 +141,8 @@ class ECB(Fetcher):
                                     url=url, 
                                     filename="conceptscheme.xml",
                                     headers=SDMX_METADATA_HEADERS,
-                                    use_existing_file=self.use_existing_file)
+                                    use_existing_file=self.use_existing_file,
+                                    client=self.requests_client)
         filepath = download.get_filepath()
         self.for_delete.append(filepath)
         
@@ -201,7 +207,8 @@ class ECB(Fetcher):
     def _parse_agenda(self):
         download = utils.Downloader(store_filepath=self.store_path,
                               url="http://www.ecb.europa.eu/press/calendars/statscal/html/index.en.html",
-                              filename="statscall.html")
+                              filename="statscall.html",
+                              client=self.requests_client)
         filepath = download.get_filepath()
         with open(filepath, 'rb') as fp:
             agenda = lxml.html.parse(fp)
@@ -286,7 +293,8 @@ class ECB_Data(SeriesIterator):
                                     url=url, 
                                     filename="dsd-%s.xml" % self.dataset_code,
                                     headers=SDMX_METADATA_HEADERS,
-                                    use_existing_file=self.fetcher.use_existing_file)
+                                    use_existing_file=self.fetcher.use_existing_file,
+                                    client=self.fetcher.requests_client)
         filepath = download.get_filepath()
         self.fetcher.for_delete.append(filepath)
         self.xml_dsd.process(filepath)
@@ -307,29 +315,9 @@ class ECB_Data(SeriesIterator):
         
         position, _key, dimension_values = select_dimension(dimension_keys, dimensions)
         
-        count_dimensions = len(dimension_keys)
+        partitions = self._get_partitions(len(dimension_keys), position, dimension_values)
         
-        for dimension_value in dimension_values:
-            
-            key = get_key_for_dimension(count_dimensions, position, dimension_value)
-
-            #http://sdw-wsrest.ecb.int/service/data/IEAQ/A............
-            url = "http://sdw-wsrest.ecb.int/service/data/%s/%s" % (self.dataset_code, key)
-            if not self._is_good_url(url, good_codes=[200, HTTP_ERROR_NOT_MODIFIED]):
-                print("bypass url[%s]" % url)
-                continue
-            
-            headers = SDMX_DATA_HEADERS
-            
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))               
-            download = Downloader(url=url, 
-                                  filename=filename,
-                                  store_filepath=self.store_path,
-                                  headers=headers,
-                                  use_existing_file=self.fetcher.use_existing_file,
-                                  #client=self.fetcher.requests_client
-                                  )
-            filepath, response = download.get_filepath_and_response()
+        for (key, url), (filepath, response) in self.prefetch(partitions, self._download_partition):
 
             if filepath and os.path.exists(filepath):
                 self.fetcher.for_delete.append(filepath)
@@ -346,7 +334,41 @@ class ECB_Data(SeriesIterator):
             for row, err in self.xml_data.process(filepath):
                 yield row, err
 
+            self.partition_done(key)
+
         yield None, None
+
+    def _get_partitions(self, count_dimensions, position, dimension_values):
+        """Yield (key, url) for each value of the selected dimension"""
+        
+        for dimension_value in dimension_values:
+            
+            key = get_key_for_dimension(count_dimensions, position, dimension_value)
+
+            if self.is_partition_committed(key):
+                continue
+
+            #http://sdw-wsrest.ecb.int/service/data/IEAQ/A............
+            url = "http://sdw-wsrest.ecb.int/service/data/%s/%s" % (self.dataset_code, key)
+            if not self._is_good_url(url, good_codes=[200, HTTP_ERROR_NOT_MODIFIED]):
+                print("bypass url[%s]" % url)
+                continue
+            
+            yield key, url
+
+    def _download_partition(self, partition):
+        key, url = partition
+        
+        headers = SDMX_DATA_HEADERS
+        
+        filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))               
+        download = Downloader(url=url, 
+                              filename=filename,
+                              store_filepath=self.store_path,
+                              headers=headers,
+                              use_existing_file=self.fetcher.use_existing_file,
+                              client=self.fetcher.requests_client)
+        return download.get_filepath_and_response()
                         
     def _set_dataset(self):
         dataset = dataset_converter(self.xml_dsd, self.dataset_code)
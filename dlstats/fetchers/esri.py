@@ -5,7 +5,6 @@ Created on Fri Oct 16 10:59:20 2015
 @author: salimeh
 """
 
-import time
 from datetime import datetime
 from urllib.parse import urljoin
 import logging
@@ -13,9 +12,10 @@ import re
 
 import pandas
 from lxml import etree
-import requests
 
 from dlstats.utils import Downloader, get_ordinal_from_period, make_store_path
+from dlstats import periods
+from dlstats.http_policy import http_get
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, Categories
 
 VERSION = 2
@@ -30,25 +30,6 @@ INDEX_URL = 'http://www.esri.cao.go.jp/index-e.html'
 FREQUENCIES_SUPPORTED = ["A", "Q"]
 FREQUENCIES_REJECTED = []
 
-def retry(tries=1, sleep_time=2):
-    """Retry calling the decorated function
-    :param tries: number of times to try
-    :type tries: int
-    """
-    def try_it(func):
-        def f(*args,**kwargs):
-            attempts = 0
-            while True:
-                try:
-                    return func(*args,**kwargs)
-                except Exception as e:
-                    attempts += 1
-                    if attempts > tries:
-                        raise e
-                    time.sleep(sleep_time)
-        return f
-    return try_it
-
 def parse_quarter(quarter_str):
     if quarter_str == '1- 3':
         quarter = 1
@@ -139,12 +120,11 @@ def parse_dates(column):
 
     return (freq, start_date, end_date, first_row, last_row)
 
-@retry(tries=3, sleep_time=2)
-def download_page(url):
+def download_page(url, client=None):
     
     url = url.strip()
     
-    response = requests.get(url)
+    response = http_get(client, url)
 
     if not response.ok:
         msg = "download url[%s] - status_code[%s] - reason[%s]" % (url, 
@@ -170,21 +150,21 @@ def make_dataset(anchor, url):
             'doc_href': None,
             'release_date': release_date}
     
-def parse_esri_site():
+def parse_esri_site(client=None):
     url = INDEX_URL
     # general index
-    page = download_page(url)
+    page = download_page(url, client=client)
     html = etree.HTML(page)
     uls = html.findall('.//ul[@class="bulletList"]')
-    sna = parse_sna(uls[0], url)
+    sna = parse_sna(uls[0], url, client=client)
 #    bs = parse_business_statistics(uls[1])
     site_tree = [sna]
 #   site_tree = [sna, bs]
     return site_tree
 
-def parse_sna(ul,url):
+def parse_sna(ul,url, client=None):
     anchors = ul.findall('.//li/a')
-    qgdp = parse_qgdp(urljoin(url,anchors[0].get('href')))
+    qgdp = parse_qgdp(urljoin(url,anchors[0].get('href')), client=client)
 #    parse_capital_stock(anchors[2].get('href'))
     branch = {'name': 'National accounts of Japan',
               'category_code': 'SNA',
@@ -205,27 +185,27 @@ def parse_business_statistics(ul):
               'children': [bc, mo, cc, bo, cb]}
     return branch
 
-def parse_qgdp(url):
+def parse_qgdp(url, client=None):
     # quarterly estimate of GDP
-    page = download_page(url)
+    page = download_page(url, client=client)
     # find latest data
     html = etree.HTML(page)
     # release archive
     anchor = html.find('.//h2[2]/a')
     url = urljoin(url,anchor.get('href'))
     # Release archive (toukei_top.html)
-    page = download_page(url)
+    page = download_page(url, client=client)
     html = etree.HTML(page)
     anchor = html.find('.//ul[@class="bulletList ml20"]/li/a')
     # Go to release archive
     url = urljoin(url, anchor.get('href'))
-    page = download_page(url)
+    page = download_page(url, client=client)
     # find latest data
     html = etree.HTML(page)
     anchor = html.find('.//table[@class="tableBase"]/tbody/tr/td[2]/a')
     # Go to latest release
     url = urljoin(url, anchor.get('href'))
-    page = download_page(url)
+    page = download_page(url, client=client)
     # find urls
     html = etree.HTML(page)
     titles = html.findall('.//h3')
@@ -474,7 +454,7 @@ class Esri(Fetcher):
             categories.append(_category)
         
         try:
-            for data in parse_esri_site():
+            for data in parse_esri_site(client=self.requests_client):
                 make_node(data)
         except Exception as err:
             logger.error(err)   
@@ -566,7 +546,8 @@ class EsriData:
         download = Downloader(url=self.dataset_url, 
                               filename=self.dataset_code,
                               store_filepath=self.store_path,
-                              use_existing_file=self.fetcher.use_existing_file)
+                              use_existing_file=self.fetcher.use_existing_file,
+                              client=self.fetcher.requests_client)
         filepath = download.get_filepath()
         self.fetcher.for_delete.append(filepath)
         return filepath
@@ -658,10 +639,10 @@ class EsriData:
     def clean_field(self, bson):
 
         if not "start_ts" in bson or not bson.get("start_ts"):
-            bson["start_ts"] = pandas.Period(ordinal=bson["start_date"], freq=bson["frequency"]).start_time.to_datetime()
+            bson["start_ts"] = periods.ordinal_to_datetime(bson["start_date"], bson["frequency"])
 
         if not "end_ts" in bson or not bson.get("end_ts"):
-            bson["end_ts"] = pandas.Period(ordinal=bson["end_date"], freq=bson["frequency"]).end_time.to_datetime()
+            bson["end_ts"] = periods.ordinal_to_datetime(bson["end_date"], bson["frequency"], how="end")
         
         return bson
 
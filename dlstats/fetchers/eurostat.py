@@ -144,7 +144,8 @@ class Eurostat(Fetcher):
         download = Downloader(url=self.url_table_of_contents, 
                               filename="table_of_contents.xml",
                               store_filepath=self.store_path,
-                              use_existing_file=self.use_existing_file)
+                              use_existing_file=self.use_existing_file,
+                              client=self.requests_client)
         filepath = download.get_filepath()
         
         categories = []
@@ -331,6 +332,7 @@ class Eurostat(Fetcher):
 
         selected_datasets = {s['dataset_code'] : s for s in cursor}
 
+        dataset_codes = []
         for dataset in datasets_list:
             dataset_code = dataset["dataset_code"]
             
@@ -338,19 +340,13 @@ class Eurostat(Fetcher):
             last_update_from_dataset = selected_datasets.get(dataset_code, {}).get('last_update')
              
             if (dataset_code not in selected_datasets) or (last_update_from_catalog > last_update_from_dataset):
-                try:
-                    self.wrap_upsert_dataset(dataset_code)
-                except Exception as err:
-                    if isinstance(err, errors.MaxErrors):
-                        raise
-                    msg = "error for provider[%s] - dataset[%s]: %s"
-                    logger.critical(msg % (self.provider_name, 
-                                           dataset_code, 
-                                           str(err)))
+                dataset_codes.append(dataset_code)
             else:
                 msg = "bypass update - provider[%s] - dataset[%s] - last-update-dataset[%s] - last-update-catalog[%s]"
                 logger.info(msg % (self.provider_name, dataset_code, last_update_from_dataset, last_update_from_catalog))
 
+        return self.upsert_datasets(dataset_codes)
+
 
 class EurostatData(SeriesIterator):
 
@@ -370,7 +366,10 @@ class EurostatData(SeriesIterator):
         download = Downloader(url=self.dataset_url, 
                               filename="data-%s.zip" % self.dataset_code,
                               store_filepath=self.store_path,
-                              use_existing_file=self.fetcher.use_existing_file)
+                              use_existing_file=self.fetcher.use_existing_file,
+                              conditional=True,
+                              preallocate=True,
+                              client=self.fetcher.requests_client)
         
         filepaths = (extract_zip_file(download.get_filepath()))
         dsd_fp = filepaths[self.dataset_code + ".dsd.xml"]        
@@ -1310,7 +1310,9 @@ class FED_Data(SeriesIterator):
         download = Downloader(url=self.url, 
                               store_filepath=self.store_path,
                               filename="data-%s.zip" % self.dataset_code,
-                              use_existing_file=self.fetcher.use_existing_file)
+                              use_existing_file=self.fetcher.use_existing_file,
+                              conditional=True,
+                              client=self.fetcher.requests_client)
         zip_filepath = download.get_filepath()
         self.fetcher.for_delete.append(zip_filepath)
         
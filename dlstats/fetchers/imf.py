@@ -6,14 +6,15 @@ from datetime import datetime
 from re import match
 import logging
 
-import requests
 from lxml import etree
 
 from widukind_common import errors
 
 from dlstats.utils import Downloader, get_ordinal_from_period, clean_datetime, clean_key, clean_dict
+from dlstats.observations import Observations
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats import constants
+from dlstats.http_policy import http_get
 from dlstats.xml_utils import (XMLStructure_2_0 as XMLStructure, 
                                XMLCompactData_2_0_IMF as XMLData,
                                dataset_converter,
@@ -672,6 +673,10 @@ CATEGORIES = [
 
 class IMF(Fetcher):
 
+    PREFETCH_PARTITIONS = 4
+
+    HTTP_POLICY = {"rate": 2.0, "burst": 4}
+
     def __init__(self, **kwargs):        
         super().__init__(provider_name='IMF', version=VERSION, **kwargs)
 
@@ -682,8 +687,6 @@ class IMF(Fetcher):
                                   website='http://www.imf.org/',
                                   terms_of_use='http://www.imf.org/external/terms.htm',
                                   fetcher=self)
-        
-        self.requests_client = requests.Session()
 
     def build_data_tree(self):
         
@@ -774,28 +777,11 @@ class IMF_XML_Data(SeriesIterator):
         
         position, _key, dimension_values = select_dimension(dimension_keys, dimensions, choice="max")
         
-        count_dimensions = len(dimension_keys)
+        partitions = self._get_partitions(len(dimension_keys), position, dimension_values)
         
-        for dimension_value in dimension_values:
-            '''Pour chaque valeur de la dimension, generer une key d'url'''
+        for key, (filepath, response) in self.prefetch(partitions, self._download_partition):
             
             local_count = 0
-                        
-            sdmx_key = []
-            for i in range(count_dimensions):
-                if i == position:
-                    sdmx_key.append(dimension_value)
-                else:
-                    sdmx_key.append(".")
-            key = "".join(sdmx_key)
-
-            url = "%s/%s" % (self._get_url_data(), key)
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
-            download = Downloader(url=url, 
-                                  filename=filename,
-                                  store_filepath=self.store_path,
-                                  client=self.fetcher.requests_client)            
-            filepath, response = download.get_filepath_and_response()
 
             if filepath:
                 self.fetcher.for_delete.append(filepath)
@@ -809,12 +795,42 @@ class IMF_XML_Data(SeriesIterator):
                 yield row, err
                 local_count += 1
                 
+            self.partition_done(key)
+
             if local_count >= 2999:
                 logger.warning("TODO: VRFY - series > 2999 for provider[IMF] - dataset[%s] - key[%s]" % (self.dataset_code, key))
 
             #self.dataset.update_database(save_only=True)
         
         yield None, None
+
+    def _get_partitions(self, count_dimensions, position, dimension_values):
+        """Yield the key of each value of the selected dimension"""
+        
+        for dimension_value in dimension_values:
+            '''Pour chaque valeur de la dimension, generer une key d'url'''
+                        
+            sdmx_key = []
+            for i in range(count_dimensions):
+                if i == position:
+                    sdmx_key.append(dimension_value)
+                else:
+                    sdmx_key.append(".")
+            key = "".join(sdmx_key)
+
+            if self.is_partition_committed(key):
+                continue
+            
+            yield key
+
+    def _download_partition(self, key):
+        url = "%s/%s" % (self._get_url_data(), key)
+        filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+        download = Downloader(url=url, 
+                              filename=filename,
+                              store_filepath=self.store_path,
+                              client=self.fetcher.requests_client)            
+        return download.get_filepath_and_response()
         
     def build_series(self, bson):
         bson["last_update"] = self.dataset.last_update
@@ -853,7 +869,8 @@ class WeoData(SeriesIterator):
     def weo_urls(self):
         download = Downloader(url='http://www.imf.org/external/ns/cs.aspx?id=28',
                               filename="weo.html",
-                              store_filepath=self.store_path)
+                              store_filepath=self.store_path,
+                              client=self.fetcher.requests_client)
         
         filepath = download.get_filepath()
         with open(filepath, 'rb') as fp:
@@ -876,7 +893,7 @@ class WeoData(SeriesIterator):
         output = []
     
         for link in links:
-            webpage = requests.get(link)
+            webpage = http_get(self.fetcher.requests_client, link)
             html = etree.HTML(webpage.text)
             final_link = html.xpath("//div[@id = 'content']//table//a['href']")
             output.append(link[:-13]+final_link[0].values()[0])
@@ -903,7 +920,8 @@ class WeoData(SeriesIterator):
             download = Downloader(url=url,
                                   store_filepath=self.store_path, 
                                   filename=os.path.basename(url),
-                                  use_existing_file=self.fetcher.use_existing_file)        
+                                  use_existing_file=self.fetcher.use_existing_file,
+                                  client=self.fetcher.requests_client)        
             
             data_filepath = download.get_filepath()
             self.fetcher.for_delete.append(data_filepath)
@@ -992,23 +1010,20 @@ class WeoData(SeriesIterator):
                                         row['Units'])
 
 
-        values = []
+        values = Observations()
         estimation_start = None
+        estimated = {'flag': 'e'}
 
         if row['Estimates Start After']:
             estimation_start = int(row['Estimates Start After'])
             
         for period in self.years:
-            value = {
-                'attributes': None,
-                'period': period,
-                'value': row[period].replace(',' ,'')
-            }
+            attributes = None
             if estimation_start:
                 if int(period) >= estimation_start:
-                    value["attributes"] = {'flag': 'e'}
+                    attributes = estimated
             
-            values.append(value)
+            values.append(period, row[period].replace(',' ,''), attributes)
     
         bson = {
             'provider_name': self.dataset.provider_name,
@@ -1067,7 +1082,8 @@ class WeoGroupsData(SeriesIterator):
     def weo_urls(self):
         download = Downloader(url='http://www.imf.org/external/ns/cs.aspx?id=28',
                               filename="weo.html",
-                              store_filepath=self.store_path)
+                              store_filepath=self.store_path,
+                              client=self.fetcher.requests_client)
         
         filepath = download.get_filepath()
         with open(filepath, 'rb') as fp:
@@ -1090,7 +1106,7 @@ class WeoGroupsData(SeriesIterator):
         output = []
     
         for link in links:
-            webpage = requests.get(link)
+            webpage = http_get(self.fetcher.requests_client, link)
             html = etree.HTML(webpage.text)
             final_link = html.xpath("//div[@id = 'content']//table//a['href']")
             output.append(link[:-13]+final_link[1].values()[0])
@@ -1119,7 +1135,8 @@ class WeoGroupsData(SeriesIterator):
             download = Downloader(url=url,
                                   store_filepath=self.store_path, 
                                   filename=os.path.basename(url),
-                                  use_existing_file=self.fetcher.use_existing_file)        
+                                  use_existing_file=self.fetcher.use_existing_file,
+                                  client=self.fetcher.requests_client)        
             
             data_filepath = download.get_filepath()
             self.fetcher.for_delete.append(data_filepath)
@@ -1195,23 +1212,21 @@ class WeoGroupsData(SeriesIterator):
                                         row['Units'])
 
 
-        values = []
+        values = Observations()
         estimation_start = None
+        estimated = {'flag': 'e'}
 
         if row['Estimates Start After']:
             estimation_start = int(row['Estimates Start After'])
             
         for period in self.years:
-            value = {
-                'attributes': None,
-                'period': period,
-                'value': row[period].replace(',' ,'') if row[period] else ''
-            }
+            attributes = None
             if estimation_start:
                 if int(period) >= estimation_start:
-                    value["attributes"] = {'flag': 'e'}
+                    attributes = estimated
             
-            values.append(value)
+            values.append(period, row[period].replace(',' ,'') if row[period] else '', 
+                          attributes)
     
         bson = {
             'provider_name': self.dataset.provider_name,
@@ -15,7 +15,8 @@ from widukind_common import errors
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats import constants
-from dlstats.utils import Downloader, clean_datetime
+from dlstats.http_policy import http_get
+from dlstats.utils import Downloader, clean_datetime, http_session
 from dlstats.xml_utils import (XMLSDMX_2_1 as XMLSDMX,
                                XMLStructure_2_1 as XMLStructure, 
                                XMLSpecificData_2_1_INSEE as XMLData,
@@ -39,9 +40,9 @@ FREQUENCIES_REJECTED = ["S", "B", "I"]
 
 logger = logging.getLogger(__name__)
 
-def download_page(url):
+def download_page(url, client=None):
     try:
-        response = requests.get(url)
+        response = http_get(client, url)
 
         if not response.ok:
             msg = "download url[%s] - status_code[%s] - reason[%s]" % (url, 
@@ -66,6 +67,10 @@ def download_page(url):
 
 class INSEE(Fetcher):
     
+    PREFETCH_PARTITIONS = 2
+    
+    HTTP_POLICY = {"rate": 1.0, "burst": 2}
+    
     def __init__(self, **kwargs):
         super().__init__(provider_name='INSEE', version=VERSION, **kwargs)
 
@@ -77,9 +82,16 @@ class INSEE(Fetcher):
                                  terms_of_use='http://www.insee.fr/en/service/default.asp?page=rediffusion/rediffusion.htm',
                                  fetcher=self)
         
+        '''Session of the data partitions: no keep-alive with INSEE but 
+        the policy of the fetcher'''
+        self.data_client = http_session(pool_maxsize=self.prefetch_partitions,
+                                        keep_alive=False,
+                                        policy=self.http_policy)
+        
         self.xml_sdmx = XMLSDMX(agencyID=self.provider_name, 
                                 store_filepath=self.store_path,
-                                use_existing_file=self.use_existing_file)
+                                use_existing_file=self.use_existing_file,
+                                client=self.requests_client)
         
         self.xml_dsd = XMLStructure(provider_name=self.provider_name,
                                     sdmx_client=self.xml_sdmx)       
@@ -90,8 +102,6 @@ class INSEE(Fetcher):
         self._categorisations_categories = None
         self._concepts = None
         self._codelists = OrderedDict()
-        
-        self.requests_client = requests.Session()
 
     def _load_structure_dataflows(self, force=False):
         
@@ -204,6 +214,10 @@ class INSEE(Fetcher):
     def load_datasets_first(self):
         self._load_structure_datatree()
         return super().load_datasets_first()
+    
+    def drop_cached_codelists(self):
+        '''The dataset in progress keep its reference (xml_dsd.codelists)'''
+        self._codelists = OrderedDict()
 
     def build_data_tree(self):
         """Build data_tree from structure datas
@@ -432,24 +446,9 @@ class INSEE_Data(SeriesIterator):
         
         logger.info("choice[%s] - filterkey[%s] - count[%s] - provider[%s] - dataset[%s]" % (choice, _key, len(dimension_values), self.provider_name, self.dataset_code))
         
-        for dimension_value in dimension_values:
-            '''Pour chaque valeur de la dimension, generer une key d'url'''
+        partitions = self._get_partitions(count_dimensions, position, dimension_values)
         
-            key = get_key_for_dimension(count_dimensions, position, dimension_value)    
-
-            url = "http://www.bdm.insee.fr/series/sdmx/data/%s/%s" % (self.dataset_code, key)
-            if self._is_good_url(url) is False:
-                logger.warning("bypass not good url[%s]" % url)
-                continue
-            
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
-            download = Downloader(url=url, 
-                                  filename=filename,
-                                  store_filepath=self.store_path,
-                                  use_existing_file=self.fetcher.use_existing_file,
-                                  #NOT USE FOR INSEE client=self.fetcher.requests_client
-                                  )
-            filepath, response = download.get_filepath_and_response()
+        for (key, url), (filepath, response) in self.prefetch(partitions, self._download_partition):
 
             if not response is None:
                 self._add_url_cache(url, response.status_code)
@@ -467,9 +466,40 @@ class INSEE_Data(SeriesIterator):
             for row, err in self.xml_data.process(filepath):
                 yield row, err
 
+            self.partition_done(key)
+
             #self.dataset.update_database(save_only=True)
         
         yield None, None
+
+    def _get_partitions(self, count_dimensions, position, dimension_values):
+        """Yield (key, url) for each value of the selected dimension"""
+        
+        for dimension_value in dimension_values:
+            '''Pour chaque valeur de la dimension, generer une key d'url'''
+        
+            key = get_key_for_dimension(count_dimensions, position, dimension_value)    
+
+            if self.is_partition_committed(key):
+                continue
+
+            url = "http://www.bdm.insee.fr/series/sdmx/data/%s/%s" % (self.dataset_code, key)
+            if self._is_good_url(url) is False:
+                logger.warning("bypass not good url[%s]" % url)
+                continue
+            
+            yield key, url
+
+    def _download_partition(self, partition):
+        key, url = partition
+        
+        filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+        download = Downloader(url=url, 
+                              filename=filename,
+                              store_filepath=self.store_path,
+                              use_existing_file=self.fetcher.use_existing_file,
+                              client=self.fetcher.data_client)
+        return download.get_filepath_and_response()
     
     def _is_updated(self, bson):
         """Verify if series changes
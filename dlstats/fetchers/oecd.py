@@ -2,7 +2,6 @@
 
 import logging
 
-import requests
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats.utils import Downloader, clean_datetime
@@ -39,6 +38,10 @@ FREQUENCIES_REJECTED = []
 
 class OECD(Fetcher):
     
+    PREFETCH_PARTITIONS = 2
+    
+    HTTP_POLICY = {"rate": 1.0, "burst": 2}
+    
     def __init__(self, **kwargs):
         super().__init__(provider_name='OECD', version=VERSION, **kwargs)
         
@@ -50,8 +53,6 @@ class OECD(Fetcher):
                                   terms_of_use='http://www.oecd.org/termsandconditions/', 
                                   fetcher=self)
 
-        self.requests_client = requests.Session()
-
     def build_data_tree(self):
         
         categories = []
@@ -169,26 +170,9 @@ class OECD_Data(SeriesIterator):
         
         position, _key, dimension_values = select_dimension(dimension_keys, dimensions, choice="max")
         
-        count_dimensions = len(dimension_keys)
+        partitions = self._get_partitions(len(dimension_keys), position, dimension_values)
         
-        for dimension_value in dimension_values:
-            
-            sdmx_key = []
-            for i in range(count_dimensions):
-                if i == position:
-                    sdmx_key.append(dimension_value)
-                else:
-                    sdmx_key.append(".")
-            key = "".join(sdmx_key)
-
-            url = "%s/%s" % (self._get_url_data(), key)
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
-            download = Downloader(url=url, 
-                                  filename=filename,
-                                  store_filepath=self.store_path,
-                                  client=self.fetcher.requests_client
-                                  )
-            filepath, response = download.get_filepath_and_response()
+        for key, (filepath, response) in self.prefetch(partitions, self._download_partition):
 
             if filepath:
                 self.fetcher.for_delete.append(filepath)
@@ -201,9 +185,39 @@ class OECD_Data(SeriesIterator):
             for row, err in self.xml_data.process(filepath):
                 yield row, err
 
+            self.partition_done(key)
+
             #self.dataset.update_database(save_only=True)
         
         yield None, None
+
+    def _get_partitions(self, count_dimensions, position, dimension_values):
+        """Yield the key of each value of the selected dimension"""
+        
+        for dimension_value in dimension_values:
+            
+            sdmx_key = []
+            for i in range(count_dimensions):
+                if i == position:
+                    sdmx_key.append(dimension_value)
+                else:
+                    sdmx_key.append(".")
+            key = "".join(sdmx_key)
+
+            if self.is_partition_committed(key):
+                continue
+            
+            yield key
+
+    def _download_partition(self, key):
+        url = "%s/%s" % (self._get_url_data(), key)
+        filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+        download = Downloader(url=url, 
+                              filename=filename,
+                              store_filepath=self.store_path,
+                              client=self.fetcher.requests_client
+                              )
+        return download.get_filepath_and_response()
         
     def build_series(self, bson):
         bson["last_update"] = self.dataset.last_update
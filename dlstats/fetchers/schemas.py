@@ -2,7 +2,12 @@
 
 from datetime import datetime
 
-from voluptuous import All, Length, Schema, Invalid, Optional, Any, Extra, Range
+import random
+
+from voluptuous import (All, Length, Schema, Invalid, 
+                        Optional, Required, Any, Extra, Range, Marker)
+
+from dlstats.observations import Observations
 
 def date_validator(value):
     """Custom validator (only a few types are natively implemented in voluptuous)
@@ -23,8 +28,217 @@ def typecheck(_type, msg=None):
             raise Invalid(msg or ('expected %s' % _type.__name__))
         else:
             return value
+    validator.typecheck = _type
     return validator
 
+def _compile_callable(func):
+    def check(value):
+        try:
+            func(value)
+            return True
+        except Invalid:
+            return False
+    return check
+
+def _compile_dict(schema, required=False, extra=False):
+    """Return check function of a dict schema
+    
+    Literal keys are checked directly, other keys (types, Extra) are
+    matched like voluptuous.
+    """
+    fields = []
+    required_keys = set()
+    generic = []
+    for key, value in schema.items():
+        check = _compile_node(value)
+        if key is Extra:
+            generic.append((lambda k: True, check))
+            continue
+        is_marker = isinstance(key, Marker)
+        _key = key.schema if is_marker else key
+        if isinstance(_key, type):
+            generic.append((lambda k, t=_key: isinstance(k, t), check))
+            continue
+        fields.append((_key, check))
+        if (required and not isinstance(key, Optional)) or isinstance(key, Required):
+            required_keys.add(_key)
+    checks = dict(fields)
+    
+    def check(value):
+        if not isinstance(value, dict):
+            return False
+        for k in required_keys:
+            if not k in value:
+                return False
+        for k, v in value.items():
+            _check = checks.get(k)
+            if _check:
+                if not _check(v):
+                    return False
+                continue
+            for match, _check in generic:
+                if match(k):
+                    if not _check(v):
+                        return False
+                    break
+            else:
+                if not extra:
+                    return False
+        return True
+
+    '''Dict of literal required keys only: one loop without lookup of keys'''
+    if not generic and required_keys == set(checks.keys()):
+        keys = frozenset(required_keys)
+        def check_exact(value):
+            if not isinstance(value, dict) or value.keys() != keys:
+                return False
+            for k, _check in fields:
+                if not _check(value[k]):
+                    return False
+            return True
+        check_exact.fields = fields
+        return check_exact
+
+    return check
+
+def _compile_list(schema):
+    if len(schema) == 0:
+        return lambda value: isinstance(value, list) and len(value) == 0
+    
+    if len(schema) > 1:
+        return _compile_callable(Schema(schema))
+
+    item_check = _compile_node(schema[0])
+    fields = getattr(item_check, "fields", None)
+    
+    if fields:
+        '''List of dict: the whole values array is checked in one loop'''
+        keys = frozenset([k for k, _ in fields])
+        def check_items(value):
+            if not isinstance(value, list):
+                return False
+            for item in value:
+                if not isinstance(item, dict) or item.keys() != keys:
+                    return False
+                for k, _check in fields:
+                    if not _check(item[k]):
+                        return False
+            return True
+        return check_items
+
+    def check(value):
+        if not isinstance(value, list):
+            return False
+        for item in value:
+            if not item_check(item):
+                return False
+        return True
+    return check
+
+def _compile_node(schema):
+    """Return a function returning False if value is not valid for schema"""
+    if isinstance(schema, Schema):
+        if isinstance(schema.schema, dict):
+            return _compile_dict(schema.schema, 
+                                 required=schema.required, 
+                                 extra=bool(schema.extra))
+        return _compile_node(schema.schema)
+
+    if isinstance(schema, dict):
+        return _compile_dict(schema)
+
+    if isinstance(schema, list):
+        return _compile_list(schema)
+
+    if isinstance(schema, type):
+        return lambda value: isinstance(value, schema)
+
+    if schema is None or isinstance(schema, (str, int, float)):
+        return lambda value: value == schema
+
+    if isinstance(schema, All):
+        checks = [_compile_node(s) for s in schema.validators]
+        if len(checks) == 2:
+            first, second = checks
+            return lambda value: first(value) and second(value)
+        return lambda value: all(check(value) for check in checks)
+
+    if isinstance(schema, Any):
+        checks = [_compile_node(s) for s in schema.validators]
+        return lambda value: any(check(value) for check in checks)
+    
+    if isinstance(schema, Length):
+        _min, _max = schema.min, schema.max
+        def check(value):
+            try:
+                size = len(value)
+            except TypeError:
+                return False
+            if _min is not None and size < _min:
+                return False
+            if _max is not None and size > _max:
+                return False
+            return True
+        return check
+
+    if isinstance(schema, Range):
+        _min, _max = schema.min, schema.max
+        min_included = getattr(schema, "min_included", True)
+        max_included = getattr(schema, "max_included", True)
+        def check(value):
+            try:
+                if _min is not None and (value < _min if min_included else value <= _min):
+                    return False
+                if _max is not None and (value > _max if max_included else value >= _max):
+                    return False
+            except TypeError:
+                return False
+            return True
+        return check
+    
+    _type = getattr(schema, "typecheck", None)
+    if _type:
+        return lambda value: isinstance(value, _type)
+
+    if callable(schema):
+        return _compile_callable(schema)
+
+    return _compile_callable(Schema(schema))
+
+class CompiledSchema(object):
+    """Fast validator compiled from a voluptuous Schema
+    
+    The schema is converted once in plain Python check functions. Valid
+    data is returned as is (without the copy done by voluptuous). When a
+    check fails, the voluptuous schema is called to raise the same
+    MultipleInvalid error with the same messages.
+    
+    :param float sample_rate: Fraction of documents validated by sample()
+    """
+
+    def __init__(self, schema, sample_rate=1.0):
+        self.schema = schema
+        self.sample_rate = sample_rate
+        self.check = _compile_node(schema)
+
+    def __call__(self, data):
+        if self.check(data):
+            return data
+        return self.schema(data)
+
+    def is_valid(self, data):
+        return self.check(data)
+
+    def sample(self, data):
+        """Validate a fraction (sample_rate) of the documents"""
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return self(data)
+        return data
+
+def compile_schema(schema, sample_rate=1.0):
+    """Return a :class:`CompiledSchema` for a voluptuous Schema"""
+    return CompiledSchema(schema, sample_rate=sample_rate)
+
 codedict_schema = Schema({Extra: dict})
 
 provider_schema = Schema({
@@ -81,6 +295,8 @@ dataset_schema = Schema({
     'slug': All(str, Length(min=1)),
     'download_first': typecheck(datetime),
     'download_last': typecheck(datetime),
+    Optional('lock_owner'): str,
+    Optional('lock_until'): typecheck(datetime),
     },required=True)
 
 series_value_schema = Schema({
@@ -89,6 +305,24 @@ series_value_schema = Schema({
     'attributes': Any(None, dict),
 }, required=True)
 
+def observations_validator(value):
+    """Validate an Observations container without conversion to list of dict
+    """
+    if not isinstance(value, Observations):
+        raise Invalid('expected Observations')
+    for period in value.periods:
+        if not isinstance(period, str) or not period:
+            raise Invalid('invalid period [%s]' % period)
+    for _value in value.values:
+        if not isinstance(_value, str):
+            raise Invalid('expected str for value [%s]' % _value)
+    if value.empty is not None and not isinstance(value.empty, dict):
+        raise Invalid('expected None or dict for empty attributes')
+    for attributes in value.attributes.values():
+        if not isinstance(attributes, dict):
+            raise Invalid('expected dict for attributes')
+    return value
+
 series_schema = Schema({
     'version': All(int, Range(min=0)),
     'last_update_ds': typecheck(datetime),
@@ -101,14 +335,17 @@ series_schema = Schema({
     'end_date': int,
     'start_ts': typecheck(datetime),
     'end_ts': typecheck(datetime),    
-    'values': [series_value_schema],
+    'values': Any(observations_validator, [series_value_schema]),
     'attributes': Any(None, dict),
     'dimensions': {str: str},
     'codelists': Any(None, dict),
     'frequency': All(str, Length(min=1)),
     Optional('notes'): Any(None, str),
     Optional('tags'): Any(None, list),
+    Optional('hash'): str,
     'slug': All(str, Length(min=1)),
 }, required=True)
 
+series_value_validator = compile_schema(series_value_schema)
 
+series_validator = compile_schema(series_schema)
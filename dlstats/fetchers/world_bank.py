@@ -2,14 +2,12 @@
 
 import logging
 from datetime import datetime
-import time
 from collections import OrderedDict
 import os
 import json
 import hashlib
 import zipfile
 
-import requests
 from slugify import slugify
 
 import pandas
@@ -45,27 +43,10 @@ DATASETS = {
     },
 }
 
-def retry(tries=1, sleep_time=2):
-    """Retry calling the decorated function
-    :param tries: number of times to try
-    :type tries: int
-    """
-    def try_it(func):
-        def f(*args,**kwargs):
-            attempts = 0
-            while True:
-                try:
-                    return func(*args,**kwargs)
-                except Exception as e:
-                    attempts += 1
-                    if attempts > tries:
-                        raise e
-                    time.sleep(sleep_time)
-        return f
-    return try_it
-
 class WorldBankAPI(Fetcher):
     
+    HTTP_POLICY = {"max_retries": 5, "rate": 2.0, "burst": 2}
+    
     def __init__(self, **kwargs):
         super().__init__(provider_name='WORLDBANK', version=VERSION, **kwargs)
         
@@ -79,8 +60,6 @@ class WorldBankAPI(Fetcher):
 
         self.api_url = 'http://api.worldbank.org/v2/'
         
-        self.requests_client = requests.Session()
-        
         self.blacklist = [
             '13', # Enterprise Surveys
             '26', # Corporate scorecard # datacatalog id="89"    
@@ -106,7 +85,6 @@ class WorldBankAPI(Fetcher):
         self._available_countries = None
         self._available_countries_by_name = None
 
-    @retry(tries=5, sleep_time=2)
     def download_or_raise(self, url, params={}):
         
         if not os.path.exists(self.store_path):
@@ -116,17 +94,21 @@ class WorldBankAPI(Fetcher):
         filepath = os.path.abspath(os.path.join(self.store_path, filename))
         if os.path.exists(filepath):
             os.remove(filepath)
-                
-        response = self.requests_client.get(url, params=params, stream=True)
-        #response = requests.get(url, params=params)
         
-        logger.info("download url[%s] - filepath[%s]" %  (response.url, filepath))
-
-        response.raise_for_status()
-
-        with open(filepath, mode='wb') as f:
-            for chunk in response.iter_content():
-                f.write(chunk)
+        def download():
+            response = self.requests_client.get(url, params=params, stream=True)
+            #response = requests.get(url, params=params)
+            
+            logger.info("download url[%s] - filepath[%s]" %  (response.url, filepath))
+    
+            response.raise_for_status()
+    
+            with open(filepath, mode='wb') as f:
+                for chunk in response.iter_content(chunk_size=constants.DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            return response
+        
+        self.http_policy.call(url, download)
                 
         self.for_delete.append(filepath)
                 
@@ -819,7 +801,8 @@ class ExcelData(SeriesIterator):
         download = Downloader(url=self.url, 
                               filename=filename,
                               store_filepath=self.get_store_path(),
-                              use_existing_file=self.fetcher.use_existing_file,)
+                              use_existing_file=self.fetcher.use_existing_file,
+                              client=self.fetcher.requests_client)
         self.filepath, response = download.get_filepath_and_response()
         
         if self.filepath:
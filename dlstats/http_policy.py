@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""Rate limit and retry policy of the HTTP requests
+
+- a token bucket by host, shared by the threads of the process
+- exponential backoff with full jitter for the connection errors and the 
+  status of RETRY_STATUS
+- the Retry-After of a response suspends all the requests to its host
+
+The policy of a fetcher is attached to its session (see utils.http_session)
+and found by :func:`get_policy`:
+
+>>> response = http_get(fetcher.requests_client, url)
+"""
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+
+from dlstats import constants
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+class TokenBucket:
+    """rate requests by second with bursts of burst requests
+    
+    With rate=None, only the delays of defer() apply.
+    """
+    
+    def __init__(self, rate=None, burst=1):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.not_before = 0.0
+        
+    def configure(self, rate=None, burst=1):
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1, burst)
+            self.tokens = min(self.tokens, self.burst)
+
+    def reserve(self):
+        """Take a token and return the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.not_before - now)
+            if self.rate:
+                self.tokens = min(self.burst, 
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            self.updated = now
+            return wait
+
+    def defer(self, seconds):
+        """No request before seconds"""
+        with self._lock:
+            self.not_before = max(self.not_before, time.monotonic() + seconds)
+
+class HostLimiter:
+    """Token buckets by host
+    
+    The bucket of a host is shared by all the policies of the process: 
+    rate=None (default_policy) never changes it and the strictest rate 
+    given for a host is kept.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {}
+
+    def bucket(self, url, rate=None, burst=1):
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(rate=rate, burst=burst)
+            elif rate and (not bucket.rate or rate < bucket.rate):
+                bucket.configure(rate=rate, burst=burst)
+            return bucket
+
+    def clear(self):
+        with self._lock:
+            self.buckets = {}
+
+limiter = HostLimiter()
+
+def get_retry_after(response):
+    """Seconds of the Retry-After header of response or None"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+class HTTPPolicy:
+    """Rate limit and retry policy
+    
+    :param int max_retries: Retries after the first attempt
+    :param float backoff_factor: The delay before retry N is a random value 
+                                 between 0 and backoff_factor * 2 ** N
+    :param float backoff_max: Max of the delay without Retry-After
+    :param float retry_after_max: Do not retry if Retry-After is greater
+    :param float rate: Requests by second by host (None for no limit)
+    :param int burst: Requests allowed at once by host
+    :param list status_forcelist: HTTP status to retry
+    """
+    
+    def __init__(self, max_retries=None, backoff_factor=None, backoff_max=None, 
+                 retry_after_max=None, rate=None, burst=1,
+                 status_forcelist=RETRY_STATUS, 
+                 limiter=limiter, sleep=time.sleep):
+        self.max_retries = constants.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_factor = constants.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+        self.backoff_max = constants.HTTP_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.retry_after_max = constants.HTTP_RETRY_AFTER_MAX if retry_after_max is None else retry_after_max
+        self.rate = rate
+        self.burst = burst
+        self.status_forcelist = status_forcelist
+        self.limiter = limiter
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.wait = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"retries": self.retries, "wait": round(self.wait, 3)}
+
+    def _sleep(self, seconds, retry=False):
+        with self._lock:
+            self.wait += seconds
+            if retry:
+                self.retries += 1
+        if seconds > 0:
+            self.sleep(seconds)
+
+    def get_backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, 
+                                     self.backoff_factor * (2 ** attempt)))
+
+    def _retry_response(self, response):
+        return getattr(response, "status_code", None) in self.status_forcelist
+
+    def call(self, url, func, max_retries=None):
+        """Return func() with the rate limit of the host of url
+        
+        func makes one request and returns a response or raises. It is 
+        called again for the connection errors, the HTTPError and the 
+        responses with a status of status_forcelist.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        bucket = self.limiter.bucket(url, rate=self.rate, burst=self.burst)
+        attempt = 0
+        while True:
+            self._sleep(bucket.reserve())
+            response = None
+            error = None
+            try:
+                response = func()
+                if not self._retry_response(response) or attempt >= max_retries:
+                    return response
+                reason = "status_code[%s]" % response.status_code
+            except requests.exceptions.HTTPError as err:
+                error = err
+                response = err.response
+                if not self._retry_response(response) or attempt >= max_retries:
+                    raise
+                reason = "status_code[%s]" % response.status_code
+            except RETRY_EXCEPTIONS as err:
+                if attempt >= max_retries:
+                    raise
+                reason = str(err)
+
+            delay = self.get_backoff(attempt)
+            retry_after = get_retry_after(response)
+            if retry_after is not None:
+                if retry_after > self.retry_after_max:
+                    logger.error("retry-after[%s] too long url[%s]" % (retry_after, url))
+                    if error:
+                        raise error
+                    return response
+                '''All the requests to this host (this one included) wait'''
+                bucket.defer(retry_after)
+                delay = 0.0
+            if response is not None:
+                response.close()
+
+            attempt += 1
+            logger.warning("retry %s/%s url[%s] - %s - wait[%.3f seconds]" % (attempt, 
+                                                                              max_retries, 
+                                                                              url, reason, 
+                                                                              retry_after or delay))
+            self._sleep(delay, retry=True)
+
+default_policy = HTTPPolicy()
+
+def get_policy(client=None):
+    """Policy of the session client or default_policy"""
+    return getattr(client, "http_policy", None) or default_policy
+
+def http_get(client, url, **kwargs):
+    """client.get(url, **kwargs) with the policy of client"""
+    client = client or requests
+    return get_policy(client).call(url, lambda: client.get(url, **kwargs))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from bson import BSON
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+'''Commands with the collection name in the first field'''
+COLLECTION_COMMANDS = ["find", "insert", "update", "delete", "count",
+                       "distinct", "aggregate", "findAndModify",
+                       "createIndexes", "dropIndexes", "listIndexes", "drop"]
+
+def bson_size(doc):
+    try:
+        return len(BSON.encode(doc))
+    except Exception:
+        return 0
+
+class CommandMonitor(monitoring.CommandListener):
+    """MongoDB commands counters by collection
+
+    Disabled by default: register() is called by the Fetcher with the
+    mongo_monitor option, and only the clients created after this call
+    are monitored. It is reset for each dataset (Datasets.__init__) and
+    recorded in the mongo field of stats_run:
+
+    - round_trips, duration (seconds, measured by the driver), bytes_sent,
+      bytes_received and failures
+    - by collection: same counters, count by command name and count of
+      inserted, replaced, updated and deleted documents
+
+    The commands and replies are encoded to count bytes_sent and
+    bytes_received only if count_bytes is True.
+    """
+
+    def __init__(self, count_bytes=True):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.count_bytes = count_bytes
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._pending = {}
+            self.collections = {}
+
+    def _collection(self, name):
+        stats = self.collections.get(name)
+        if stats is None:
+            stats = self.collections[name] = {
+                "round_trips": 0, "duration": 0.0,
+                "bytes_sent": 0, "bytes_received": 0, "failures": 0,
+                "commands": {},
+                "inserts": 0, "replaces": 0, "updates": 0, "deletes": 0,
+            }
+        return stats
+
+    def started(self, event):
+        command = event.command
+        name = event.command_name
+        collection = None
+        if name in COLLECTION_COMMANDS:
+            collection = command.get(name)
+        elif name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            collection = "_cmd"
+
+        documents = {}
+        if name == "insert":
+            documents["inserts"] = len(command.get("documents", []))
+        elif name == "update":
+            for update in command.get("updates", []):
+                keys = list(update.get("u", {}).keys())
+                if keys and keys[0].startswith("$"):
+                    documents["updates"] = documents.get("updates", 0) + 1
+                else:
+                    documents["replaces"] = documents.get("replaces", 0) + 1
+        elif name == "delete":
+            documents["deletes"] = len(command.get("deletes", []))
+
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, name)
+            stats = self._collection(collection)
+            stats["round_trips"] += 1
+            if self.count_bytes:
+                stats["bytes_sent"] += bson_size(command)
+            stats["commands"][name] = stats["commands"].get(name, 0) + 1
+            for key, value in documents.items():
+                stats[key] += value
+
+    def _finished(self, event, reply=None, failed=False):
+        with self._lock:
+            item = self._pending.pop((event.connection_id, event.request_id), None)
+            if not item:
+                return
+            stats = self._collection(item[0])
+            stats["duration"] += event.duration_micros / 1000000.0
+            if failed:
+                stats["failures"] += 1
+            if reply and self.count_bytes:
+                stats["bytes_received"] += bson_size(reply)
+
+    def succeeded(self, event):
+        self._finished(event, reply=event.reply)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def snapshot(self):
+        with self._lock:
+            collections = {}
+            totals = {"round_trips": 0, "duration": 0.0,
+                      "bytes_sent": 0, "bytes_received": 0, "failures": 0}
+            for name, stats in self.collections.items():
+                for key in totals.keys():
+                    totals[key] += stats[key]
+                stats = dict(stats)
+                stats["commands"] = dict(stats["commands"])
+                stats["duration"] = round(stats["duration"], 3)
+                collections[name.replace(".", "_")] = stats
+            totals["duration"] = round(totals["duration"], 3)
+            totals["collections"] = collections
+            return totals
+
+command_monitor = CommandMonitor(count_bytes=False)
+
+_registered = False
+
+def register(count_bytes=False):
+    """Register command_monitor for the MongoClient created after this call
+
+    :param bool count_bytes: Also count the BSON size of commands and replies
+    """
+    global _registered
+    if count_bytes:
+        command_monitor.count_bytes = True
+    if not _registered:
+        monitoring.register(command_monitor)
+        _registered = True
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+class Observations:
+    """Array-backed container for the values field of a series
+
+    Periods and values are stored in two parallel lists. Attributes are
+    stored in a sparse dict {position: dict} for observations with
+    attributes only, the other observations use the `empty` value ({} for
+    the SDMX parsers, None for the others).
+
+    The container is used as is by series_clean_field, series_is_changed,
+    series_hash, series_set_codelists and schemas.series_schema and is
+    converted to a list of dict by to_bson() before write.
+
+    Indexing and iteration return new dicts
+    {"period": ..., "value": ..., "attributes": ...} for compatibility.
+    Modifying these dicts does not modify the container.
+    """
+
+    __slots__ = ("periods", "values", "attributes", "empty")
+
+    def __init__(self, empty=None):
+        self.periods = []
+        self.values = []
+        self.attributes = {}
+        self.empty = empty
+
+    @classmethod
+    def from_bson(cls, values, empty=None):
+        """Build a container from a list of dict"""
+        obs = cls(empty=empty)
+        for value in values:
+            obs.append(value["period"], value["value"], value.get("attributes"))
+        return obs
+
+    def append(self, period, value, attributes=None):
+        if attributes:
+            self.attributes[len(self.periods)] = attributes
+        self.periods.append(period)
+        self.values.append(value)
+
+    def get_attributes(self, position):
+        attributes = self.attributes.get(position)
+        if attributes:
+            return attributes
+        if self.empty is None:
+            return None
+        return {}
+
+    def attributes_list(self):
+        return [self.get_attributes(i) for i in range(len(self.periods))]
+
+    def map_attributes(self, func):
+        """Replace each non empty attributes dict by func(attributes)
+
+        A dict shared by several observations is converted once.
+        """
+        results = {}
+        for position, attributes in self.attributes.items():
+            key = id(attributes)
+            if not key in results:
+                results[key] = func(attributes)
+            self.attributes[position] = results[key]
+
+    def reverse(self):
+        last = len(self.periods) - 1
+        self.periods.reverse()
+        self.values.reverse()
+        self.attributes = {last - k: v for k, v in self.attributes.items()}
+
+    def _item(self, position):
+        return {"period": self.periods[position],
+                "value": self.values[position],
+                "attributes": self.get_attributes(position)}
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __bool__(self):
+        return len(self.periods) > 0
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._item(i) for i in range(len(self.periods))[position]]
+        if position < 0:
+            position += len(self.periods)
+        if position < 0 or position >= len(self.periods):
+            raise IndexError("observation index out of range")
+        return self._item(position)
+
+    def __iter__(self):
+        for i in range(len(self.periods)):
+            yield self._item(i)
+
+    def __eq__(self, other):
+        if isinstance(other, Observations):
+            return (self.periods == other.periods
+                    and self.values == other.values
+                    and self.attributes_list() == other.attributes_list())
+        if isinstance(other, list):
+            return self.to_bson() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return "<Observations count[%s]>" % len(self.periods)
+
+    def to_bson(self):
+        return [self._item(i) for i in range(len(self.periods))]
+
+def obs_periods(values):
+    """Return list of periods of a list of dict or of an Observations"""
+    if isinstance(values, Observations):
+        return values.periods
+    return [v["period"] for v in values]
+
+def obs_values(values):
+    if isinstance(values, Observations):
+        return values.values
+    return [v["value"] for v in values]
+
+def obs_attributes(values):
+    if isinstance(values, Observations):
+        return values.attributes_list()
+    return [v.get("attributes") for v in values]
+
+def values_to_bson(values):
+    """Return the values field ready to write"""
+    if isinstance(values, Observations):
+        return values.to_bson()
+    return values
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Conversion of periods to pandas ordinals without pandas.Period
+
+The ordinals are the same as pandas.Period(date_str, freq=freq).ordinal:
+
+- A: years since 1970 (A-DEC)
+- S: seconds since 1970-01-01 (pandas frequency S is the second, "2000-S1"
+  is the first second of 2000-01-01, "2000-S2" of 2000-07-01)
+- Q: quarters since 1970 (Q-DEC)
+- M: months since 1970-01
+- W-SUN (or W), W-MON, ... W-SAT: weeks ending on this day
+- D: days since 1970-01-01
+- B: business days since 1970-01-01 (a week-end day is rolled to the next monday)
+
+Other frequencies or period formats fall back on pandas.Period. The 
+compact month (YYYYMM) is only converted for the frequency M: pandas 
+parses it as a date for the other frequencies.
+
+>>> period_to_ordinal("2016-01-27", "W-WED")
+2404
+>>> ordinal_to_datetime(2404, "W-WED")
+datetime.datetime(2016, 1, 21, 0, 0)
+"""
+
+import re
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+EPOCH = datetime(1970, 1, 1)
+
+WEEK_DAYS = ["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+
+FREQUENCIES = ["A", "S", "Q", "M", "D", "B", "W"] + ["W-%s" % day for day in WEEK_DAYS]
+
+'''(regex, func, frequencies or None for all)'''
+RE_PERIODS = [
+    (re.compile(r"^(\d{4})$"), lambda m: (int(m.group(1)), 1, 1), None),
+    (re.compile(r"^(\d{4})-?Q([1-4])$"), lambda m: (int(m.group(1)), int(m.group(2)) * 3 - 2, 1), None),
+    (re.compile(r"^(\d{4})-?S([12])$"), lambda m: (int(m.group(1)), int(m.group(2)) * 6 - 5, 1), None),
+    (re.compile(r"^(\d{4})-(\d{2})$"), lambda m: (int(m.group(1)), int(m.group(2)), 1), None),
+    (re.compile(r"^(\d{4})(\d{2})$"), lambda m: (int(m.group(1)), int(m.group(2)), 1), ["M"]),
+    (re.compile(r"^(\d{4})-?(\d{2})-?(\d{2})$"), lambda m: (int(m.group(1)), int(m.group(2)), int(m.group(3))), None),
+]
+
+def is_supported(freq):
+    return freq in FREQUENCIES
+
+def parse_period(date_str, freq=None):
+    """Return (year, month, day) of the first day of date_str or None
+    
+    With freq, only the formats converted for this frequency are used.
+    """
+    for regex, func, frequencies in RE_PERIODS:
+        if frequencies and freq not in frequencies:
+            continue
+        m = regex.match(date_str)
+        if m:
+            return func(m)
+    return None
+
+def _week_day(freq):
+    '''0 for W-SUN (or W) to 6 for W-SAT'''
+    return WEEK_DAYS.index(freq[2:] or "SUN")
+
+def unix_date_to_ordinal(unix_date, freq):
+    """Ordinal of the period with the day unix_date (days since 1970-01-01)"""
+    if freq == "D":
+        return unix_date
+    elif freq == "B":
+        week_day = (unix_date + 3) % 7
+        if week_day > 4:
+            unix_date += 7 - week_day
+        return ((unix_date + 4) // 7) * 5 + ((unix_date + 4) % 7) - 4
+    elif freq == "S":
+        return unix_date * 86400
+    elif freq.startswith("W"):
+        return (unix_date + 3 - _week_day(freq)) // 7 + 1
+    raise NotImplementedError("freq not implemented freq[%s]" % freq)
+
+def ymd_to_ordinal(year, month, day, freq):
+    if freq == "A":
+        return year - 1970
+    elif freq == "Q":
+        return (year - 1970) * 4 + (month - 1) // 3
+    elif freq == "M":
+        return (year - 1970) * 12 + month - 1
+    return unix_date_to_ordinal(date(year, month, day).toordinal() - EPOCH_ORDINAL, freq)
+
+def period_to_ordinal(date_str, freq):
+    """Same as pandas.Period(date_str, freq=freq).ordinal"""
+    ymd = None
+    if freq in FREQUENCIES:
+        ymd = parse_period(date_str, freq)
+    if ymd is None:
+        from pandas import Period
+        return Period(date_str, freq=freq).ordinal
+    return ymd_to_ordinal(ymd[0], ymd[1], ymd[2], freq)
+
+def periods_to_ordinals(periods, freq, as_array=False):
+    """Convert a list of period strings with the same frequency
+
+    Each distinct string is converted only once. With as_array=True,
+    return a numpy array of int64 (numpy is required).
+    """
+    converted = {}
+    ordinals = []
+    for date_str in periods:
+        ordinal = converted.get(date_str)
+        if ordinal is None:
+            ordinal = converted[date_str] = period_to_ordinal(date_str, freq)
+        ordinals.append(ordinal)
+    if as_array:
+        if numpy is None:
+            raise ImportError("numpy is required for as_array=True")
+        return numpy.array(ordinals, dtype=numpy.int64)
+    return ordinals
+
+def _first_unix_date(ordinal, freq):
+    if freq == "D":
+        return ordinal
+    elif freq == "B":
+        return ((ordinal + 3) // 5) * 7 + ((ordinal + 3) % 5) - 3
+    elif freq.startswith("W"):
+        return ordinal * 7 - 10 + _week_day(freq)
+    raise NotImplementedError("freq not implemented freq[%s]" % freq)
+
+def ordinal_to_datetime(ordinal, freq, how="start"):
+    """Same as pandas.Period(ordinal=ordinal, freq=freq).start_time
+    (or end_time with how="end") truncated to the microsecond
+    """
+    if not freq in FREQUENCIES:
+        from pandas import Period
+        period = Period(ordinal=ordinal, freq=freq)
+        dt = period.start_time if how == "start" else period.end_time
+        return dt.to_pydatetime(warn=False)
+
+    if freq == "S":
+        start = EPOCH + timedelta(seconds=ordinal)
+        end = start + timedelta(seconds=1)
+    elif freq in ["A", "Q", "M"]:
+        months = {"A": 12, "Q": 3, "M": 1}[freq]
+        start_month = ordinal * months
+        end_month = start_month + months
+        start = datetime(1970 + start_month // 12, start_month % 12 + 1, 1)
+        end = datetime(1970 + end_month // 12, end_month % 12 + 1, 1)
+    else:
+        start = EPOCH + timedelta(days=_first_unix_date(ordinal, freq))
+        days = 7 if freq.startswith("W") else 1
+        end = start + timedelta(days=days)
+
+    if how == "start":
+        return start
+    return end - timedelta(microseconds=1)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import glob
+import logging
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+def profile_filename(profile_dir, provider_name, dataset_code=None, ext="pstats"):
+    """Return path of a profile file
+
+    - DIR/PROVIDER-DATASET.pstats for one dataset
+    - DIR/PROVIDER.pstats for the merged profile of a provider
+    """
+    name = _safe_name(provider_name)
+    if dataset_code:
+        name = "%s-%s" % (name, _safe_name(dataset_code))
+    return os.path.join(profile_dir, "%s.%s" % (name, ext))
+
+@contextmanager
+def profile_dataset(profile_dir, provider_name, dataset_code,
+                    memory=False, memory_top=25):
+    """Profile the block with cProfile if profile_dir is not None
+
+    Write DIR/PROVIDER-DATASET.pstats and with memory=True, the top
+    allocation sites of a tracemalloc snapshot in
+    DIR/PROVIDER-DATASET.tracemalloc.txt
+
+    Only the calling thread is profiled.
+    """
+    if not profile_dir:
+        yield
+        return
+
+    os.makedirs(profile_dir, exist_ok=True)
+
+    is_tracing = False
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        is_tracing = True
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        filepath = profile_filename(profile_dir, provider_name, dataset_code)
+        profile.dump_stats(filepath)
+        logger.info("profile provider[%s] - dataset[%s] - file[%s]" % (provider_name, dataset_code, filepath))
+
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            if is_tracing:
+                tracemalloc.stop()
+            filepath = profile_filename(profile_dir, provider_name, dataset_code,
+                                        ext="tracemalloc.txt")
+            write_tracemalloc_top(snapshot, filepath, limit=memory_top)
+
+def write_tracemalloc_top(snapshot, filepath, limit=25):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    with open(filepath, "w") as fp:
+        for stat in snapshot.statistics("lineno")[:limit]:
+            fp.write("%s\n" % stat)
+
+def merge_profiles(profile_dir, provider_name, since=None):
+    """Merge the profiles of all datasets of a provider
+
+    Write DIR/PROVIDER.pstats and DIR/PROVIDER.collapsed.txt
+
+    With since (timestamp), only the files written since this time (the 
+    files of this run) are merged.
+
+    Return the merged pstats.Stats or None if no profile is found
+    """
+    pattern = os.path.join(profile_dir, "%s-*.pstats" % _safe_name(provider_name))
+    files = sorted(glob.glob(pattern))
+    if since:
+        files = [filepath for filepath in files if os.path.getmtime(filepath) >= since]
+    if not files:
+        return None
+
+    stats = pstats.Stats(files[0])
+    for filepath in files[1:]:
+        stats.add(filepath)
+    stats.dump_stats(profile_filename(profile_dir, provider_name))
+
+    with open(profile_filename(profile_dir, provider_name, ext="collapsed.txt"), "w") as fp:
+        for stack, value in sorted(collapsed_stacks(stats).items()):
+            fp.write("%s %s\n" % (stack, value))
+
+    return stats
+
+def _label(func):
+    filename, lineno, name = func
+    if filename == "~":
+        return name
+    return "%s:%s(%s)" % (os.path.basename(filename), lineno, name)
+
+def collapsed_stacks(stats, min_time=0.0001):
+    """Return {stack: microseconds} from the call graph of pstats.Stats
+
+    cProfile records callers, not full stacks: the time of a function
+    called from several callers is split in proportion of the cumulative
+    time of each call edge. Paths under min_time seconds are dropped.
+
+    The result is the collapsed format of flamegraph.pl
+    (frame1;frame2;frame3 value).
+    """
+    entries = stats.stats
+    children = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            edge_ct = edge[3] if isinstance(edge, tuple) else 0
+            children.setdefault(caller, []).append((func, edge_ct))
+
+    roots = [func for func, entry in entries.items() if not entry[4]]
+
+    result = {}
+
+    def walk(func, path, names, ratio):
+        cc, nc, tt, ct, callers = entries[func]
+        names = names + [_label(func)]
+        self_time = int(tt * ratio * 1000000)
+        if self_time > 0:
+            stack = ";".join(names)
+            result[stack] = result.get(stack, 0) + self_time
+        for child, edge_ct in children.get(func, []):
+            if child in path:
+                continue
+            child_ct = entries[child][3]
+            if not child_ct:
+                continue
+            child_ratio = ratio * edge_ct / child_ct
+            if child_ct * child_ratio < min_time:
+                continue
+            walk(child, path | {child}, names, child_ratio)
+
+    for root in roots:
+        walk(root, {root}, [], 1.0)
+
+    return result
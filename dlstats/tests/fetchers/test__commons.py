@@ -3,12 +3,13 @@
 from copy import deepcopy
 from datetime import datetime
 
-from bson import ObjectId
+from bson import ObjectId, BSON
+from pymongo import InsertOne
 from voluptuous import MultipleInvalid
 from pymongo.errors import DuplicateKeyError
 
 from widukind_common import errors
-from widukind_common.utils import series_archives_load
+from widukind_common.utils import series_archives_store
 
 from dlstats import constants
 from dlstats.fetchers import schemas
@@ -22,8 +23,16 @@ from dlstats.fetchers._commons import (Fetcher,
                                        series_is_changed,
                                        series_get_last_update_dataset,
                                        series_verify,
+                                       series_hash,
+                                       series_archives_delta,
+                                       series_delta_apply,
+                                       series_archives_rebuild,
+                                       series_archives_migrate,
+                                       BulkSizeController,
+                                       create_series_hash_index,
                                        SeriesIterator)
-from dlstats.utils import clean_datetime 
+from dlstats.utils import clean_datetime, http_validators
+from dlstats.observations import Observations
 
 from dlstats.fetchers.dummy import DUMMY, DUMMY_SAMPLE_SERIES
 
@@ -530,6 +539,34 @@ class SeriesTestCase(BaseTestCase):
         }
         self.assertTrue(series_is_changed(new_bson, old_bson))
 
+    def test_series_hash(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_series_hash
+
+        bson1 = deepcopy(SERIES1)
+        bson2 = deepcopy(SERIES1)
+        self.assertEqual(series_hash(bson1), series_hash(bson2))
+
+        '''fields not compared by series_is_changed'''
+        bson2["version"] = 10
+        bson2["last_update"] = datetime.now()
+        self.assertEqual(series_hash(bson1), series_hash(bson2))
+        
+        '''dict order'''
+        bson2["dimensions"] = {'Scale': 'Billions', 'Country': 'AFG'}
+        self.assertEqual(series_hash(bson1), series_hash(bson2))
+
+        bson2["values"][0]["value"] = "2.0"
+        self.assertNotEqual(series_hash(bson1), series_hash(bson2))
+
+        bson2 = deepcopy(SERIES1)
+        bson2["values"][1]["attributes"] = {"OBS_STATUS": "e"}
+        self.assertNotEqual(series_hash(bson1), series_hash(bson2))
+
+        bson2 = deepcopy(SERIES1)
+        bson2["name"] = "other"
+        self.assertNotEqual(series_hash(bson1), series_hash(bson2))
+
     def test_series_schema(self):
 
         bson = {
@@ -559,6 +596,123 @@ class SeriesTestCase(BaseTestCase):
         schemas.series_value_schema(bson["values"][0])
         schemas.series_schema(bson)
 
+    def test_series_validator(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_series_validator
+
+        bson = {
+            'version': 0,
+            'last_update_ds': datetime.now(),
+            'last_update_widu': datetime.now(),
+            'provider_name': "p1", 
+            'dataset_code': "d1",
+            'name': "name1", 
+            'key': "key1", 
+            "slug": "p1-d1-key1",             
+            'attributes': None,
+            'dimensions': {"COUNTRY": "FRA"},
+            'codelists': {"COUNTRY": {"FRA": "FRANCE"}},
+            'start_date': 30, 'end_date': 31,
+            'start_ts': datetime(2000, 1, 1, 0, 0),
+            'end_ts': datetime(2001, 12, 31, 23, 59, 59, 999999),
+            'frequency': "A",
+            'hash': "abc",
+            'values': [
+                {"period": "2000", "value": "1", "attributes": None},
+                {"period": "2001", "value": "2", "attributes": {"obs-status": "e"}},
+            ],                
+        }
+        self.assertIs(schemas.series_validator(bson), bson)
+        self.assertTrue(schemas.series_validator.is_valid(bson))
+        
+        def _set(field, value):
+            def func(doc):
+                doc[field] = value
+            return func
+        
+        def _set_value(position, field, value):
+            def func(doc):
+                doc["values"][position][field] = value
+            return func
+        
+        def _pop(field):
+            def func(doc):
+                doc.pop(field)
+            return func
+        
+        changes = [
+            _set("version", -1),
+            _set("version", "0"),
+            _set("name", ""),
+            _set("last_update_ds", None),
+            _set("dimensions", {"COUNTRY": 1}),
+            _set("attributes", []),
+            _set("extra", 1),
+            _set("hash", None),
+            _pop("slug"),
+            _set_value(1, "value", 2.0),
+            _set_value(0, "period", ""),
+            _set_value(1, "attributes", "e"),
+            _set_value(1, "other", "e"),
+        ]
+        
+        for change in changes:
+            doc = deepcopy(bson)
+            change(doc)
+            self.assertFalse(schemas.series_validator.is_valid(doc))
+            with self.assertRaises(MultipleInvalid) as err_voluptuous:
+                schemas.series_schema(doc)
+            with self.assertRaises(MultipleInvalid) as err_compiled:
+                schemas.series_validator(doc)
+            self.assertEqual(str(err_compiled.exception), str(err_voluptuous.exception))
+            
+        doc = deepcopy(bson)
+        doc["values"] = Observations.from_bson(doc["values"])
+        self.assertTrue(schemas.series_validator.is_valid(doc))
+        doc["values"].values[0] = 1
+        self.assertFalse(schemas.series_validator.is_valid(doc))
+        
+        '''sample mode'''
+        validator = schemas.compile_schema(schemas.series_schema, sample_rate=0)
+        self.assertIs(validator.sample(doc), doc)
+        validator = schemas.compile_schema(schemas.series_schema, sample_rate=1)
+        with self.assertRaises(MultipleInvalid):
+            validator.sample(doc)
+
+    def test_bulk_size_controller(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_bulk_size_controller
+
+        controller = BulkSizeController(100, max_bytes=1000000, max_latency=1.0,
+                                        min_size=10, max_size=1000)
+
+        '''grow by factor 2'''
+        self.assertEqual(controller.update(100, 100000, 0.1), 200)
+        self.assertEqual(controller.update(200, 200000, 0.2), 400)
+        
+        '''bytes budget: 5000 bytes by document'''
+        self.assertEqual(controller.update(400, 2000000, 0.2), 200)
+        
+        '''latency budget: 0.01 second by document'''
+        self.assertEqual(controller.update(200, 20000, 2.0), 100)
+
+        '''min_size'''
+        self.assertEqual(controller.update(100, 100000000, 0.1), 10)
+        
+        '''empty bulk'''
+        self.assertEqual(controller.update(0, 0, 0), 10)
+        
+        stats = controller.stats()
+        self.assertEqual(stats["count_writes"], 5)
+        self.assertEqual(stats["min_size"], 10)
+        self.assertEqual(stats["max_size"], 400)
+        self.assertEqual(stats["last_size"], 10)
+        self.assertEqual(len(stats["changes"]), 5)
+        
+        operations = [InsertOne({"key": "key%s" % i}) for i in range(100)]
+        self.assertEqual(controller.measure(operations), 
+                         100 * len(BSON.encode({"key": "key0"})) + 90)
+
     def test_series_get_last_update_dataset(self):
 
         # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_series_get_last_update_dataset
@@ -715,9 +869,33 @@ class DB_FetcherTestCase(BaseDBTestCase):
     def test_get_ordinal_from_period(self):
         pass
 
-    @unittest.skipIf(True, "TODO")    
     def test_wrap_upsert_dataset(self):
-        pass
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_FetcherTestCase.test_wrap_upsert_dataset
+
+        class FakeFetcher(Fetcher):
+            def upsert_dataset(self, dataset_code):
+                http_validators.add_pending("http://www.example.com/%s" % dataset_code, 
+                                            {"ETag": '"v1"'})
+                if dataset_code == "d2":
+                    '''Error counted by Datasets.update_database'''
+                    self.errors += 1
+                elif dataset_code == "d3":
+                    self.series_errors += 1
+                return dataset_code
+
+        f = FakeFetcher(provider_name="p1", db=self.db, max_errors=0)
+        f.provider_verified = True
+        f.indexes_verified = True
+
+        with mock.patch.object(http_validators, "save") as save:
+            self.assertEqual(f.wrap_upsert_dataset("d1"), "d1")
+            self.assertEqual(save.call_count, 1)
+
+            '''Validators of a failed update are not stored'''
+            self.assertEqual(f.wrap_upsert_dataset("d2"), "d2")
+            self.assertEqual(f.wrap_upsert_dataset("d3"), "d3")
+            self.assertEqual(save.call_count, 1)
 
     @unittest.skipIf(True, "TODO")    
     def test__hook_remove_temp_files(self):
@@ -739,6 +917,78 @@ class DB_FetcherTestCase(BaseDBTestCase):
     def test_load_datasets_update(self):
         pass
     
+    def test_upsert_all_datasets_first_load(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_FetcherTestCase.test_upsert_all_datasets_first_load
+
+        class FakeFetcher(Fetcher):
+            def datasets_list(self):
+                return [{"dataset_code": "d1"}]
+            def upsert_datasets(self, dataset_codes):
+                calls.append(self.first_load)
+
+        calls = []
+        f = FakeFetcher(provider_name="p1", db=self.db)
+        f.provider_verified = True
+
+        '''No dataset stored: first load during the run only'''
+        f.upsert_all_datasets()
+        self.assertEqual(calls, [True])
+        self.assertFalse(f.first_load)
+
+        '''Update: first load only with the first_load option'''
+        self.db[constants.COL_DATASETS].insert_one({"provider_name": "p1",
+                                                    "dataset_code": "d1"})
+        f.upsert_all_datasets()
+        self.assertEqual(calls, [True, False])
+
+    def test_dataset_lease(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_FetcherTestCase.test_dataset_lease
+
+        f = Fetcher(provider_name="p1", db=self.db)
+        
+        '''dataset not stored: always accepted'''
+        self.assertTrue(f.dataset_lease_acquire("d1"))
+        
+        self.db[constants.COL_DATASETS].insert_one({"provider_name": "p1",
+                                                    "dataset_code": "d1",
+                                                    "lock": False})
+        
+        self.assertTrue(f.dataset_lease_acquire("d1"))
+        self.assertFalse(f.dataset_lease_acquire("d1"))
+        
+        doc = self.db[constants.COL_DATASETS].find_one({"dataset_code": "d1"})
+        self.assertTrue(doc["lock"])
+        
+        f.dataset_lease_release("d1")
+        doc = self.db[constants.COL_DATASETS].find_one({"dataset_code": "d1"})
+        self.assertFalse(doc["lock"])
+        self.assertTrue(f.dataset_lease_acquire("d1"))
+        
+        '''Lease of a killed worker: taken again after expiry'''
+        other = Fetcher(provider_name="p1", db=self.db)
+        self.assertFalse(other.dataset_lease_acquire("d1"))
+        self.db[constants.COL_DATASETS].update_one({"dataset_code": "d1"},
+                                                   {"$set": {"lock_until": datetime(2000, 1, 1)}})
+        self.assertTrue(other.dataset_lease_acquire("d1"))
+        doc = self.db[constants.COL_DATASETS].find_one({"dataset_code": "d1"})
+        self.assertEqual(doc["lock_owner"], other.lease_owner)
+        self.assertTrue(doc["lock_until"] > datetime.now())
+        
+        '''Only the owner releases its lease'''
+        f.dataset_lease_release("d1")
+        self.assertTrue(self.db[constants.COL_DATASETS].find_one({"dataset_code": "d1"})["lock"])
+        other.dataset_lease_release("d1")
+        doc = self.db[constants.COL_DATASETS].find_one({"dataset_code": "d1"})
+        self.assertFalse(doc["lock"])
+        self.assertFalse("lock_owner" in doc)
+        
+        '''Lock without expiry (set by an administrator)'''
+        self.db[constants.COL_DATASETS].update_one({"dataset_code": "d1"},
+                                                   {"$set": {"lock": True}})
+        self.assertFalse(f.dataset_lease_acquire("d1"))
+
     @unittest.skipIf(True, "TODO")    
     def test_build_data_tree(self):
         pass
@@ -955,6 +1205,39 @@ class DB_CategoriesTestCase(BaseDBTestCase):
         cats["c0"].pop("_id")
         self.assertEqual(cats, _categories)
 
+    def test_upsert_data_tree_sync(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_CategoriesTestCase.test_upsert_data_tree_sync
+
+        f = Fetcher(provider_name="p1", 
+                    is_indexes=False, 
+                    db=self.db)
+
+        data_tree = [
+            {'category_code': "c0", 'name': "c0 Name"},
+            {'category_code': "c1", 'name': "c1 Name", 'parent': "c0", 'all_parents': ["c0"]},
+            {'category_code': "c2", 'name': "c2 Name", 'parent': "c0", 'all_parents': ["c0"]},
+        ]
+        first = f.upsert_data_tree(deepcopy(data_tree))
+        self.assertEqual(len(first), 3)
+        self.assertEqual(f.data_tree_stats, {"inserted": 3, "updated": 0, "deleted": 0, "unchanged": 0})
+
+        data_tree[1]["name"] = "c1 New Name"
+        data_tree[2] = {'category_code': "c3", 'name': "c3 Name", 'parent': "c0", 'all_parents': ["c0"]}
+        
+        second = f.upsert_data_tree(deepcopy(data_tree))
+        self.assertEqual(f.data_tree_stats, {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1})
+        '''The _id of the existing categories are preserved'''
+        self.assertEqual(second[:2], first[:2])
+
+        cats = Categories.categories(f.provider_name, db=self.db)
+        self.assertEqual(sorted(cats.keys()), ["c0", "c1", "c3"])
+        self.assertEqual(cats["c1"]["name"], "c1 New Name")
+        self.assertEqual(cats["c3"]["_id"], second[2])
+
+        f.upsert_data_tree(deepcopy(data_tree))
+        self.assertEqual(f.data_tree_stats, {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 3})
+
 
 class DB_DatasetsTestCase(BaseDBTestCase):
 
@@ -1222,10 +1505,68 @@ class DB_SeriesTestCase(BaseDBTestCase):
         
         self.assertEqual(series.count(), len(series_list))
 
-    @unittest.skipIf(True, "TODO")    
-    def test_update_series_list_async(self):
+    def test_update_series_list_hash(self):
         
-        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_async
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_hash
+
+        f = Fetcher(provider_name="p1", 
+                    db=self.db)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+
+        def _run(series):
+            d = Datasets(provider_name="p1", 
+                        dataset_code="d1",
+                        name="d1 name",
+                        last_update=datetime(2013,10,28),
+                        doc_href="http://www.example.com",
+                        fetcher=f, 
+                        is_load_previous_version=False)
+            d.series.data_iterator = FakeSeriesIterator(d, [series])
+            d.update_database()
+            return d.series
+
+        s = _run(deepcopy(SERIES1))
+        self.assertEqual(s.count_inserts, 1)
+        
+        bson = self.db[constants.COL_SERIES].find_one({"slug": "p1-d1-key1"})
+        self.assertIsNotNone(bson.get("hash"))
+        
+        '''same series: no update, no archive'''
+        s = _run(deepcopy(SERIES1))
+        self.assertEqual(s.count_inserts, 0)
+        self.assertEqual(s.count_updates, 0)
+        self.assertEqual(self.db[constants.COL_SERIES_ARCHIVES].count(), 0)
+
+        '''old document without hash and not changed'''
+        self.db[constants.COL_SERIES].update_one({"slug": "p1-d1-key1"}, 
+                                                 {"$unset": {"hash": ""}})
+        s = _run(deepcopy(SERIES1))
+        self.assertEqual(s.count_updates, 0)
+        self.assertEqual(self.db[constants.COL_SERIES_ARCHIVES].count(), 0)
+        new_bson = self.db[constants.COL_SERIES].find_one({"slug": "p1-d1-key1"})
+        self.assertEqual(new_bson["hash"], bson["hash"])
+        self.assertEqual(new_bson["version"], 0)
+
+        '''changed series'''
+        series = deepcopy(SERIES1)
+        series["values"][0]["value"] = "1234.5"
+        s = _run(series)
+        self.assertEqual(s.count_updates, 1)
+        self.assertEqual(self.db[constants.COL_SERIES_ARCHIVES].count(), 1)
+        new_bson = self.db[constants.COL_SERIES].find_one({"slug": "p1-d1-key1"})
+        self.assertNotEqual(new_bson["hash"], bson["hash"])
+        self.assertEqual(new_bson["version"], 1)
+
+    def test_update_series_list_pipeline(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_pipeline
 
         provider_name = "p1"
         dataset_code = "d1"
@@ -1233,7 +1574,7 @@ class DB_SeriesTestCase(BaseDBTestCase):
     
         f = Fetcher(provider_name=provider_name, 
                     db=self.db,
-                    async_mode=True)
+                    async_mode="pipeline")
 
         f.provider = Providers(name="p1",
                       long_name="Provider One",
@@ -1251,34 +1592,376 @@ class DB_SeriesTestCase(BaseDBTestCase):
                     fetcher=f, 
                     is_load_previous_version=False)
         
-        s = Series(dataset=d,
-                   provider_name=f.provider_name, 
-                   dataset_code=dataset_code, 
-                   bulk_size=1, 
-                   fetcher=f)
+        self.assertEqual(d.series.__class__.__name__, "PipelineSeries")
+        d.series.bulk_size = 1
 
-        series_list = [SERIES1.copy()]
-        datas = FakeSeriesIterator(d, series_list)
-        s.data_iterator = datas
+        series_list = []
+        for i in range(5):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
         
-        d.series = s
-        d.update_database()        
+        d.series.data_iterator = FakeSeriesIterator(d, series_list)
+        d.update_database()
         
-        '''Count All series'''
+        self.assertEqual(d.series.count_accepts, len(series_list))
+        self.assertEqual(d.series.count_inserts, len(series_list))
         self.assertEqual(self.db[constants.COL_SERIES].count(), len(series_list))
 
-        '''Count series for this provider and dataset'''
-        series = self.db[constants.COL_SERIES].find({'provider_name': f.provider_name, 
-                                                     "dataset_code": dataset_code})
-        self.assertEqual(series.count(), len(series_list))
+        stats = d.series.get_run_stats()
+        self.assertTrue("pipeline" in stats)
+        self.assertTrue(stats["pipeline"]["parser_stall"] >= 0)
+        self.assertTrue(stats["pipeline"]["writer_stall"] >= 0)
 
-        '''Count series for this provider and dataset and in keys[]'''
-        keys = [s['key'] for s in series_list]
-        series = self.db[constants.COL_SERIES].find({'provider_name': f.provider_name, 
-                                                     "dataset_code": dataset_code,
-                                                     "key": {"$in": keys}})
+        stat = self.db[constants.COL_STATS_RUN].find_one({"provider_name": provider_name})
+        self.assertEqual(stat["async_mode"], "pipeline")
+        self.assertTrue("pipeline" in stat)
+
+    def test_update_series_list_bulk_adaptive(self):
         
-        self.assertEqual(series.count(), len(series_list))
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_bulk_adaptive
+
+        provider_name = "p1"
+        dataset_code = "d1"
+    
+        f = Fetcher(provider_name=provider_name, 
+                    db=self.db,
+                    bulk_size=2,
+                    bulk_adaptive=True)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+
+        d = Datasets(provider_name=provider_name, 
+                    dataset_code=dataset_code,
+                    name="d1 name",
+                    last_update=datetime(2013,10,28),
+                    doc_href="http://www.example.com",
+                    fetcher=f, 
+                    is_load_previous_version=False)
+        
+        series_list = []
+        for i in range(10):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        
+        d.series.data_iterator = FakeSeriesIterator(d, series_list)
+        d.update_database()
+        
+        self.assertEqual(d.series.count_inserts, len(series_list))
+        self.assertEqual(d.series.bulk_size, 16)
+
+        stat = self.db[constants.COL_STATS_RUN].find_one({"provider_name": provider_name})
+        self.assertEqual(stat["bulk_size"], 2)
+        self.assertEqual(stat["bulk_adaptive"]["initial_size"], 2)
+        self.assertEqual(stat["bulk_adaptive"]["last_size"], 16)
+        self.assertEqual(stat["bulk_adaptive"]["count_writes"], 3)
+        self.assertEqual(stat["bulk_adaptive"]["changes"], [[1, 4], [2, 8], [3, 16]])
+        self.assertTrue(stat["bulk_adaptive"]["avg_doc_bytes"] > 0)
+
+        stages = stat["stages"]
+        for name in ["parse", "build_series", "clean_field", "lookup", 
+                     "prepare", "diff", "validation", "bulk_execute"]:
+            self.assertTrue(name in stages, name)
+        self.assertEqual(stages["build_series"]["count"], 10)
+        self.assertEqual(stages["diff"]["count"], 10)
+        self.assertEqual(stages["bulk_execute"]["count"], 3)
+        self.assertEqual(stages["bulk_execute"]["operations"], 10)
+
+    def test_update_series_list_first_load(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_first_load
+
+        provider_name = "p1"
+        dataset_code = "d1"
+    
+        f = Fetcher(provider_name=provider_name, 
+                    db=self.db,
+                    first_load=True,
+                    defer_indexes=True)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+        
+        create_series_hash_index(self.db)
+        f.indexes_verify()
+        self.assertEqual([i[0] for i in f.deferred_indexes], ["provider_dataset_key_hash_idx"])
+        self.assertFalse("provider_dataset_key_hash_idx" in self.db[constants.COL_SERIES].index_information())
+        
+        def _run():
+            d = Datasets(provider_name=provider_name, 
+                        dataset_code=dataset_code,
+                        name="d1 name",
+                        last_update=datetime(2013,10,28),
+                        doc_href="http://www.example.com",
+                        fetcher=f, 
+                        is_load_previous_version=False)
+            series_list = []
+            for i in range(5):
+                series = deepcopy(SERIES1)
+                series["key"] = "key%s" % i
+                series["slug"] = "p1-d1-key%s" % i
+                series_list.append(series)
+            d.series.bulk_size = 2
+            d.series.data_iterator = FakeSeriesIterator(d, series_list)
+            d.update_database()
+            return d
+        
+        with mock.patch.object(Series, "get_old_documents") as get_old_documents:
+            d = _run()
+            self.assertFalse(get_old_documents.called)
+
+        self.assertTrue(d.series.first_load)
+        self.assertEqual(d.series.count_inserts, 5)
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 5)
+        stat = self.db[constants.COL_STATS_RUN].find_one({"provider_name": provider_name})
+        self.assertTrue(stat["first_load"])
+        
+        f.indexes_restore()
+        self.assertEqual(f.deferred_indexes, [])
+        self.assertTrue("provider_dataset_key_hash_idx" in self.db[constants.COL_SERIES].index_information())
+
+        '''The dataset has series: lookup of old series'''
+        d = _run()
+        self.assertFalse(d.series.first_load)
+        self.assertEqual(d.series.count_inserts, 0)
+        self.assertEqual(d.series.count_updates, 0)
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 5)
+
+    def test_process_series_data_memory_limit(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_process_series_data_memory_limit
+
+        provider_name = "p1"
+        dataset_code = "d1"
+    
+        f = Fetcher(provider_name=provider_name, 
+                    db=self.db,
+                    memory_limit=1)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+
+        d = Datasets(provider_name=provider_name, 
+                    dataset_code=dataset_code,
+                    name="d1 name",
+                    last_update=datetime(2013,10,28),
+                    doc_href="http://www.example.com",
+                    fetcher=f, 
+                    is_load_previous_version=False)
+        
+        series_list = []
+        for i in range(250):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        
+        d.series.data_iterator = FakeSeriesIterator(d, series_list)
+        with mock.patch.object(Fetcher, "drop_cached_codelists") as drop_cached_codelists:
+            d.update_database()
+            self.assertEqual(drop_cached_codelists.call_count, 1)
+        
+        self.assertEqual(d.series.bulk_size, 500)
+        self.assertEqual(d.series.count_inserts, len(series_list))
+
+        stat = self.db[constants.COL_STATS_RUN].find_one({"provider_name": provider_name})
+        self.assertEqual(stat["stages"]["bulk_execute"]["count"], 3)
+        self.assertEqual(stat["memory"]["limit"], 1)
+        self.assertEqual(stat["memory"]["count_flushes"], 2)
+        self.assertTrue(stat["memory"]["rss_peak"] >= stat["memory"]["rss_start"] > 0)
+        self.assertTrue(stat["memory"]["max_rss"] > 0)
+        self.assertFalse("mongo" in stat)
+        self.assertTrue(stat["slugify"]["hits"] + stat["slugify"]["misses"] > 0)
+
+    def test_update_series_list_async(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_async
+
+        provider_name = "p1"
+        dataset_code = "d1"
+        dataset_name = "d1 name"
+        
+        def _series_list(value):
+            series_list = []
+            for i in range(5):
+                series = deepcopy(SERIES1)
+                series["key"] = "key%s" % i
+                series["slug"] = "p1-d1-key%s" % i
+                series["values"][0]["value"] = value
+                series_list.append(series)
+            return series_list
+
+        def _run(async_mode, series_list):
+            f = Fetcher(provider_name=provider_name, 
+                        db=self.db,
+                        async_mode=async_mode,
+                        pool_size=3)
+    
+            f.provider = Providers(name="p1",
+                          long_name="Provider One",
+                          version=1,
+                          region="Dreamland",
+                          website="http://www.example.com", 
+                          fetcher=f)
+            f.provider.update_database()
+    
+            d = Datasets(provider_name=provider_name, 
+                        dataset_code=dataset_code,
+                        name=dataset_name,
+                        last_update=datetime(2013,10,28),
+                        doc_href="http://www.example.com",
+                        fetcher=f, 
+                        is_load_previous_version=False)
+            d.series.bulk_size = 2
+            d.series.data_iterator = FakeSeriesIterator(d, series_list)
+            d.update_database()
+            return d
+
+        def _docs(collection):
+            docs = []
+            for doc in self.db[collection].find({}, {"_id": False}).sort("slug"):
+                if collection == constants.COL_SERIES_ARCHIVES:
+                    self.assertEqual(doc["format"], "delta")
+                    doc = series_archives_rebuild(self.db, doc["provider_name"],
+                                                  doc["dataset_code"], doc["key"],
+                                                  doc["version"])
+                doc.pop("last_update_widu", None)
+                docs.append(doc)
+            return docs
+        
+        def _load(async_mode):
+            d = _run(async_mode, _series_list("5001.25"))
+            self.assertEqual(d.series.count_inserts, 5)
+            d = _run(async_mode, _series_list("5002.75"))
+            self.assertEqual(d.series.count_updates, 5)
+            stages = self.db[constants.COL_STATS_RUN].find_one({"async_mode": async_mode}, 
+                                                               sort=[("_id", -1)])["stages"]
+            self.assertEqual(stages["diff"]["count"], 5)
+            self.assertEqual(stages["archives_execute"]["operations"], 5)
+            result = (_docs(constants.COL_SERIES), 
+                      _docs(constants.COL_SERIES_ARCHIVES),
+                      d.series.__class__.__name__)
+            self.db[constants.COL_SERIES].delete_many({})
+            self.db[constants.COL_SERIES_ARCHIVES].delete_many({})
+            return result
+        
+        series, archives, klass = _load(None)
+        async_series, async_archives, async_klass = _load("future")
+        process_series, process_archives, process_klass = _load("process")
+
+        self.assertEqual(klass, "Series")
+        self.assertEqual(async_klass, "AsyncSeries")
+        self.assertEqual(process_klass, "ProcessSeries")
+        self.assertEqual(len(series), 5)
+        self.assertEqual(len(archives), 5)
+        self.assertEqual(async_series, series)
+        self.assertEqual(async_archives, archives)
+        self.assertEqual(process_series, series)
+        self.assertEqual(process_archives, archives)
+
+    def test_process_series_data_resume(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_process_series_data_resume
+
+        provider_name = "p1"
+        dataset_code = "d1"
+        dataset_name = "d1 name"
+        
+        class PartitionSeriesIterator(FakeSeriesIterator):
+            
+            def __init__(self, dataset, series_list, fail_partition=None):
+                self.fail_partition = fail_partition
+                self.partitions_loaded = []
+                super().__init__(dataset, series_list)
+            
+            def _process(self):
+                for partition in ["A", "B", "C"]:
+                    if self.is_partition_committed(partition):
+                        continue
+                    if partition == self.fail_partition:
+                        raise Exception("interrupted run")
+                    self.partitions_loaded.append(partition)
+                    for row in self.series_list:
+                        if row["key"].startswith(partition):
+                            yield row, None
+                    self.partition_done(partition)
+
+        series_list = []
+        for partition in ["A", "B", "C"]:
+            for i in range(2):
+                series = deepcopy(SERIES1)
+                series["key"] = "%s%s" % (partition, i)
+                series["slug"] = "p1-d1-%s%s" % (partition, i)
+                series_list.append(series)
+        
+        def _run(resume=False, fail_partition=None):
+            f = Fetcher(provider_name=provider_name, 
+                        db=self.db,
+                        resume=resume)
+    
+            f.provider = Providers(name="p1",
+                          long_name="Provider One",
+                          version=1,
+                          region="Dreamland",
+                          website="http://www.example.com", 
+                          fetcher=f)
+            f.provider.update_database()
+    
+            d = Datasets(provider_name=provider_name, 
+                        dataset_code=dataset_code,
+                        name=dataset_name,
+                        last_update=datetime(2013,10,28),
+                        doc_href="http://www.example.com",
+                        fetcher=f, 
+                        is_load_previous_version=False)
+            d.series.bulk_size = 3
+            d.series.data_iterator = PartitionSeriesIterator(d, 
+                                                             deepcopy(series_list), 
+                                                             fail_partition=fail_partition)
+            d.update_database()
+            return d
+        
+        query = {"provider_name": provider_name, "dataset_code": dataset_code}
+        
+        '''interrupted in partition C: A and B are committed'''
+        d = _run(fail_partition="C")
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 4)
+        checkpoint = self.db[constants.COL_CHECKPOINTS].find_one(query)
+        self.assertEqual(sorted(checkpoint["partitions"]), ["A", "B"])
+        self.assertEqual(checkpoint["last_partition"], "B")
+        self.assertEqual(checkpoint["count_inserts"], 4)
+        
+        '''resume: load only partition C and remove checkpoint'''
+        d = _run(resume=True)
+        self.assertEqual(d.series.data_iterator.partitions_loaded, ["C"])
+        self.assertEqual(d.series.count_inserts, 2)
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 6)
+        self.assertIsNone(self.db[constants.COL_CHECKPOINTS].find_one(query))
+
+        '''without resume: checkpoint is ignored'''
+        d = _run(fail_partition="C")
+        d = _run()
+        self.assertEqual(d.series.data_iterator.partitions_loaded, ["A", "B", "C"])
+        self.assertIsNone(self.db[constants.COL_CHECKPOINTS].find_one(query))
 
     def test_series_update_dataset_lists(self):
 
@@ -1519,12 +2202,69 @@ class DB_SeriesTestCase(BaseDBTestCase):
 
         bson_rev0 = self.db[constants.COL_SERIES_ARCHIVES].find_one({'slug': series_slug})
         self.assertIsNotNone(bson_rev0)
-        bson_rev0 = series_archives_load(bson_rev0)
+        self.assertEqual(bson_rev0["format"], "delta")
+        self.assertEqual(bson_rev0["delta"]["changed"][0]["value"], old_value)
+        bson_rev0 = series_archives_rebuild(self.db, bson["provider_name"], 
+                                            bson["dataset_code"], bson["key"], 0)
         self.assertEqual(bson_rev0["version"], 0)
         #FIXME: self.assertEqual(bson_rev0["last_update_ds"], old_release_date)
         self.assertEqual(bson_rev0["values"][0]["value"], old_value)
         
 
+    def test_series_archives_delta(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_series_archives_delta
+
+        def _version(version, values, name):
+            bson = deepcopy(SERIES1)
+            bson["version"] = version
+            bson["name"] = name
+            bson["values"] = [{"period": str(period), "value": value, "attributes": None} 
+                              for period, value in values]
+            return bson
+        
+        versions = [
+            _version(0, [(1995, "1.0"), (1996, "2.0"), (1997, "3.0")], "series1"),
+            _version(1, [(1995, "1.0"), (1996, "2.5"), (1997, "3.0"), (1998, "4.0")], "series1"),
+            _version(2, [(1996, "2.5"), (1997, "3.0"), (1998, "4.5")], "series1"),
+            _version(3, [(1996, "2.5"), (1997, "3.0"), (1998, "4.5")], "series1 new name"),
+        ]
+        versions[3]["notes"] = "notes"
+        
+        archive = series_archives_delta(versions[0], versions[1])
+        self.assertEqual(archive["version"], 0)
+        self.assertEqual(archive["delta"]["added"], ["1998"])
+        self.assertEqual(archive["delta"]["removed"], [])
+        self.assertEqual(archive["delta"]["changed"], [versions[0]["values"][1]])
+        self.assertEqual(series_delta_apply(versions[1], archive), versions[0])
+
+        archive = series_archives_delta(versions[2], versions[3])
+        self.assertEqual(archive["delta"]["fields"], {"name": "series1"})
+        self.assertEqual(archive["delta"]["unset"], ["notes"])
+        self.assertEqual(series_delta_apply(versions[3], archive), versions[2])
+
+        '''Legacy full archives for version 0 and 1, delta for version 2'''
+        self.db[constants.COL_SERIES].insert_one(deepcopy(versions[3]))
+        self.db[constants.COL_SERIES_ARCHIVES].insert_many([
+            series_archives_store(deepcopy(versions[0])),
+            series_archives_store(deepcopy(versions[1])),
+            series_archives_delta(versions[2], versions[3])
+        ])
+        
+        def _rebuild(version):
+            return series_archives_rebuild(self.db, "p1", "d1", "key1", version)
+
+        for bson in versions:
+            self.assertEqual(_rebuild(bson["version"]), bson)
+        self.assertIsNone(_rebuild(4))
+
+        self.assertEqual(series_archives_migrate(self.db, {"provider_name": "p1"}), 2)
+        self.assertEqual(self.db[constants.COL_SERIES_ARCHIVES].count({"format": "delta"}), 3)
+        self.assertEqual(series_archives_migrate(self.db), 0)
+
+        for bson in versions:
+            self.assertEqual(_rebuild(bson["version"]), bson)
+
 class DB_DummyTestCase(BaseDBTestCase):
 
     # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_DummyTestCase
@@ -1561,6 +2301,7 @@ class DB_DummyTestCase(BaseDBTestCase):
         series.pop('_id')
         series.pop('last_update_ds')
         series.pop('last_update_widu')
+        self.assertEqual(len(series.pop('hash')), 40)
         
         bson = {
          'version': 0,
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import shutil
+import pickle
+import multiprocessing
+
+import fakeredis
+
+from dlstats.tests.base import BaseTestCase
+from dlstats.cache import TwoTierCache, FileCache, Cache
+
+def write_keys(args):
+    filepath, worker = args
+    cache = FileCache(filepath)
+    for i in range(50):
+        cache.set("w%s.k%s" % (worker, i), i)
+    cache.set_many(dict([("w%s.m%s" % (worker, i), i) for i in range(50)]))
+    return worker
+
+class TwoTierCacheTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_cache:TwoTierCacheTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.client = fakeredis.FakeStrictRedis()
+        self.cache = TwoTierCache(self.client, key_prefix="test.", 
+                                  default_timeout=60, threshold=3)
+
+    def test_get_set(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:TwoTierCacheTestCase.test_get_set
+
+        self.assertIsNone(self.cache.get("k1"))
+        self.cache.set("k1", {"a": 1})
+        self.assertEqual(self.cache.get("k1"), {"a": 1})
+        '''Write-through'''
+        self.assertIsNotNone(self.client.get("test.k1"))
+        self.assertTrue(0 < self.client.ttl("test.k1") <= 60)
+
+        '''Other process: value from Redis is kept in the local tier'''
+        other = TwoTierCache(self.client, key_prefix="test.", default_timeout=60)
+        self.assertEqual(other.get("k1"), {"a": 1})
+        self.assertEqual(other.get("k1"), {"a": 1})
+        stats = other.stats()
+        self.assertEqual(stats["remote_hits"], 1)
+        self.assertEqual(stats["local_hits"], 1)
+        self.assertEqual(stats["round_trips"], 1)
+
+        self.assertTrue(self.cache.add("k2", 2))
+        self.assertFalse(self.cache.add("k2", 3))
+        self.assertEqual(self.cache.get("k2"), 2)
+
+        self.cache.delete("k2")
+        self.assertIsNone(self.cache.get("k2"))
+        self.assertIsNone(self.client.get("test.k2"))
+
+        self.cache.clear()
+        self.assertEqual(self.client.keys("test.*"), [])
+
+    def test_many(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:TwoTierCacheTestCase.test_many
+
+        self.cache.set_many({"k1": 1, "k2": 2, "k3": 3})
+        self.assertEqual(self.cache.stats()["round_trips"], 1)
+
+        other = TwoTierCache(self.client, key_prefix="test.", default_timeout=60)
+        self.assertEqual(other.get("k1"), 1)
+        self.assertEqual(other.get_many("k1", "k2", "k3", "k4"), [1, 2, 3, None])
+        stats = other.stats()
+        '''One round-trip for k1, one for k2, k3 and k4'''
+        self.assertEqual(stats["round_trips"], 2)
+        self.assertEqual(stats["hits"], 4)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.8)
+
+        other.delete_many("k1", "k2")
+        self.assertEqual(other.get_many("k1", "k2", "k3"), [None, None, 3])
+
+    def test_eviction(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:TwoTierCacheTestCase.test_eviction
+
+        for i in range(5):
+            self.cache.set("k%s" % i, i)
+        stats = self.cache.stats()
+        self.assertEqual(stats["evictions"], 2)
+        self.assertEqual(stats["local_size"], 3)
+
+        '''Evicted keys are still in Redis'''
+        self.assertEqual(self.cache.get("k0"), 0)
+        self.assertEqual(self.cache.stats()["remote_hits"], 1)
+
+        cache = TwoTierCache(self.client, key_prefix="test.", maxbytes=100)
+        cache.set("big1", "x" * 60)
+        cache.set("big2", "x" * 60)
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["local_size"], 1)
+
+    def test_werkzeug_format(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:TwoTierCacheTestCase.test_werkzeug_format
+
+        '''Values written by werkzeug RedisCache'''
+        self.client.set("test.ordinal", b"42")
+        self.client.set("test.slug", b"!" + pickle.dumps("a-text"))
+        self.client.set("test.bad", b"\x80\x04garbage")
+        self.client.set("test.bad_pickle", b"!garbage")
+
+        self.assertEqual(self.cache.get("ordinal"), 42)
+        self.assertEqual(self.cache.get("slug"), "a-text")
+        self.assertIsNone(self.cache.get("bad"))
+        self.assertEqual(self.cache.get_many("bad_pickle", "slug"), [None, "a-text"])
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+        self.cache.set("k1", 10)
+        self.cache.set("k2", True)
+        self.assertEqual(self.client.get("test.k1"), b"10")
+        self.assertTrue(self.client.get("test.k2").startswith(b"!"))
+        other = TwoTierCache(self.client, key_prefix="test.")
+        self.assertIs(other.get("k2"), True)
+
+class FileCacheTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_cache:FileCacheTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.cache_dir, "test.sqlite")
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_get_set(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:FileCacheTestCase.test_get_set
+
+        cache = FileCache(self.filepath)
+        self.assertIsNone(cache.get("k1"))
+        cache.set("k1", {"a": 1})
+        cache.set_many({"k2": 2, "k3": 3})
+        self.assertTrue(cache.add("k4", 4))
+        self.assertFalse(cache.add("k4", 5))
+
+        '''Persistent: other instance (next run)'''
+        cache = FileCache(self.filepath)
+        self.assertEqual(cache.get("k1"), {"a": 1})
+        self.assertEqual(cache.get_many("k2", "k3", "k4", "k5"), [2, 3, 4, None])
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 4)
+        self.assertEqual(stats["misses"], 1)
+
+        cache.delete_many("k1", "k2")
+        self.assertEqual(cache.get_many("k1", "k2", "k3"), [None, None, 3])
+
+        cache = Cache(cache_url="file://%s" % self.cache_dir)
+        self.assertTrue(cache.is_shared)
+        cache.set("k1", 1)
+        self.assertEqual(cache.get("k1"), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.cache_dir, "dlstats.sqlite")))
+
+    def test_timeout_and_size(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:FileCacheTestCase.test_timeout_and_size
+
+        cache = FileCache(self.filepath, maxbytes=1000)
+        cache.CHECK_SIZE_INTERVAL = 1
+
+        cache.set("k1", 1, timeout=0.01)
+        cache.set("k2", 2, timeout=0)
+        time.sleep(0.05)
+        self.assertIsNone(cache.get("k1"))
+        self.assertTrue(cache.add("k1", 3))
+        self.assertEqual(cache.get("k1"), 3)
+        
+        cache.set("k1", 1, timeout=0.01)
+        time.sleep(0.05)
+        cache.compact()
+        self.assertEqual(cache.stats()["expired"], 2)
+        self.assertEqual(cache.get("k2"), 2)
+
+        for i in range(10):
+            cache.set("big%s" % i, "x" * 200)
+        self.assertTrue(cache.stats()["evictions"] > 0)
+        '''The oldest entries are removed first'''
+        self.assertIsNone(cache.get("k2"))
+        self.assertEqual(cache.get("big9"), "x" * 200)
+        conn = cache._conn()
+        self.assertTrue(conn.execute("SELECT SUM(size) FROM cache").fetchone()[0] <= 1000)
+
+    def test_processes(self):
+
+        # nosetests -s -v dlstats.tests.test_cache:FileCacheTestCase.test_processes
+
+        FileCache(self.filepath)
+        with multiprocessing.Pool(4) as pool:
+            results = pool.map(write_keys, [(self.filepath, i) for i in range(4)])
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+
+        cache = FileCache(self.filepath)
+        for worker in range(4):
+            keys = ["w%s.k%s" % (worker, i) for i in range(50)]
+            keys += ["w%s.m%s" % (worker, i) for i in range(50)]
+            self.assertEqual(cache.get_many(*keys), list(range(50)) * 2)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import shutil
+
+import httpretty
+import requests
+
+from dlstats.tests.base import BaseTestCase
+from dlstats import http_policy
+from dlstats import utils
+
+class HTTPPolicyTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.sleeps = []
+        self.limiter = http_policy.HostLimiter()
+
+    def _policy(self, **kwargs):
+        return http_policy.HTTPPolicy(limiter=self.limiter, 
+                                      sleep=self.sleeps.append, 
+                                      **kwargs)
+
+    def test_token_bucket(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_token_bucket
+
+        bucket = http_policy.TokenBucket(rate=2, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        '''Third request in the same instant: 1 token at 2 by second'''
+        self.assertAlmostEqual(bucket.reserve(), 0.5, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 1.0, places=2)
+
+        bucket = http_policy.TokenBucket()
+        self.assertEqual(bucket.reserve(), 0)
+        bucket.defer(30)
+        self.assertAlmostEqual(bucket.reserve(), 30, places=1)
+
+        self.assertIs(self.limiter.bucket("http://www.example.org/a", rate=1),
+                      self.limiter.bucket("http://www.example.org/b", rate=1))
+        self.assertIsNot(self.limiter.bucket("http://www.example.org/a"),
+                         self.limiter.bucket("http://example.org/a"))
+
+        '''default_policy (rate=None) and a lower limit do not change the rate'''
+        bucket = self.limiter.bucket("http://www.example.org/a")
+        self.assertEqual(bucket.rate, 1)
+        self.limiter.bucket("http://www.example.org/a", rate=5, burst=4)
+        self.assertEqual((bucket.rate, bucket.burst), (1, 1))
+        self.limiter.bucket("http://www.example.org/a", rate=0.5, burst=2)
+        self.assertEqual((bucket.rate, bucket.burst), (0.5, 2))
+        self.assertIsNone(self.limiter.bucket("http://host.example.org/a").rate)
+        self.assertEqual(self.limiter.bucket("http://host.example.org/a", rate=2).rate, 2)
+
+    def test_get_retry_after(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_get_retry_after
+
+        response = requests.Response()
+        self.assertIsNone(http_policy.get_retry_after(response))
+        self.assertIsNone(http_policy.get_retry_after(None))
+        response.headers["Retry-After"] = "120"
+        self.assertEqual(http_policy.get_retry_after(response), 120)
+        response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+        self.assertEqual(http_policy.get_retry_after(response), 0)
+        response.headers["Retry-After"] = "xxx"
+        self.assertIsNone(http_policy.get_retry_after(response))
+
+    @httpretty.activate
+    def test_retry(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_retry
+
+        url = "http://www.example.org/data.json"
+        httpretty.register_uri(httpretty.GET, url, responses=[
+            httpretty.Response(body="", status=503),
+            httpretty.Response(body="", status=429, adding_headers={"Retry-After": "7"}),
+            httpretty.Response(body="DATA", status=200),
+        ])
+
+        policy = self._policy(max_retries=3, backoff_factor=1)
+        session = utils.http_session(policy=policy)
+        response = http_policy.http_get(session, url)
+        self.assertEqual(response.text, "DATA")
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+        '''Backoff with jitter, then Retry-After'''
+        retries = [seconds for seconds in self.sleeps if seconds > 0]
+        self.assertTrue(0 <= retries[0] <= 1)
+        self.assertTrue(6 < retries[-1] <= 7)
+        self.assertEqual(policy.stats()["retries"], 2)
+        self.assertEqual(utils.http_session_stats(session)["retries"], 2)
+
+        '''The host is deferred by Retry-After'''
+        self.assertTrue(self.limiter.bucket(url).reserve() > 6)
+
+    @httpretty.activate
+    def test_max_retries(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_max_retries
+
+        url = "http://www.example.org/data.json"
+        httpretty.register_uri(httpretty.GET, url, body="", status=503)
+
+        policy = self._policy(max_retries=2)
+        session = utils.http_session(policy=policy)
+        self.assertEqual(http_policy.http_get(session, url).status_code, 503)
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+        '''HTTPError of func'''
+        def func():
+            response = session.get(url)
+            response.raise_for_status()
+            return response
+        with self.assertRaises(requests.exceptions.HTTPError):
+            policy.call(url, func, max_retries=1)
+        self.assertEqual(len(httpretty.latest_requests()), 5)
+
+        '''Not retried'''
+        httpretty.register_uri(httpretty.GET, url, body="", status=404)
+        self.assertEqual(http_policy.http_get(session, url).status_code, 404)
+        self.assertEqual(len(httpretty.latest_requests()), 6)
+
+        '''Retry-After too long'''
+        httpretty.register_uri(httpretty.GET, url, body="", status=429,
+                               adding_headers={"Retry-After": "3600"})
+        self.assertEqual(http_policy.http_get(session, url).status_code, 429)
+        self.assertEqual(len(httpretty.latest_requests()), 7)
+
+    def test_connection_error(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_connection_error
+
+        calls = []
+        def func():
+            calls.append(1)
+            if len(calls) < 3:
+                raise requests.exceptions.ConnectionError("connection refused")
+            return "ok"
+
+        policy = self._policy(max_retries=3)
+        self.assertEqual(policy.call("http://www.example.org", func), "ok")
+        self.assertEqual(len(calls), 3)
+
+        with self.assertRaises(ValueError):
+            policy.call("http://www.example.org", lambda: int("x"))
+
+    @httpretty.activate
+    def test_downloader(self):
+
+        # nosetests -s -v dlstats.tests.test_http_policy:HTTPPolicyTestCase.test_downloader
+
+        url = "http://www.example.org/data.zip"
+        httpretty.register_uri(httpretty.GET, url, responses=[
+            httpretty.Response(body="", status=502),
+            httpretty.Response(body="DATA", status=200),
+        ])
+
+        store_filepath = tempfile.mkdtemp()
+        try:
+            session = utils.http_session(policy=self._policy(max_retries=0))
+            download = utils.Downloader(url=url, filename="data.zip", 
+                                        store_filepath=store_filepath, 
+                                        client=session, max_retries=1)
+            with open(download.get_filepath()) as fp:
+                self.assertEqual(fp.read(), "DATA")
+            self.assertEqual(len(httpretty.latest_requests()), 2)
+
+            download = utils.Downloader(url=url, filename="data2.zip", 
+                                        store_filepath=store_filepath, 
+                                        client=session)
+            httpretty.register_uri(httpretty.GET, url, body="", status=502)
+            filepath, response = download.get_filepath_and_response()
+            self.assertEqual(response.status_code, 502)
+            self.assertFalse(os.path.exists(filepath))
+        finally:
+            shutil.rmtree(store_filepath, ignore_errors=True)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from types import SimpleNamespace
+
+from bson import BSON
+
+from dlstats.tests.base import BaseTestCase
+from dlstats.mongo_monitor import CommandMonitor
+
+class CommandMonitorTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_mongo_monitor:CommandMonitorTestCase
+
+    def test_command_monitor(self):
+
+        # nosetests -s -v dlstats.tests.test_mongo_monitor:CommandMonitorTestCase.test_command_monitor
+
+        monitor = CommandMonitor()
+
+        commands = [
+            (1, {"find": "series", "filter": {"key": {"$in": ["a", "b"]}}}, {"ok": 1, "cursor": {"firstBatch": [{"key": "a"}]}}),
+            (2, {"insert": "series", "documents": [{"key": "c"}, {"key": "d"}]}, {"ok": 1, "n": 2}),
+            (3, {"update": "series", "updates": [{"q": {"_id": 1}, "u": {"key": "a"}},
+                                                 {"q": {"_id": 2}, "u": {"$set": {"hash": "x"}}}]}, {"ok": 1}),
+            (4, {"count": "datasets", "query": {"provider_name": "p1"}}, {"ok": 1, "n": 0}),
+            (5, {"ismaster": 1}, {"ok": 1}),
+            (6, {"delete": "series_archives", "deletes": [{"q": {}, "limit": 0}]}, None),
+        ]
+
+        for request_id, command, reply in commands:
+            name = list(command.keys())[0]
+            monitor.started(SimpleNamespace(command=command, command_name=name,
+                                            connection_id=("localhost", 27017),
+                                            request_id=request_id))
+            event = SimpleNamespace(command_name=name, reply=reply,
+                                    duration_micros=1500,
+                                    connection_id=("localhost", 27017),
+                                    request_id=request_id)
+            if reply:
+                monitor.succeeded(event)
+            else:
+                monitor.failed(event)
+
+        stats = monitor.snapshot()
+        self.assertEqual(stats["round_trips"], 6)
+        self.assertEqual(stats["failures"], 1)
+        self.assertEqual(stats["duration"], 0.009)
+        self.assertEqual(stats["bytes_sent"], sum([len(BSON.encode(c[1])) for c in commands]))
+        self.assertEqual(stats["bytes_received"], sum([len(BSON.encode(c[2])) for c in commands if c[2]]))
+
+        series = stats["collections"]["series"]
+        self.assertEqual(series["commands"], {"find": 1, "insert": 1, "update": 1})
+        self.assertEqual(series["round_trips"], 3)
+        self.assertEqual(series["inserts"], 2)
+        self.assertEqual(series["replaces"], 1)
+        self.assertEqual(series["updates"], 1)
+
+        self.assertEqual(stats["collections"]["datasets"]["commands"], {"count": 1})
+        self.assertEqual(stats["collections"]["_cmd"]["commands"], {"ismaster": 1})
+        self.assertEqual(stats["collections"]["series_archives"]["deletes"], 1)
+        self.assertEqual(stats["collections"]["series_archives"]["failures"], 1)
+
+        monitor.reset()
+        self.assertEqual(monitor.snapshot()["round_trips"], 0)
+
+    def test_command_monitor_without_bytes(self):
+
+        # nosetests -s -v dlstats.tests.test_mongo_monitor:CommandMonitorTestCase.test_command_monitor_without_bytes
+
+        monitor = CommandMonitor(count_bytes=False)
+
+        command = {"insert": "series", "documents": [{"key": "a"}]}
+        monitor.started(SimpleNamespace(command=command, command_name="insert",
+                                        connection_id=("localhost", 27017),
+                                        request_id=1))
+        monitor.succeeded(SimpleNamespace(command_name="insert", reply={"ok": 1, "n": 1},
+                                          duration_micros=1000,
+                                          connection_id=("localhost", 27017),
+                                          request_id=1))
+
+        stats = monitor.snapshot()
+        self.assertEqual(stats["round_trips"], 1)
+        self.assertEqual(stats["bytes_sent"], 0)
+        self.assertEqual(stats["bytes_received"], 0)
+        self.assertEqual(stats["collections"]["series"]["inserts"], 1)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from copy import deepcopy
+import pickle
+
+from dlstats.tests.base import BaseTestCase
+from dlstats.observations import Observations
+from dlstats.fetchers import schemas
+from dlstats.fetchers._commons import (series_hash,
+                                       series_is_changed,
+                                       series_clean_field)
+
+VALUES = [
+    {"period": "2000", "value": "1.5", "attributes": {}},
+    {"period": "2001", "value": "2.5", "attributes": {"OBS_STATUS": "E"}},
+    {"period": "2002", "value": "NaN", "attributes": {}},
+]
+
+SERIES = {
+    'provider_name': 'p1',
+    'dataset_code': 'd1',
+    'name': 'series1',
+    'key': 'key1',
+    'slug': 'p1-d1-key1',
+    'version': 0,
+    'start_date': 30,
+    'end_date': 32,
+    'frequency': 'A',
+    'dimensions': {'Country': 'FRA'},
+    'attributes': None,
+    'values': VALUES,
+}
+
+class ObservationsTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_observations:ObservationsTestCase
+
+    def test_container(self):
+
+        # nosetests -s -v dlstats.tests.test_observations:ObservationsTestCase.test_container
+
+        obs = Observations.from_bson(deepcopy(VALUES), empty={})
+
+        self.assertEqual(len(obs), 3)
+        self.assertEqual(obs.periods, ["2000", "2001", "2002"])
+        self.assertEqual(obs.values, ["1.5", "2.5", "NaN"])
+        self.assertEqual(list(obs.attributes.keys()), [1])
+        self.assertEqual(obs[0], VALUES[0])
+        self.assertEqual(obs[-1]["period"], "2002")
+        self.assertEqual(obs.to_bson(), VALUES)
+        self.assertEqual(obs, VALUES)
+        self.assertEqual(pickle.loads(pickle.dumps(obs)), obs)
+
+        obs.reverse()
+        self.assertEqual(obs.to_bson(), list(reversed(VALUES)))
+
+        with self.assertRaises(IndexError):
+            obs[3]
+
+        obs = Observations()
+        obs.append("2000", "1")
+        self.assertEqual(obs.to_bson(), [{"period": "2000", "value": "1", "attributes": None}])
+
+    def test_series_functions(self):
+
+        # nosetests -s -v dlstats.tests.test_observations:ObservationsTestCase.test_series_functions
+
+        series_list = deepcopy(SERIES)
+        series_obs = deepcopy(SERIES)
+        series_obs["values"] = Observations.from_bson(series_obs["values"], empty={})
+
+        series_clean_field(series_list)
+        series_clean_field(series_obs)
+
+        self.assertEqual(series_obs["values"].to_bson(), series_list["values"])
+        self.assertEqual(series_obs["values"][1]["attributes"], {"obs-status": "e"})
+        self.assertEqual(series_obs["start_ts"], series_list["start_ts"])
+        self.assertEqual(series_obs["end_ts"], series_list["end_ts"])
+
+        self.assertEqual(series_hash(series_obs), series_hash(series_list))
+        self.assertFalse(series_is_changed(series_obs, series_list))
+
+        series_obs["values"].values[2] = "3.5"
+        self.assertTrue(series_is_changed(series_obs, series_list))
+
+    def test_schema(self):
+
+        # nosetests -s -v dlstats.tests.test_observations:ObservationsTestCase.test_schema
+
+        obs = Observations.from_bson(deepcopy(VALUES), empty={})
+        self.assertEqual(schemas.observations_validator(obs), obs)
+
+        obs.values[0] = 1.5
+        with self.assertRaises(schemas.Invalid):
+            schemas.observations_validator(obs)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import random
+from datetime import date, datetime, timedelta
+
+import pandas
+
+from dlstats.tests.base import BaseTestCase
+from dlstats import periods
+
+class PeriodsTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_periods:PeriodsTestCase
+
+    def test_period_to_ordinal(self):
+
+        # nosetests -s -v dlstats.tests.test_periods:PeriodsTestCase.test_period_to_ordinal
+
+        TEST_VALUES = [
+            ("1970", "A", 0),
+            ("1969", "A", -1),
+            ("1970-Q1", "Q", 0),
+            ("1968Q1", "Q", -8),
+            ("1970-07", "Q", 2),
+            ("197001", "M", 0),
+            ("1969-12", "M", -1),
+            ("2016-01-27", "W-WED", 2404),
+            ("2016-01-27", "W-MON", 2405),
+            ("1970-01-01", "D", 0),
+            ("1970-01-03", "B", 2),
+            ("2000-S2", "S", 962409600),
+        ]
+
+        for date_str, freq, result in TEST_VALUES:
+            self.assertEqual(periods.period_to_ordinal(date_str, freq), result, 
+                             "DATE[%s] - FREQ[%s]" % (date_str, freq))
+
+        '''Compact month only for the frequency M'''
+        self.assertEqual(periods.period_to_ordinal("200808", "D"), 
+                         pandas.Period("200808", freq="D").ordinal)
+        self.assertIsNone(periods.parse_period("200808", "D"))
+
+        self.assertEqual(periods.ordinal_to_datetime(2404, "W-WED"), datetime(2016, 1, 21))
+        self.assertEqual(periods.ordinal_to_datetime(2404, "W-WED", how="end"), 
+                         datetime(2016, 1, 27, 23, 59, 59, 999999))
+
+        self.assertEqual(periods.periods_to_ordinals(["1970-01", "1970-02", "1970-01"], "M"), 
+                         [0, 1, 0])
+        array = periods.periods_to_ordinals(["1970", "1971"], "A", as_array=True)
+        self.assertEqual(array.tolist(), [0, 1])
+
+    def test_same_as_pandas(self):
+
+        # nosetests -s -v dlstats.tests.test_periods:PeriodsTestCase.test_same_as_pandas
+
+        '''Random dates, formats and ordinals must give the results of pandas.Period'''
+        rand = random.Random(1)
+        formats = ["%Y-%m-%d", "%Y%m%d", "%Y-%m", "%Y%m", "%Y"]
+
+        for i in range(2000):
+            freq = rand.choice(periods.FREQUENCIES)
+
+            dt = date(1900, 1, 1) + timedelta(days=rand.randint(0, 60000))
+            date_str = dt.strftime(rand.choice(formats))
+            msg = "DATE[%s] - FREQ[%s]" % (date_str, freq)
+            try:
+                expected = pandas.Period(date_str, freq=freq).ordinal
+            except ValueError:
+                '''Not a period for pandas: YYYYMM parsed as a date'''
+                with self.assertRaises(ValueError, msg=msg):
+                    periods.period_to_ordinal(date_str, freq)
+            else:
+                self.assertEqual(periods.period_to_ordinal(date_str, freq),
+                                 expected, msg)
+
+            if freq == "S":
+                ordinal = rand.randint(-10**9, 10**9)
+            else:
+                ordinal = rand.randint(-200, 200)
+            period = pandas.Period(ordinal=ordinal, freq=freq)
+            msg = "ORDINAL[%s] - FREQ[%s]" % (ordinal, freq)
+            self.assertEqual(periods.ordinal_to_datetime(ordinal, freq),
+                             period.start_time.to_pydatetime(), msg)
+            self.assertEqual(periods.ordinal_to_datetime(ordinal, freq, how="end"),
+                             period.end_time.to_pydatetime(warn=False), msg)
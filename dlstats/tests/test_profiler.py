@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import shutil
+
+from dlstats.tests.base import BaseTestCase
+from dlstats.profiler import profile_dataset, merge_profiles, profile_filename
+
+def fibo(n):
+    if n < 2:
+        return n
+    return fibo(n - 1) + fibo(n - 2)
+
+def work():
+    return [fibo(15) for i in range(5)]
+
+class ProfilerTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_profiler:ProfilerTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.profile_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_profile_dataset(self):
+
+        # nosetests -s -v dlstats.tests.test_profiler:ProfilerTestCase.test_profile_dataset
+
+        with profile_dataset(None, "p1", "d1"):
+            work()
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+        with profile_dataset(self.profile_dir, "p1", "d1"):
+            work()
+        with profile_dataset(self.profile_dir, "p1", "d2/x", memory=True):
+            work()
+
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         ["p1-d1.pstats", "p1-d2_x.pstats", "p1-d2_x.tracemalloc.txt"])
+
+        stats = merge_profiles(self.profile_dir, "p1")
+        self.assertIsNotNone(stats)
+        self.assertTrue(os.path.exists(profile_filename(self.profile_dir, "p1")))
+        self.assertIsNone(merge_profiles(self.profile_dir, "p2"))
+
+        filepath = profile_filename(self.profile_dir, "p1", ext="collapsed.txt")
+        with open(filepath) as fp:
+            lines = fp.read().splitlines()
+        self.assertTrue(len(lines) > 0)
+        for line in lines:
+            stack, value = line.rsplit(" ", 1)
+            self.assertTrue(int(value) > 0)
+        self.assertTrue(any(["(work);" in line and "(fibo)" in line for line in lines]))
+
+    def test_merge_profiles_since(self):
+
+        # nosetests -s -v dlstats.tests.test_profiler:ProfilerTestCase.test_merge_profiles_since
+
+        with profile_dataset(self.profile_dir, "p1", "old"):
+            work()
+        filepath = profile_filename(self.profile_dir, "p1", "old")
+        since = time.time() - 1
+        '''Profile of a previous run'''
+        os.utime(filepath, (since - 3600, since - 3600))
+
+        self.assertIsNone(merge_profiles(self.profile_dir, "p1", since=since))
+
+        with profile_dataset(self.profile_dir, "p1", "d1"):
+            fibo(10)
+        stats = merge_profiles(self.profile_dir, "p1", since=since)
+        self.assertFalse(any([func[2] == "work" for func in stats.stats.keys()]))
+        self.assertTrue(any([func[2] == "work" for func in merge_profiles(self.profile_dir, "p1").stats.keys()]))
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import io
+import os
+import time
+import tempfile
+import shutil
+import threading
+
+import httpretty
+import requests
+
 from dlstats.tests.base import BaseTestCase
 
 from dlstats import utils
 from dlstats import cache
+from dlstats import constants
 
 class UtilsTestCase(BaseTestCase):
     
@@ -89,3 +100,259 @@ class UtilsTestCase(BaseTestCase):
             _value = utils.get_ordinal_from_period(date_str, freq)
             msg = "DATE[%s] - FREQ[%s] - ATEMPT[%s] - RETURN[%s]" % (date_str, freq, result, _value)
             self.assertEquals(_value, result, msg) 
+
+    def test_slugify_cache(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_slugify_cache
+
+        utils.slugify_cache.clear()
+        utils.slugify_cache.reset_stats()
+
+        self.assertEqual(utils.slugify("A Text"), "a-text")
+        self.assertEqual(utils.slugify("A Text"), "a-text")
+        '''kwargs are in the key'''
+        self.assertEqual(utils.slugify("A Text", separator="_"), "a_text")
+        self.assertEqual(utils.slugify("A Text", separator="_"), "a_text")
+
+        stats = utils.slugify_cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+        '''list and dict kwargs'''
+        self.assertEqual(utils.slugify("A b", stopwords=["a"]), "b")
+        self.assertEqual(utils.slugify("A b", stopwords=["a"]), "b")
+        self.assertEqual(utils.slugify("A b", replacements=[["b", "c"]]), "a-c")
+        self.assertEqual(utils.slugify_cache.stats()["hits"], 3)
+
+        lru = utils.LRUCache(maxsize=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        self.assertEqual(lru.get("a"), 1)
+        lru.set("c", 3)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(len(lru), 2)
+
+    @httpretty.activate
+    def test_downloader_conditional(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_downloader_conditional
+
+        url = "http://www.example.org/data.zip"
+        requests_headers = []
+
+        def request_callback(request, uri, headers):
+            requests_headers.append(dict(request.headers))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return (304, headers, "")
+            headers["ETag"] = '"v1"'
+            headers["Last-Modified"] = "Mon, 04 Jul 2016 10:00:00 GMT"
+            return (200, headers, "DATA")
+
+        httpretty.register_uri(httpretty.GET, url, body=request_callback)
+
+        store_filepath = tempfile.mkdtemp()
+        validators = utils.http_validators
+        validators.path = validators_path = tempfile.mkdtemp()
+        try:
+            '''Not enabled: no conditional request and no validators stored'''
+            download = utils.Downloader(url=url, filename="data.zip", 
+                                        store_filepath=store_filepath, conditional=True)
+            with open(download.get_filepath()) as fp:
+                self.assertEqual(fp.read(), "DATA")
+            self.assertIsNone(validators.get(url))
+
+            validators.begin(enabled=True)
+            download.get_filepath()
+            '''Pending until commit'''
+            self.assertIsNone(validators.get(url))
+            validators.commit()
+            self.assertEqual(validators.get(url)["etag"], '"v1"')
+
+            validators.begin(enabled=True)
+            with self.assertRaises(utils.NotModified):
+                download.get_filepath()
+            validators.discard()
+            self.assertEqual(requests_headers[-1]["If-None-Match"], '"v1"')
+            self.assertEqual(requests_headers[-1]["If-Modified-Since"], 
+                             "Mon, 04 Jul 2016 10:00:00 GMT")
+            '''The previous file is not removed'''
+            self.assertTrue(os.path.exists(download.filepath))
+        finally:
+            validators.path = constants.HTTP_VALIDATORS_PATH
+            shutil.rmtree(store_filepath, ignore_errors=True)
+            shutil.rmtree(validators_path, ignore_errors=True)
+
+    @httpretty.activate
+    def test_http_session(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_http_session
+
+        httpretty.register_uri(httpretty.GET, "http://www.example.org/a.xml", body="A")
+        httpretty.register_uri(httpretty.GET, "http://www.example.org/b.xml", body="B")
+
+        session = utils.http_session(pool_maxsize=2)
+        self.assertEqual(utils.http_session_stats(session), 
+                         {"requests": 0, "connections": 0, "retries": 0, "wait": 0.0})
+
+        for i in range(3):
+            self.assertEqual(session.get("http://www.example.org/a.xml").text, "A")
+            self.assertEqual(session.get("http://www.example.org/b.xml").text, "B")
+
+        '''The connection of the host is reused'''
+        self.assertEqual(utils.http_session_stats(session), 
+                         {"requests": 6, "connections": 1, "retries": 0, "wait": 0.0})
+
+        session = utils.http_session(keep_alive=False)
+        session.get("http://www.example.org/a.xml")
+        self.assertEqual(httpretty.last_request().headers["Connection"], "close")
+
+        self.assertEqual(utils.http_session_stats(None), 
+                         {"requests": 0, "connections": 0, "retries": 0, "wait": 0.0})
+
+    def test_prefetch(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_prefetch
+
+        lock = threading.Lock()
+        running = {"current": 0, "max": 0}
+        consumed = []
+
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        def func(i):
+            with lock:
+                running["current"] += 1
+                running["max"] = max(running["max"], running["current"])
+            '''The last items are the fastest'''
+            time.sleep((10 - i) * 0.002)
+            with lock:
+                running["current"] -= 1
+            if i == 7:
+                raise ValueError("error-7")
+            return i * 2
+
+        results = []
+        with self.assertRaises(ValueError):
+            for i, value in utils.prefetch(items(), func, workers=3):
+                results.append((i, value))
+                if i == 0:
+                    '''Items are consumed lazily'''
+                    self.assertTrue(len(consumed) <= 4)
+
+        self.assertEqual(results, [(i, i * 2) for i in range(7)])
+        self.assertEqual(running["max"], 3)
+        '''Not more than workers items after the item in error'''
+        self.assertTrue(len(consumed) <= 11)
+
+        self.assertEqual(list(utils.prefetch(range(3), lambda i: i + 1)),
+                         [(0, 1), (1, 2), (2, 3)])
+
+        '''Pending calls are cancelled when the generator is closed'''
+        gen = utils.prefetch(range(100), func, workers=2)
+        self.assertEqual(next(gen), (0, 0))
+        gen.close()
+        self.assertTrue(running["current"] == 0)
+
+    @httpretty.activate
+    def test_downloader_metrics(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_downloader_metrics
+
+        url = "http://www.example.org/data.zip"
+        httpretty.register_uri(httpretty.GET, url, body="A" * 3000)
+
+        store_filepath = tempfile.mkdtemp()
+        utils.download_stats.reset()
+        try:
+            download = utils.Downloader(url=url, filename="data.zip", 
+                                        store_filepath=store_filepath,
+                                        chunk_size=1024, preallocate=True)
+            self.assertEqual(os.path.getsize(download.get_filepath()), 3000)
+            self.assertEqual(download.metrics["bytes"], 3000)
+            self.assertEqual(download.metrics["host"], "www.example.org")
+
+            stats = utils.download_stats.snapshot()
+            self.assertEqual(stats["count"], 1)
+            self.assertEqual(stats["bytes"], 3000)
+            self.assertEqual(stats["hosts"]["www_example_org"]["count"], 1)
+            self.assertEqual(len(stats["files"]), 1)
+
+            '''Connection closed before the Content-Length'''
+            class Client:
+                def get(self, url, **kwargs):
+                    response = requests.Response()
+                    response.status_code = 200
+                    response.headers["Content-Length"] = "100"
+                    response.raw = io.BytesIO(b"B" * 10)
+                    return response
+
+            download = utils.Downloader(url=url, filename="data.zip", 
+                                        store_filepath=store_filepath, 
+                                        client=Client())
+            with self.assertRaises(utils.IncompleteDownload):
+                download.get_filepath()
+            '''The previous file is not replaced'''
+            self.assertEqual(os.path.getsize(download.filepath), 3000)
+            self.assertEqual(os.listdir(store_filepath), ["data.zip"])
+            self.assertEqual(utils.download_stats.snapshot()["count"], 1)
+        finally:
+            utils.download_stats.reset()
+            shutil.rmtree(store_filepath, ignore_errors=True)
+
+    def test_stage_timers(self):
+
+        # nosetests -s -v dlstats.tests.test_utils:UtilsTestCase.test_stage_timers
+
+        timers = utils.StageTimers()
+        
+        with timers.timer("parse"):
+            pass
+        with timers.timer("parse"):
+            pass
+        timers.add("download", 1.5, bytes=100)
+        
+        stages = timers.snapshot()
+        self.assertEqual(sorted(stages.keys()), ["download", "parse"])
+        self.assertEqual(stages["parse"]["count"], 2)
+        self.assertTrue(stages["parse"]["time"] >= 0)
+        self.assertEqual(stages["download"], {"time": 1.5, "count": 1, "bytes": 100})
+        
+        timers.merge({"download": {"time": 0.5, "count": 2, "bytes": 50}})
+        self.assertEqual(timers.snapshot()["download"], {"time": 2.0, "count": 3, "bytes": 150})
+        
+        timers.reset()
+        self.assertEqual(timers.snapshot(), {})
+        
+        '''Nested stages are subtracted from the outer stage'''
+        with timers.timer("parse"):
+            time.sleep(0.02)
+            timers.add("download", 10.0)
+            with timers.timer("wait"):
+                time.sleep(0.05)
+        stages = timers.snapshot()
+        self.assertTrue(stages["wait"]["time"] >= 0.05)
+        self.assertTrue(stages["parse"]["time"] < 0.05)
+        self.assertFalse("background" in stages["download"])
+        
+        '''Time of the other threads is background'''
+        thread = threading.Thread(target=timers.add, args=("download", 1.0))
+        thread.start()
+        thread.join()
+        self.assertEqual(timers.snapshot()["download"]["background"], 1.0)
+        timers.reset()
+        
+        @utils.stage_timer("func")
+        def func():
+            "doc"
+            return 1
+        
+        utils.stages.reset()
+        self.assertEqual(func(), 1)
+        self.assertEqual(func.__name__, "func")
+        self.assertEqual(utils.stages.snapshot()["func"]["count"], 1)
@@ -1,13 +1,25 @@
 # -*- coding: utf-8 -*-
 
 import hashlib
+import json
 from datetime import datetime
 import time
 import os
+import sys
 import logging
 import tempfile
 from io import StringIO
 import traceback
+import threading
+import functools
+import concurrent.futures
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+try:
+    import resource
+except ImportError:
+    resource = None
 
 import requests
 import arrow
@@ -15,6 +27,11 @@ from bson import ObjectId
 from slugify import slugify as original_slugify
 
 from widukind_common.debug import timeit
+from widukind_common import errors
+
+from dlstats import constants
+from dlstats import periods
+from dlstats.http_policy import get_policy
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +65,437 @@ def make_store_path(base_path=None, provider_name=None, dataset_code=None):
 def get_url_hash(url):
     return hashlib.sha224(url.encode("utf-8")).hexdigest()    
 
+def get_rss():
+    """Return the current resident set size of the process in bytes
+    
+    Read /proc/self/statm (Linux) or use psutil if installed. Return 0 
+    if not available.
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return 0
+
+def get_max_rss():
+    """Return the peak resident set size of the process in bytes"""
+    if not resource:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss
+    return max_rss * 1024
+
+class StageTimers:
+    """Cumulative timers and counters by stage of a dataset run
+    
+    Stages are shared by the threads of the process. The instance 
+    :data:`stages` is reset for each dataset (Datasets.__init__) and 
+    recorded in the stages field of stats_run.
+    
+    The time of a stage is its own time: the stages timed inside it in 
+    the same thread (timer() or add()) are subtracted. The time recorded 
+    by other threads than the thread of reset() (prefetch downloads) 
+    overlaps the other stages and is also counted in background.
+    
+    >>> with stages.timer("download"):
+    ...     pass
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {}
+        self.owner = threading.get_ident()
+        
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.owner = threading.get_ident()
+    
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _add(self, name, duration, count=1, **counters):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"time": 0.0, "count": 0}
+            stage["time"] += duration
+            stage["count"] += count
+            if threading.get_ident() != self.owner:
+                counters["background"] = counters.get("background", 0.0) + duration
+            for key, value in counters.items():
+                stage[key] = stage.get(key, 0) + value
+
+    def add(self, name, duration, count=1, **counters):
+        """Add a duration measured inside the current stage of the thread"""
+        self._add(name, duration, count=count, **counters)
+        stack = self._stack()
+        if stack:
+            stack[-1] += duration
+
+    @contextmanager
+    def timer(self, name, count=1):
+        stack = self._stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            nested = stack.pop()
+            self._add(name, max(0.0, duration - nested), count=count)
+            if stack:
+                stack[-1] += duration
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stage) for name, stage in self.stages.items()}
+
+    def merge(self, stages):
+        """Add stages returned by snapshot() (from another process)"""
+        for name, stage in stages.items():
+            stage = dict(stage)
+            self._add(name, stage.pop("time"), count=stage.pop("count"), **stage)
+
+stages = StageTimers()
+
+def stage_timer(name):
+    """Decorator: add the time of each call to the stage name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stages.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class DownloadStats:
+    """Metrics of the downloads of the process
+    
+    Each download adds its bytes, seconds and host. The instance 
+    :data:`download_stats` is reset for each dataset (Datasets.__init__) and 
+    recorded in the downloads field of stats_run:
+    
+    - count, bytes, seconds and throughput (bytes by second)
+    - by host: same counters
+    - files: metrics of the first max_files downloads
+    """
+    
+    def __init__(self, max_files=100):
+        self._lock = threading.Lock()
+        self.max_files = max_files
+        self.reset()
+        
+    def reset(self):
+        with self._lock:
+            self.hosts = {}
+            self.files = []
+    
+    def add(self, url, size, seconds):
+        host = urlparse(url).netloc
+        metrics = {"url": url, "host": host, "bytes": size, 
+                   "seconds": round(seconds, 3),
+                   "throughput": throughput(size, seconds)}
+        with self._lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = self.hosts[host] = {"count": 0, "bytes": 0, "seconds": 0.0}
+            stats["count"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += seconds
+            if len(self.files) < self.max_files:
+                self.files.append(metrics)
+        return metrics
+
+    def snapshot(self):
+        with self._lock:
+            totals = {"count": 0, "bytes": 0, "seconds": 0.0}
+            hosts = {}
+            for host, stats in self.hosts.items():
+                for key in totals.keys():
+                    totals[key] += stats[key]
+                stats = dict(stats)
+                stats["throughput"] = throughput(stats["bytes"], stats["seconds"])
+                stats["seconds"] = round(stats["seconds"], 3)
+                hosts[host.replace(".", "_")] = stats
+            totals["throughput"] = throughput(totals["bytes"], totals["seconds"])
+            totals["seconds"] = round(totals["seconds"], 3)
+            totals["hosts"] = hosts
+            totals["files"] = [dict(metrics) for metrics in self.files]
+            return totals
+
+def throughput(size, seconds):
+    """Bytes by second or None"""
+    if not seconds:
+        return None
+    return round(size / seconds, 1)
+
+download_stats = DownloadStats()
+
+class LRUCache:
+    """Bounded in-process cache with least recently used eviction
+    
+    Bounded by the count of entries (maxsize) and, if maxbytes is set, 
+    by the sum of the sizes given to set(). Thread safe. hits, misses and 
+    evictions are reset by reset_stats() only.
+    """
+    
+    def __init__(self, maxsize=10000, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            if key in self._sizes:
+                self.bytes -= self._sizes.pop(key)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if size:
+                self._sizes[key] = size
+                self.bytes += size
+            while len(self._data) > self.maxsize or \
+                    (self.maxbytes and self.bytes > self.maxbytes and len(self._data) > 1):
+                old_key, old_value = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key, 0)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self.bytes -= self._sizes.pop(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def merge(self, stats):
+        """Add hits, misses and evictions returned by stats() (from another process)"""
+        with self._lock:
+            self.hits += stats.get("hits", 0)
+            self.misses += stats.get("misses", 0)
+            self.evictions += stats.get("evictions", 0)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, 
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "size": len(self._data),
+                    "maxsize": self.maxsize,
+                    "bytes": self.bytes,
+                    "hit_ratio": round(self.hits / total, 4) if total else None}
+
+'''Cache of slugify(), counters are reset for each dataset (Datasets.__init__)'''
+slugify_cache = LRUCache(maxsize=constants.SLUGIFY_CACHE_SIZE)
+
+
+class NotModified(errors.RejectUpdatedDataset):
+    """The server answered 304 to a conditional download"""
+
+class IncompleteDownload(requests.exceptions.ConnectionError):
+    """The connection is closed before the Content-Length of the response"""
+
+def preallocate(fp, length):
+    """Reserve length bytes for the file fp (fail now if disk is full)"""
+    if hasattr(os, "posix_fallocate"):
+        os.posix_fallocate(fp.fileno(), 0, length)
+
+class HTTPValidators:
+    """Persistent store of ETag and Last-Modified headers by URL
+    
+    One JSON file by get_url_hash(url) in path.
+    
+    Conditional requests are only sent by the thread between begin(True) 
+    and commit() or discard() (see Fetcher.wrap_upsert_dataset). The 
+    validators of the downloads are pending until commit(), so after a 
+    failed update the file is downloaded again.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        
+    def _filepath(self, url):
+        return os.path.join(self.path, "%s.json" % get_url_hash(url))
+        
+    def get(self, url):
+        try:
+            with open(self._filepath(url)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+        
+    def save(self, url, validators):
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp_filepath = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump(dict(validators, url=url), fp)
+        os.replace(tmp_filepath, self._filepath(url))
+        
+    def delete(self, url):
+        try:
+            os.remove(self._filepath(url))
+        except OSError:
+            pass
+
+    def begin(self, enabled=True):
+        self._local.enabled = enabled
+        self._local.pending = {}
+        
+    def is_enabled(self):
+        return getattr(self._local, "enabled", False)
+    
+    def add_pending(self, url, headers):
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            return
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag or last_modified:
+            pending[url] = {"etag": etag, "last_modified": last_modified}
+        else:
+            pending[url] = None
+
+    def commit(self):
+        for url, validators in (getattr(self._local, "pending", None) or {}).items():
+            if validators:
+                self.save(url, validators)
+            else:
+                self.delete(url)
+        self.discard()
+                
+    def discard(self):
+        self._local.enabled = False
+        self._local.pending = None
+
+http_validators = HTTPValidators(constants.HTTP_VALIDATORS_PATH)
+
+def _prefetch_result(future):
+    """Wait for the result of a prefetch (in the stage prefetch_wait)"""
+    with stages.timer("prefetch_wait"):
+        return future.result()
+
+def prefetch(items, func, workers=1):
+    """Yield (item, func(item)) in the order of items
+
+    With workers > 1, func is called in a pool of threads for the next 
+    workers items while the caller processes the current result. Items are 
+    consumed lazily and the exception of func is raised when its item is 
+    reached. The pending calls are cancelled if the generator is closed.
+    The time waiting for a result is the stage prefetch_wait.
+
+    >>> for url, content in prefetch(urls, download, workers=4):
+    ...     parse(content)
+    """
+    if not workers or workers <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    pending = deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) > workers:
+                item, future = pending.popleft()
+                yield item, _prefetch_result(future)
+        while pending:
+            item, future = pending.popleft()
+            yield item, _prefetch_result(future)
+    finally:
+        for item, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+def http_session(pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, policy=None):
+    """Return a requests.Session with a connection pool for http and https
+
+    :param int pool_connections: Number of hosts kept in the pool
+    :param int pool_maxsize: Number of connections kept by host
+    :param bool pool_block: Wait for a free connection when pool_maxsize 
+                            connections are in use
+    :param bool keep_alive: False for close the connection after each request
+    :param dlstats.http_policy.HTTPPolicy policy: Rate limit and retry policy 
+                                                  of the requests of the session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize,
+                                            pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
+    session.http_policy = policy
+    return session
+
+def http_session_stats(session):
+    """Return counters of the pools and of the policy of session
+
+    - requests
+    - connections: new connections opened by the pools
+    - retries and wait (seconds of backoff and rate limit) of the policy
+    """
+    stats = {"requests": 0, "connections": 0, "retries": 0, "wait": 0.0}
+    policy = getattr(session, "http_policy", None)
+    if policy:
+        stats.update(policy.stats())
+    adapters = getattr(session, "adapters", None) or {}
+    seen = []
+    for adapter in adapters.values():
+        if adapter in seen or not hasattr(adapter, "poolmanager"):
+            continue
+        seen.append(adapter)
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    return stats
+
 class Downloader:
     
     DEFAULT_HEADERS = {
@@ -55,9 +503,23 @@ class Downloader:
     }
     
     def __init__(self, url=None, filename=None, store_filepath=None, 
-                 timeout=None, max_retries=0, 
+                 timeout=None, max_retries=None, 
                  replace=True, force_replace=True, use_existing_file=False,
-                 headers={}, client=None):
+                 headers={}, client=None, conditional=False,
+                 chunk_size=None, check_length=True, preallocate=False):
+        """
+        :param int max_retries: Retries of the download (default: max_retries 
+                                of the policy of client)
+        :param bool conditional: Send If-None-Match/If-Modified-Since with the 
+                                 validators of :data:`http_validators` and 
+                                 raise :class:`NotModified` for 304 
+        :param int chunk_size: Read buffer in bytes 
+                               (default: constants.DOWNLOAD_CHUNK_SIZE)
+        :param bool check_length: Raise :class:`IncompleteDownload` if the 
+                                  bytes received are not the Content-Length
+        :param bool preallocate: Reserve the Content-Length on disk before 
+                                 the transfer
+        """
         
         self.url = url
         self.filename = filename
@@ -68,6 +530,11 @@ class Downloader:
         self.headers = headers
         self.client = client or requests
         self.use_existing_file = use_existing_file
+        self.conditional = conditional
+        self.chunk_size = chunk_size or constants.DOWNLOAD_CHUNK_SIZE
+        self.check_length = check_length
+        self.preallocate = preallocate
+        self.metrics = None
 
         if not self.url:
             raise ValueError("url is required")
@@ -91,51 +558,105 @@ class Downloader:
 
     def _download(self, raise_errors=True):
         
-        #TODO: max_retries (self.max_retries)
-        #TODO: analyse rate limit dans headers
-        
-        start = time.time()
+        headers = self.headers
+        is_conditional = False
+        if self.conditional and http_validators.is_enabled():
+            validators = http_validators.get(self.url)
+            if validators:
+                is_conditional = True
+                headers = dict(headers)
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+
         try:
-            response = self.client.get(self.url, 
-                                    timeout=self.timeout, 
-                                    stream=True,
-                                    allow_redirects=True,
-                                    verify=False,
-                                    headers=self.headers)
-
-            code = int(response.status_code)
-            
-            if code == 304 or code >= 400:
-                msg = "download url[%s] - status_code[%s] - reason[%s]" % (self.url, 
-                                                                           code, 
-                                                                           response.reason)
-                if raise_errors:
-                    logger.error(msg)
-                    raise response.raise_for_status()
-                else:
-                    logger.warning(msg)
-                    return response
-
-            with open(self.filepath, mode='wb') as f:
-                for chunk in response.iter_content():
-                    f.write(chunk)
-
-            return response
-        
+            return get_policy(self.client).call(self.url, 
+                                                lambda: self._download_once(headers, is_conditional, raise_errors),
+                                                max_retries=self.max_retries)
+        except NotModified:
+            raise
         except Exception as err:
             logger.critical("Not captured exception : %s" % str(err))
             raise
-
-        end = time.time() - start
-        logger.info("download file[%s] - END - time[%.3f seconds]" % (self.url, end))
     
-    def get_filepath(self):
+    def _download_once(self, headers, is_conditional, raise_errors):
+        '''One attempt of _download()'''
         
-        if os.path.exists(self.filepath) and not self.use_existing_file and self.force_replace:
-            os.remove(self.filepath)
+        start = time.perf_counter()
+        response = self.client.get(self.url, 
+                                   timeout=self.timeout, 
+                                   stream=True,
+                                   allow_redirects=True,
+                                   verify=False,
+                                   headers=headers)
+
+        code = int(response.status_code)
         
+        if code == 304 and is_conditional:
+            logger.info("download url[%s] - not modified" % self.url)
+            raise NotModified(comments="not modified url[%s]" % self.url)
+
+        if code == 304 or code >= 400:
+            msg = "download url[%s] - status_code[%s] - reason[%s]" % (self.url, 
+                                                                       code, 
+                                                                       response.reason)
+            if raise_errors:
+                logger.error(msg)
+                raise response.raise_for_status()
+            else:
+                logger.warning(msg)
+                return response
+
+        length = response.headers.get("Content-Length")
+        length = int(length) if length and length.isdigit() else None
+        
+        size = 0
+        transfer_start = time.perf_counter()
+        tmp_filepath = self.filepath + ".part"
+        with open(tmp_filepath, mode='wb', buffering=self.chunk_size) as f:
+            if length and self.preallocate:
+                preallocate(f, length)
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+            if length and self.preallocate:
+                '''The decoded content can be smaller than Content-Length'''
+                f.truncate(size)
+        stages.add("download", time.perf_counter() - transfer_start, bytes=size)
+        
+        if self.check_length and length is not None:
+            '''Bytes read from the connection, before decoding'''
+            received = response.raw.tell() if hasattr(response.raw, "tell") else size
+            if received != length:
+                os.remove(tmp_filepath)
+                msg = "incomplete download url[%s] - received[%s] - content-length[%s]"
+                raise IncompleteDownload(msg % (self.url, received, length), 
+                                         response=response)
+        
+        os.replace(tmp_filepath, self.filepath)
+
+        if self.conditional:
+            http_validators.add_pending(self.url, response.headers)
+
+        self.metrics = download_stats.add(self.url, size, time.perf_counter() - start)
+        logger.info("download file[%s] - END - bytes[%s] - time[%.3f seconds] - throughput[%s bytes/s]" % (self.url, 
+                                                                                                          size, 
+                                                                                                          self.metrics["seconds"], 
+                                                                                                          self.metrics["throughput"]))
+
+        return response
+
+    def _use_local_file(self):
+        '''The file is replaced only after a complete download'''
         if not os.path.exists(self.filepath):
-            logger.warning("not found file[%s] - download dataset url[%s]" % (self.filepath, self.url))
+            return False
+        return self.use_existing_file or not self.force_replace
+
+    def get_filepath(self):
+        
+        if not self._use_local_file():
+            logger.warning("download dataset url[%s] - file[%s]" % (self.url, self.filepath))
             self._download()
         else:
             logger.warning("use local dataset file [%s]" % self.filepath)
@@ -146,11 +667,8 @@ class Downloader:
         
         response = None
         
-        if os.path.exists(self.filepath) and not self.use_existing_file and self.force_replace:
-            os.remove(self.filepath)
-        
-        if not os.path.exists(self.filepath):
-            logger.warning("not found file[%s] - download dataset url[%s]" % (self.filepath, self.url))
+        if not self._use_local_file():
+            logger.warning("download dataset url[%s] - file[%s]" % (self.url, self.filepath))
             response = self._download(raise_errors=False)
         else:
             logger.warning("use local dataset file [%s]" % self.filepath)
@@ -292,29 +810,6 @@ def get_datetime_from_period(date_str, freq=None):
         #else:
         #    month = int(month_str)
             
-    elif freq == "W":
-        year = int(get_year(date_str))
-        """
-        W-WED
-        W-MON
-        W-FRI
-        W-THU
-        1998-W53
-        2010-06-16
-        >>> datetime(2016,12,31).strftime("%Y-%m-%d %W")
-        '2016-12-31 52'
-        
-        >>> pd.Period("2016-01-27", freq="W-WED").to_timestamp()
-        Timestamp('2016-01-21 00:00:00')
-        >>> pd.Period("2016-01-27", freq="W-WED").ordinal
-        2404
-        
-        >>> pd.Period("2016-01-27", freq="W-MON").to_timestamp()
-        Timestamp('2016-01-26 00:00:00')
-        >>> pd.Period("2016-01-27", freq="W-MON").ordinal
-        2405                        
-        """
-        raise NotImplementedError("freq not implemented freq[%s] date[%s]" % (freq, date_str))
     elif freq == "S":
         """
         ECB:
@@ -328,11 +823,15 @@ def get_datetime_from_period(date_str, freq=None):
             month = 7
         else:
             raise NotImplementedError("freq not implemented freq[%s] date[%s]" % (freq, date_str))
-    elif freq == "B":
+    elif periods.is_supported(freq):
         """
-        Bimestre: période de 2 mois
+        Start of the business day or of the week with this date:
+        
+        >>> pd.Period("2016-01-27", freq="W-WED").to_timestamp()
+        Timestamp('2016-01-21 00:00:00')
         """
-        raise NotImplementedError("freq not implemented freq[%s] date[%s]" % (freq, date_str))
+        ordinal = periods.period_to_ordinal(date_str, freq)
+        return periods.ordinal_to_datetime(ordinal, freq)
     else:
         raise NotImplementedError("freq not implemented freq[%s] date[%s]" % (freq, date_str))
         
@@ -352,10 +851,18 @@ def get_ordinal_from_period(date_str, freq=None):
     { "_id" : "W-MON", "count" : 77 }
     { "_id" : "W-FRI", "count" : 60 }
     { "_id" : "W-THU", "count" : 2 }    
+    
+    Computed by :mod:`dlstats.periods` for its frequencies, with 
+    pandas.Period (and the cache for constants.CACHE_FREQUENCY) otherwise.
     """
     
+    if freq == "A":
+        return int(get_year(date_str)) - 1970
+
+    if periods.is_supported(freq):
+        return periods.period_to_ordinal(date_str, freq)
+
     from dlstats.cache import cache
-    from dlstats import constants
     from pandas import Period
         
     key = "ordinal.%s.%s" % (date_str, freq)
@@ -365,66 +872,52 @@ def get_ordinal_from_period(date_str, freq=None):
         if not period_from_cache is None:
             return period_from_cache
     
-    period_ordinal = None
-    if freq == "A":
-        year = int(get_year(date_str))
-        period_ordinal = year - 1970
-    elif freq == "S":
-        year = int(get_year(date_str))
-        if date_str.endswith("S1"):
-            date_str = '%s-01' % year
-        elif date_str.endswith("S2"):
-            date_str = '%s-07' % year
-        else:
-            raise NotImplementedError("freq not implemented freq[%s] date[%s]" % (freq, date_str))
-    """
-    elif freq == "M":
-        year = int(get_year(date_str))
-        month = int(get_month(date_str))
-        period_ordinal = ((year - 1970) * 12) * month
-    """
-    """
-     ("1970", "A", 0),
-     ("1969", "A", -1),
-     ("1971", "A", 1),
-
-     ("1970-01", "M", 0),
-     ("197001", "M", 0),
-     ("1970-02", "M", 1),
-     ("1969-12", "M", -1),
-     ("1969-01", "M", -12),
-     ("1971-01", "M", 12),
-     ("1970-07", "M", 6),
-     ("1971-07", "M", 18),
-     ("1969-07", "M", -6),
-     
-    """
-
-    if not period_ordinal:
-        period_ordinal = Period(date_str, freq=freq).ordinal
+    period_ordinal = Period(date_str, freq=freq).ordinal
     
     if cache and freq in constants.CACHE_FREQUENCY:
         cache.set(key, period_ordinal)
     
     return period_ordinal
 
-@timeit("commons.slugify", stats_only=True)
+def _slugify_key_value(value):
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _slugify_key_value(v)) for k, v in value.items()]))
+    if isinstance(value, (list, tuple, set)):
+        return tuple([_slugify_key_value(v) for v in value])
+    return value
+
 def slugify(text, **kwargs):
+    """Cached version of slugify.slugify
+
+    The key of :data:`slugify_cache` is the text and the kwargs (lists and 
+    dicts are converted to tuples). If the cache of dlstats.cache is a 
+    Redis cache, it is used as second tier.
     
+    The cache is skipped if the key is not hashable.
+    """
+    key = (text, tuple(sorted([(k, _slugify_key_value(v)) for k, v in kwargs.items()])))
+    try:
+        hash(key)
+    except TypeError:
+        return original_slugify(text, **kwargs)
+
+    slug = slugify_cache.get(key)
+    if slug is not None:
+        return slug
+
     from dlstats.cache import cache
 
-    key = "slugify.%s" % text
+    shared_key = None
+    if cache and cache.is_shared:
+        shared_key = "slugify.%s.%s" % (",".join(["%s=%s" % kv for kv in key[1]]), text)
+        slug = cache.get(shared_key)
 
-    if cache:
-        slug_from_cache = cache.get(key)
-        if slug_from_cache:
-            return slug_from_cache
-    
-    slug = original_slugify(text, **kwargs)
+    if slug is None:
+        slug = original_slugify(text, **kwargs)
+        if shared_key:
+            cache.set(shared_key, slug)
 
-    if cache:
-        cache.set(key, slug)
-        
+    slugify_cache.set(key, slug)
     return slug
 
 def clean_key(key):
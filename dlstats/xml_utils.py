@@ -2,7 +2,7 @@
 
 import hashlib
 import logging
-from collections import OrderedDict, deque
+from collections import OrderedDict
 from datetime import datetime
 import re
 
@@ -11,6 +11,7 @@ from lxml import etree
 from widukind_common import errors
 from widukind_common.debug import timeit
 
+from dlstats.observations import Observations
 from dlstats.utils import Downloader, clean_datetime, get_ordinal_from_period, get_datetime_from_period
 
 logger = logging.getLogger(__name__)
@@ -177,10 +178,12 @@ class XMLSDMX:
         self.structure_headers = structure_headers
         self.store_filepath = store_filepath
         self.use_existing_file = use_existing_file
+        self.client = client
 
     def query_rest(self, url, **kwargs):
         logger.info('Requesting %s', url)
         filename = "%s.xml" % hashlib.sha224(url.encode("utf-8")).hexdigest()
+        kwargs.setdefault("client", self.client)
         download = Downloader(url, filename=filename,
                               store_filepath=self.store_filepath,
                               use_existing_file=self.use_existing_file, 
@@ -1136,29 +1139,26 @@ class XMLDataMixIn:
         </data:Series>
         
         """
-        observations = deque()
+        observations = Observations(empty={})
         for obs in series.iterchildren():
 
-            item = {"period": None, "value": None, "attributes": {}}
-        
             localname = etree.QName(obs.tag).localname
                 
             #if obs.tag == self.fixtag(self.ns_tag_data, 'Obs'):
             if localname == "Obs":
-                item["period"] = obs.attrib["TIME_PERIOD"]
-
-                #TODO: value manquante
-                item["value"] = obs.attrib.get("OBS_VALUE", "")
-                
+                attributes = {}
                 for key, value in obs.attrib.items():
                     if not key in ['TIME_PERIOD', 'OBS_VALUE']:
-                        item["attributes"][key] = value
+                        attributes[key] = value
                 
-                observations.append(item)
+                #TODO: value manquante
+                observations.append(obs.attrib["TIME_PERIOD"],
+                                    obs.attrib.get("OBS_VALUE", ""),
+                                    attributes)
             
                 obs.clear()
 
-        return list(observations)
+        return observations
     
     def build_series(self, series):
         dimensions = self.get_dimensions(series)
@@ -1333,11 +1333,9 @@ class XMLCompactData_2_0_IMF(XMLCompactData_2_0):
         </Series>
         
         """
-        observations = deque()
+        observations = Observations(empty={})
         for obs in series.iterchildren():
 
-            item = {"period": None, "value": None, "attributes": {}}
-        
             localname = etree.QName(obs.tag).localname
                 
             if localname == "Obs":
@@ -1346,20 +1344,18 @@ class XMLCompactData_2_0_IMF(XMLCompactData_2_0):
                 if frequency == "Q" and len(period.split("-")) == 2:
                     period = period.replace("-0", "-Q")
                 
-                item["period"] = period
-                
-                #TODO: value manquante
-                item["value"] = obs.attrib.get("VALUE", "")
-                
+                attributes = {}
                 for key, value in obs.attrib.items():
                     if not key in ['TIME_PERIOD', 'VALUE']:
-                        item["attributes"][key] = value
+                        attributes[key] = value
                 
-                observations.append(item)
+                #TODO: value manquante
+                observations.append(period, obs.attrib.get("VALUE", ""), 
+                                    attributes)
             
                 obs.clear()
 
-        return list(observations)
+        return observations
     
     
     
@@ -1415,20 +1411,22 @@ class XMLGenericData_2_0(XMLDataBase):
     
     def get_observations(self, series, frequency):
         
-        observations = deque()
+        observations = Observations(empty={})
         
         for element in series.xpath("./*[local-name()='Obs']"):
 
-            item = {"period": None, "value": None, "attributes": {}}
+            period = None
+            obs_value = None
+            attributes = {}
             
             for child in element.getchildren():
                 
                 if etree.QName(child.tag).localname == "Time":
-                    item["period"] = child.text
+                    period = child.text
                 
                 elif etree.QName(child.tag).localname == 'ObsValue':
                     #TODO: valeur manquante
-                    item["value"] = child.attrib["value"]
+                    obs_value = child.attrib["value"]
                 
                 #TODO:
                 elif etree.QName(child.tag).localname == 'Attributes':
@@ -1436,15 +1434,14 @@ class XMLGenericData_2_0(XMLDataBase):
                     <Attributes><Value concept="OBS_STATUS" value="M"/></Attributes>                    
                     AUS.LCEATT02.ST.Q                
                     """ 
-                    for key, value in self._get_values(child).items():
-                        item["attributes"][key] = value
+                    attributes.update(self._get_values(child))
                 
                 child.clear()
             
-            observations.append(item)
+            observations.append(period, obs_value, attributes)
             element.clear()
             
-        return list(observations)
+        return observations
 
     def get_dimensions(self, series):
         _dimensions = series.xpath("./*[local-name()='SeriesKey']")[0]
@@ -1514,31 +1511,32 @@ class XMLGenericData_2_1(XMLDataBase):
     
     def get_observations(self, series, frequency):
         
-        observations = deque()
+        observations = Observations(empty={})
         
         for element in series.xpath("child::%s:Obs" % self.ns_tag_data, 
                                     namespaces=self.nsmap):
 
-            item = {"period": None, "value": None, "attributes": {}}
+            period = None
+            obs_value = None
+            attributes = {}
             for child in element.getchildren():
                 
                 if child.tag == self.fixtag(self.ns_tag_data, 'ObsDimension'):
-                    item["period"] = child.attrib["value"]
+                    period = child.attrib["value"]
                 
                 elif child.tag == self.fixtag(self.ns_tag_data, 'ObsValue'):
                     #TODO: valeur manquante
-                    item["value"] = child.attrib["value"]
+                    obs_value = child.attrib["value"]
                 
                 elif child.tag == self.fixtag(self.ns_tag_data, 'Attributes'):
-                    for key, value in self._get_values(child).items():
-                        item["attributes"][key] = value
+                    attributes.update(self._get_values(child))
                 
                 child.clear()
             
-            observations.append(item)
+            observations.append(period, obs_value, attributes)
             element.clear()
             
-        return list(observations)
+        return observations
 
     def get_dimensions(self, series):
         _dimensions = series.xpath("child::%s:SeriesKey" % self.ns_tag_data, 
@@ -1703,24 +1701,22 @@ class XMLSpecificData_2_1(XMLDataBase):
     @timeit("xml_utils.XMLSpecificData_2_1.get_observations", stats_only=True)
     def get_observations(self, series, frequency):
         
-        observations = deque()
+        observations = Observations(empty={})
 
         for observation in series.iterchildren():
 
-            item = {"period": None, "value": None, "attributes": {}}
-            
-            item["period"] = observation.attrib[self.field_obs_time_period]
-            item["value"] = observation.attrib[self.field_obs_value]
-            
+            attributes = {}
             for key, value in observation.attrib.items():
                 if not key in [self.field_obs_time_period, self.field_obs_value]:
-                    item["attributes"][key] = value
+                    attributes[key] = value
             
-            observation.clear()
+            observations.append(observation.attrib[self.field_obs_time_period],
+                                observation.attrib[self.field_obs_value],
+                                attributes)
             
-            observations.append(item)
+            observation.clear()
             
-        return list(observations)
+        return observations
     
     @timeit("xml_utils.XMLSpecificData_2_1.build_series", stats_only=True)
     def build_series(self, series):